@@ -0,0 +1,407 @@
+"""
+Benchmarks for the artcore pipeline stages.
+
+Generates synthetic images (gradient, noise, transparent regions) at several
+resolutions, runs LineArtGenerator.convert and PixelizeConverter.convert for
+several cols/rows settings, and records the time (from their ConversionStats,
+without tracing) and peak traced memory (from a second, traced conversion) of
+each stage as JSON.
+
+    python benchmarks/bench_artcore.py -o bench.json
+    python benchmarks/bench_artcore.py -o new.json --baseline bench.json
+
+Micro-benchmarks time single calls of ImageData.get_intersecting_cells and
+create_best_fit_line (batched and scalar) on --micro-grids. The seconds of
+--micro-calls calls are recorded as results with a "calls" stage.
+
+With --baseline the run fails (exit code 1) when a stage is slower than the
+baseline by more than --tolerance (and by more than --min-seconds).
+
+--import-budget SECONDS also fails the run when one of the ImportChecks takes
+longer in a fresh interpreter or loads one of the HeavyModules:
+
+    python benchmarks/bench_artcore.py --sizes 256 --grids 16 --import-budget 0.3
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import pathlib
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1] / "src"))
+
+from ezdigitalart.artcore import LineArtGenerator, PixelizeConverter
+
+
+def make_gradient(size):
+    width, height = size
+    y, x = np.mgrid[0:height, 0:width]
+    r = x * 255 // max(width - 1, 1)
+    g = y * 255 // max(height - 1, 1)
+    b = 255 - (r + g) // 2
+    return Image.fromarray(np.dstack([r, g, b]).astype(np.uint8), "RGB")
+
+
+def make_noise(size, seed=0):
+    width, height = size
+    rng = np.random.default_rng(seed)
+    pixels = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    return Image.fromarray(pixels, "RGB")
+
+
+def make_transparent(size):
+    width, height = size
+    pixels = np.asarray(make_gradient(size).convert("RGBA")).copy()
+    y, x = np.mgrid[0:height, 0:width]
+    hole = np.hypot(x - width / 2, y - height / 2) < min(width, height) / 4
+    pixels[hole, 3] = 0
+    pixels[: height // 8, :, 3] = 0
+    return Image.fromarray(pixels, "RGBA")
+
+
+# statements that must stay fast for short-lived workers and the CLI --help
+ImportChecks = (
+    "import ezdigitalart.artcore",
+    "import ezdigitalart.cli",
+    "from ezdigitalart.artcore import ImageData",
+    "from ezdigitalart.artcore import LineArtGenerator, PixelizeConverter",
+)
+
+# backends only needed by the export paths that use them
+HeavyModules = ("svgwrite", "svglib", "reportlab")
+
+ImportProbe = """
+import json, sys, time
+start = time.perf_counter()
+exec(sys.argv[1])
+seconds = time.perf_counter() - start
+heavy = sorted(name for name in sys.modules if name.split(".")[0] in sys.argv[2:])
+print(json.dumps({"seconds": seconds, "heavy_modules": heavy}))
+"""
+
+Generators = {
+    "gradient": make_gradient,
+    "noise": make_noise,
+    "transparent": make_transparent,
+}
+
+
+class MemoryTracer:
+    """
+    stats_callback recording the peak traced memory of every stage.
+
+    The peak is reset whenever a stage finishes, so it covers the stage and
+    whatever ran between it and the previous one. Convergence iterations
+    don't reset it, their stage gets the peak of all of them.
+    """
+
+    def __init__(self) -> None:
+        self.peaks = {}
+        self.start = 0
+
+    def reset(self):
+        tracemalloc.reset_peak()
+        self.start = tracemalloc.get_traced_memory()[0]
+
+    def __call__(self, name, seconds):
+        if name.startswith("iteration "):
+            return
+        peak = tracemalloc.get_traced_memory()[1] - self.start
+        self.peaks[name] = max(self.peaks.get(name, 0), peak)
+        self.reset()
+
+
+def create_converter(converter_class, cols, rows, work_dir):
+    converter = converter_class()
+    converter.cols = cols
+    converter.rows = rows
+    converter.export_png_path = work_dir / "output.png"
+    return converter
+
+
+def bench_converter(converter_class, path, cols, rows, work_dir):
+    """
+    Run converter_class().convert and return its stage timings, counters and
+    peak memory. Time and memory come from separate conversions, tracemalloc
+    slows the converters down several times over.
+    """
+    converter = create_converter(converter_class, cols, rows, work_dir)
+    converter.collect_stats = True
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        stats = converter.convert(path, work_dir / "output.svg")
+        total = time.perf_counter() - start
+    stages = {name: {"seconds": seconds} for name, seconds in stats.stages.items()}
+    stages["total"] = {"seconds": total}
+
+    tracer = MemoryTracer()
+    converter = create_converter(converter_class, cols, rows, work_dir)
+    converter.stats_callback = tracer
+    tracemalloc.start()
+    try:
+        tracer.reset()
+        with contextlib.redirect_stdout(io.StringIO()):
+            converter.convert(path, work_dir / "output.svg")
+    finally:
+        tracemalloc.stop()
+    for name, entry in stages.items():
+        entry["peak_bytes"] = tracer.peaks.get(name, 0)
+    stages["total"]["peak_bytes"] = max(tracer.peaks.values(), default=0)
+    return stages, dict(stats.counters)
+
+
+def bench_line_art(path, cols, rows, work_dir):
+    return bench_converter(LineArtGenerator, path, cols, rows, work_dir)
+
+
+def bench_pixelize(path, cols, rows, work_dir):
+    return bench_converter(PixelizeConverter, path, cols, rows, work_dir)
+
+
+def run(sizes, grids, kinds, repeat):
+    results = []
+    with tempfile.TemporaryDirectory() as work:
+        work_dir = pathlib.Path(work)
+        for kind in kinds:
+            for size in sizes:
+                path = work_dir / f"{kind}_{size}.png"
+                Generators[kind]((size, size)).save(path)
+                for grid in grids:
+                    for name, bench in (
+                        ("lineart", bench_line_art),
+                        ("pixelize", bench_pixelize),
+                    ):
+                        best = None
+                        for _ in range(repeat):
+                            stages, counters = bench(path, grid, grid, work_dir)
+                            if (
+                                best is None
+                                or stages["total"]["seconds"]
+                                < best[0]["total"]["seconds"]
+                            ):
+                                best = (stages, counters)
+                        key = f"{name}/{kind}/{size}px/{grid}x{grid}"
+                        print(f"{key:40s} {best[0]['total']['seconds']:8.3f} s")
+                        results.append(
+                            {
+                                "key": key,
+                                "converter": name,
+                                "image": kind,
+                                "size": size,
+                                "grid": grid,
+                                "stages": best[0],
+                                "counters": best[1],
+                            }
+                        )
+    return results
+
+
+def create_micro_image_data(grid):
+    """ImageData of a noise image prepared for a grid x grid LineArtGenerator."""
+    generator = LineArtGenerator()
+    generator.cols = grid
+    generator.rows = grid
+    image_data = generator.create_image_data()
+    with contextlib.redirect_stdout(io.StringIO()):
+        generator.prepare(image_data, make_noise((grid * 16, grid * 16)))
+    return image_data
+
+
+def bench_micro(grid, calls):
+    """
+    Seconds for calls calls of the per-line and per-cell hot spots, on the same
+    random lines and cells for both implementations of each. Every scoring
+    call starts from a state without lines.
+    """
+    image_data = create_micro_image_data(grid)
+    cells = image_data.cells
+    rng = np.random.default_rng(0)
+    pairs = image_data.endpoint_combinations
+    segments = []
+    for line_index in rng.integers(0, len(pairs), calls).tolist():
+        p1, p2 = pairs[line_index]
+        segments.append((p1.location, p2.location))
+    entries = [image_data.items[i] for i in rng.integers(0, cells.count, calls)]
+
+    timings = {}
+    for name, vectorized in (
+        ("get_intersecting_cells", True),
+        ("get_intersecting_cells_scalar", False),
+    ):
+        image_data.vectorized_collisions = vectorized
+        start = time.perf_counter()
+        for line_start, line_end in segments:
+            image_data.get_intersecting_cells(line_start, line_end)
+        timings[name] = time.perf_counter() - start
+
+    passes = cells.passes.copy()
+    last_index = cells.last_index.copy()
+    for name, batch_scoring in (
+        ("create_best_fit_line_batched", True),
+        ("create_best_fit_line", False),
+    ):
+        image_data.batch_scoring = batch_scoring
+        seconds = 0.0
+        for entry in entries:
+            cells.passes[:] = passes
+            cells.last_index[:] = last_index
+            image_data.line_used[:] = False
+            image_data.lines = []
+            image_data.line_lookup = dict()
+            start = time.perf_counter()
+            image_data.create_best_fit_line(entry)
+            seconds += time.perf_counter() - start
+        timings[name] = seconds
+    return timings
+
+
+def run_micro(grids, calls):
+    """bench_micro for every grid, as results compare can check."""
+    results = []
+    for grid in grids:
+        for name, seconds in bench_micro(grid, calls).items():
+            key = f"micro/{name}/{grid}x{grid}"
+            print(f"{key:40s} {seconds:8.3f} s for {calls} calls")
+            results.append(
+                {
+                    "key": key,
+                    "grid": grid,
+                    "calls": calls,
+                    "stages": {"calls": {"seconds": seconds}},
+                }
+            )
+    return results
+
+
+def measure_imports(repeat):
+    """Time every ImportChecks statement in a fresh interpreter, best of repeat."""
+    source_dir = str(pathlib.Path(__file__).resolve().parents[1] / "src")
+    results = []
+    for statement in ImportChecks:
+        best = None
+        for _ in range(repeat):
+            output = subprocess.run(
+                [sys.executable, "-c", ImportProbe, statement, *HeavyModules],
+                check=True,
+                capture_output=True,
+                text=True,
+                cwd=source_dir,
+            ).stdout
+            entry = json.loads(output)
+            if best is None or entry["seconds"] < best["seconds"]:
+                best = entry
+        print(f"{statement:70s} {best['seconds']:8.3f} s")
+        results.append({"statement": statement, **best})
+    return results
+
+
+def check_imports(imports, budget):
+    """Return a list of import checks over the budget or loading heavy modules."""
+    failures = []
+    for entry in imports:
+        if entry["seconds"] > budget:
+            failures.append(
+                f"{entry['statement']}: {entry['seconds']:.3f} s > {budget:.3f} s"
+            )
+        if entry["heavy_modules"]:
+            failures.append(
+                f"{entry['statement']}: loads {', '.join(entry['heavy_modules'])}"
+            )
+    return failures
+
+
+def compare(results, baseline, tolerance, min_seconds):
+    """Return a list of stages slower than the baseline beyond the tolerance."""
+    previous = {entry["key"]: entry for entry in baseline["results"]}
+    regressions = []
+    for entry in results:
+        old = previous.get(entry["key"])
+        if old is None:
+            continue
+        for stage, values in entry["stages"].items():
+            old_values = old["stages"].get(stage)
+            if old_values is None:
+                continue
+            old_seconds = old_values["seconds"]
+            seconds = values["seconds"]
+            if (
+                seconds > old_seconds * (1.0 + tolerance)
+                and seconds - old_seconds > min_seconds
+            ):
+                regressions.append(
+                    f"{entry['key']} {stage}: {old_seconds:.3f} s -> {seconds:.3f} s"
+                )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-o", "--output", type=pathlib.Path, help="JSON results")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[256, 1024])
+    parser.add_argument("--grids", type=int, nargs="+", default=[16, 32])
+    parser.add_argument(
+        "--images", nargs="+", choices=Generators, default=list(Generators)
+    )
+    parser.add_argument("--repeat", type=int, default=1, help="keep the best of N")
+    parser.add_argument("--baseline", type=pathlib.Path, help="JSON to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--min-seconds", type=float, default=0.05)
+    parser.add_argument(
+        "--import-budget", type=float, help="maximum seconds per import check"
+    )
+    parser.add_argument(
+        "--micro-grids",
+        type=int,
+        nargs="*",
+        default=[16, 32],
+        help="grids of the micro-benchmarks (none to skip them)",
+    )
+    parser.add_argument("--micro-calls", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    imports = measure_imports(max(args.repeat, 1))
+    results = run(args.sizes, args.grids, args.images, max(args.repeat, 1))
+    results += run_micro(args.micro_grids, args.micro_calls)
+    report = {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "imports": imports,
+        "results": results,
+    }
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+
+    failures = []
+    if args.import_budget is not None:
+        failures = check_imports(imports, args.import_budget)
+        for failure in failures:
+            print(f"import check failed: {failure}")
+
+    if args.baseline:
+        regressions = compare(
+            results,
+            json.loads(args.baseline.read_text()),
+            args.tolerance,
+            args.min_seconds,
+        )
+        for regression in regressions:
+            print(f"regression: {regression}")
+        if regressions:
+            return 1
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
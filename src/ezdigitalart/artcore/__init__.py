@@ -1,6 +1,38 @@
-from .pixelize_converter import PixelizeConverter
-from .image_cell import ImageCell
-from .image_data import ImageData
-from .line_art_generator import LineArtGenerator
-from .image_point import ImagePoint
-from .string_line import StringLine
+import importlib
+
+# public names and their modules, imported on first access so that using
+# one class (or just the CLI --help) doesn't load every backend
+LazyExports = {
+    "PixelizeConverter": ".pixelize_converter",
+    "ImageCell": ".image_cell",
+    "ImageData": ".image_data",
+    "LineArtGenerator": ".line_art_generator",
+    "ImagePoint": ".image_point",
+    "StringLine": ".string_line",
+    "ConversionStats": ".conversion_stats",
+    "ConversionCancelled": ".cancellation",
+}
+
+# converter names the CLI and the service accept, and their classes
+Converters = {
+    "lineart": "LineArtGenerator",
+    "pixelize": "PixelizeConverter",
+}
+
+__all__ = list(LazyExports) + ["Converters", "create_converter"]
+
+
+def create_converter(converter_name):
+    return __getattr__(Converters[converter_name])()
+
+
+def __getattr__(name):
+    if name not in LazyExports:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(LazyExports[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(LazyExports))
@@ -0,0 +1,95 @@
+import time
+
+
+class AnytimeLimits:
+    """
+    Budget and snapshots of an anytime convergence loop.
+
+    The loops poll before every cell and stop cleanly once time_budget seconds
+    passed since start_clock (or since the limits were created) or max_lines
+    lines exist, keeping the lines found so far. The time budget never stops
+    a loop before it accepted its first lines. One cell can add several
+    lines, so the ones past max_lines are dropped again.
+
+    callback is called as callback(image_data, number) for every snapshot of
+    the lines so far: after each iteration of the loop, with
+    snapshot_interval whenever that many seconds passed since the last one
+    and with snapshot_lines whenever that many lines were added since.
+    """
+
+    def __init__(
+        self,
+        time_budget=None,
+        max_lines=None,
+        callback=None,
+        snapshot_interval=None,
+        snapshot_lines=None,
+    ) -> None:
+        self.time_budget = time_budget
+        self.max_lines = max_lines
+        self.callback = callback
+        self.snapshot_interval = snapshot_interval
+        self.snapshot_lines = snapshot_lines
+        self.start = time.perf_counter()
+        self.start_lines = 0
+        self.last_snapshot = self.start
+        self.last_snapshot_lines = 0
+        self.snapshot_count = 0
+        self.exhausted = False
+        # "max_lines" or "time_budget" once exhausted
+        self.reason = None
+
+    def start_clock(self, image_data):
+        """Start the time budget and snapshot schedule at the lines image_data has."""
+        self.start = time.perf_counter()
+        self.start_lines = len(image_data.lines)
+        self.last_snapshot = self.start
+        self.last_snapshot_lines = self.start_lines
+
+    def poll(self, image_data):
+        """Take a snapshot when one is due and return whether the budget is used up."""
+        now = time.perf_counter()
+        line_count = len(image_data.lines)
+        if (
+            self.snapshot_interval is not None
+            and now - self.last_snapshot >= self.snapshot_interval
+        ) or (
+            self.snapshot_lines is not None
+            and line_count - self.last_snapshot_lines >= self.snapshot_lines
+        ):
+            self.snapshot(image_data)
+
+        if not self.exhausted:
+            if self.max_lines is not None and line_count >= self.max_lines:
+                self.exhausted = True
+                self.reason = "max_lines"
+            elif (
+                self.time_budget is not None
+                and now - self.start >= self.time_budget
+                and line_count > self.start_lines
+            ):
+                self.exhausted = True
+                self.reason = "time_budget"
+        return self.exhausted
+
+    def report(self, stats):
+        """Record in stats (a ConversionStats or None) why the loop stopped early."""
+        if stats is not None and self.exhausted:
+            stats.stopped_early = self.reason
+
+    def snapshot(self, image_data):
+        self.trim(image_data)
+        if self.callback is not None:
+            self.snapshot_count += 1
+            self.callback(image_data, self.snapshot_count)
+        # the interval runs from the end of the (possibly slow) callback
+        self.last_snapshot = time.perf_counter()
+        self.last_snapshot_lines = len(image_data.lines)
+
+    def trim(self, image_data):
+        """Remove the lines past max_lines, with the passes they added."""
+        if self.max_lines is None or len(image_data.lines) <= self.max_lines:
+            return
+        image_data.remove_lines(
+            [line.line_index for line in image_data.lines[self.max_lines :]]
+        )
@@ -0,0 +1,8 @@
+class ConversionCancelled(Exception):
+    """Raised inside a conversion when its should_stop callback returns True."""
+
+
+def check_stop(should_stop):
+    """Raise ConversionCancelled when the optional should_stop callback asks to."""
+    if should_stop is not None and should_stop():
+        raise ConversionCancelled()
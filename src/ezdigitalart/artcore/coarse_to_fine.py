@@ -0,0 +1,228 @@
+import math
+import numpy as np
+from .conversion_stats import ConversionStats
+from .endpoint_pairs import EndpointPairs
+from .image_cell import ImageCell
+from .image_data import ImageData, WhiteThreshold
+
+
+def get_coarse_data(image_data, factor):
+    """
+    ImageData of the cells of image_data averaged over factor x factor blocks
+    (root mean square, like the cells sample their pixels), with endpoints
+    every factor cells along the border.
+
+    Every coarse length is factor times the fine one, so a coarse endpoint
+    (x, y) lies on the fine endpoint (x * factor, y * factor), clamped to the
+    fine border.
+    """
+    cells = image_data.cells
+    count = cells.count
+    opaque = ~cells.is_transparent[:count]
+    block = cells.cell_indices[:count] // factor
+    columns = int(block[:, 0].max()) + 1
+    rows = int(block[:, 1].max()) + 1
+    block_index = block[:, 0] * rows + block[:, 1]
+
+    # average the opaque cells of every block, blocks without any stay transparent
+    weights = np.bincount(block_index[opaque], minlength=columns * rows)
+    present = np.bincount(block_index, minlength=columns * rows) > 0
+    colors = np.zeros((columns * rows, 3))
+    for channel in range(3):
+        values = cells.ci[:count, channel][opaque]
+        colors[:, channel] = np.bincount(
+            block_index[opaque], values * values, minlength=columns * rows
+        )
+    colors = np.sqrt(colors / np.maximum(weights, 1)[:, np.newaxis])
+    alpha_aware = bool((cells.ci_length[:count] > 3).any())
+
+    size = int(cells.size[0, 0]) * factor
+    coarse_cells = []
+    for position in np.nonzero(present)[0].tolist():
+        x, y = divmod(position, rows)
+        if weights[position] == 0:
+            ci = (0, 0, 0, 0)
+        else:
+            ci = tuple(colors[position].tolist()) + ((255,) if alpha_aware else ())
+        coarse_cells.append((x, y, ci, (x * size, y * size), (size, size)))
+
+    coarse_data = ImageData()
+    coarse_data.passes_scaler = image_data.passes_scaler
+    coarse_data.grid_size = image_data.grid_size * factor
+    coarse_data.batch_scoring = image_data.batch_scoring
+    coarse_data.vectorized_collisions = image_data.vectorized_collisions
+    coarse_data.geometry_cache = image_data.geometry_cache
+    coarse_data.add_cells(coarse_cells)
+
+    store = image_data.endpoint_store
+    regions_x = math.ceil(int(store.x_index[: store.count].max()) / factor)
+    regions_y = math.ceil(int(store.y_index[: store.count].max()) / factor)
+    for x in range(regions_x + 1):
+        for y in range(regions_y + 1):
+            edges = (x == 0, x >= regions_x, y == 0, y >= regions_y)
+            if any(edges):
+                coarse_data.add_endpoint(x, y, (x * size, y * size), *edges)
+    return coarse_data
+
+
+def get_endpoint_windows(image_data, coarse_data, factor, radius):
+    """
+    For every coarse endpoint, the fine endpoints at most radius cells from the
+    one it lies on.
+    """
+    store = image_data.endpoint_store
+    x = store.x_index[: store.count]
+    y = store.y_index[: store.count]
+    coarse_store = coarse_data.endpoint_store
+    coarse_x = np.minimum(coarse_store.x_index[: coarse_store.count] * factor, x.max())
+    coarse_y = np.minimum(coarse_store.y_index[: coarse_store.count] * factor, y.max())
+    near = (np.abs(x - coarse_x[:, np.newaxis]) <= radius) & (
+        np.abs(y - coarse_y[:, np.newaxis]) <= radius
+    )
+    return [np.nonzero(row)[0] for row in near]
+
+
+def get_refined_ranks(image_data, coarse_data, factor, radius):
+    """
+    Ranks of the fine candidate lines: every pair of endpoints within radius of
+    the ends of an accepted coarse line, and the unused coarse lines through
+    coarse cells that are still missing passes.
+    """
+    coarse_pairs = coarse_data.endpoint_combinations
+    windows = get_endpoint_windows(image_data, coarse_data, factor, radius)
+    exact = get_endpoint_windows(image_data, coarse_data, factor, 0)
+
+    accepted = np.array([line.line_index for line in coarse_data.lines], np.int64)
+
+    cells = coarse_data.cells
+    deficit = cells.desired_passes[: cells.count] - cells.passes[: cells.count]
+    under_served = np.nonzero(
+        (deficit > 0) & (cells.lab[: cells.count, 0] < WhiteThreshold)
+    )[0]
+    through = [coarse_data.get_cell_lines(index) for index in under_served.tolist()]
+    through = np.unique(np.concatenate(through)) if through else accepted[:0]
+    through = through[~coarse_data.line_used[through]]
+
+    first = []
+    second = []
+    for lines, ends in ((accepted, windows), (through, exact)):
+        if len(lines) == 0:
+            continue
+        for a, b in zip(
+            *[part.tolist() for part in coarse_pairs.get_pair_indices(lines)]
+        ):
+            pair = np.meshgrid(ends[a], ends[b], indexing="ij")
+            first.append(pair[0].ravel())
+            second.append(pair[1].ravel())
+    if not first:
+        return np.zeros(0, dtype=np.int64)
+
+    first = np.concatenate(first)
+    second = np.concatenate(second)
+    pairs = EndpointPairs(image_data.endpoints)
+    ranks = pairs.get_pair_ranks(first, second)
+    if image_data.min_line_length > 0:
+        location = image_data.endpoint_store.location
+        delta = (location[second] - location[first]).astype(np.float64)
+        ranks[np.hypot(delta[:, 0], delta[:, 1]) < image_data.min_line_length] = -1
+    return np.unique(ranks[ranks >= 0])
+
+
+def seed_coarse_lines(image_data, coarse_data, factor):
+    """
+    Accept the accepted coarse lines again at full resolution, in order: each
+    maps to the fine line between the fine endpoints its ends lie on, owned
+    by the unsatisfied non-white fine cell it crosses in the block of its
+    coarse cell that is closest in color to that cell. Lines that don't fit the fine cells are skipped. Returns
+    the number of lines accepted.
+    """
+    pairs = image_data.endpoint_combinations
+    if not coarse_data.lines or len(pairs) == 0:
+        return 0
+    coarse_lines = np.array([line.line_index for line in coarse_data.lines], np.int64)
+    coarse_owners = np.array([line.cell_index for line in coarse_data.lines], np.int64)
+    exact = get_endpoint_windows(image_data, coarse_data, factor, 0)
+    first, second = coarse_data.endpoint_combinations.get_pair_indices(coarse_lines)
+    fine_first = np.array([exact[a][0] for a in first.tolist()], np.int64)
+    fine_second = np.array([exact[b][0] for b in second.tolist()], np.int64)
+
+    # fine line indices, -1 where the pair is not a candidate
+    ranks = pairs.get_pair_ranks(fine_first, fine_second)
+    line_indices = np.searchsorted(pairs.ranks, ranks)
+    line_indices = np.minimum(line_indices, len(pairs.ranks) - 1)
+    line_indices[(ranks < 0) | (pairs.ranks[line_indices] != ranks)] = -1
+
+    cells = image_data.cells
+    blocks = cells.cell_indices[: cells.count] // factor
+    coarse_blocks = coarse_data.cells.cell_indices[coarse_owners]
+    coarse_labs = coarse_data.cells.lab[coarse_owners]
+    seeded = 0
+    for line_index, block, lab in zip(
+        line_indices.tolist(), coarse_blocks.tolist(), coarse_labs
+    ):
+        if line_index < 0:
+            continue
+        crossed = image_data.get_line_cells(line_index)
+        owners = crossed[
+            (blocks[crossed] == block).all(axis=1)
+            & (cells.passes[crossed] < cells.desired_passes[crossed])
+            & (cells.lab[crossed, 0] < WhiteThreshold)
+        ]
+        if len(owners) == 0:
+            continue
+        # the fine cell closest in color to the coarse owner
+        d = cells.lab[owners] - lab
+        owner = int(owners[np.argmin((d * d).sum(axis=1))])
+        if image_data.try_accept_line(ImageCell(cells, owner), line_index):
+            seeded += 1
+    return seeded
+
+
+def initialize_coarse_to_fine(image_data, converge, factor=4, radius=None):
+    """
+    initialize_best_fit for a hierarchical line search.
+
+    The lines are first solved with converge on a grid factor times coarser in
+    both directions, with endpoints factor cells apart: about factor ** 3
+    fewer candidate x cell tests than the full set. The candidate lines of
+    image_data are then only the full resolution lines around the accepted
+    coarse lines (ends within radius cells, factor // 2 by default) and the
+    coarse lines through under-served coarse cells. max_candidates and
+    angle_bins don't apply to the refined set. The fine level then starts
+    from the coarse lines mapped to it (see seed_coarse_lines).
+
+    converge is called as converge(coarse_data, stats). With image_data.stats
+    set, the coarse convergence is timed as the coarse_convergence stage (part
+    of the initialize_best_fit one), and
+    the coarse_iterations, coarse_lines, refined_candidates and seeded_lines
+    counters are added.
+    """
+    if radius is None:
+        radius = factor // 2
+    stats = image_data.stats
+    coarse_data = get_coarse_data(image_data, factor)
+    coarse_data.initialize_best_fit()
+    coarse_stats = ConversionStats() if stats is not None else None
+    converge(coarse_data, coarse_stats)
+
+    image_data.endpoint_combinations = EndpointPairs(
+        image_data.endpoints,
+        min_length=image_data.min_line_length,
+        ranks=get_refined_ranks(image_data, coarse_data, factor, radius),
+    )
+    image_data.geometry_path = None
+    image_data.build_intersection_index()
+    seeded = seed_coarse_lines(image_data, coarse_data, factor)
+    if stats is not None:
+        stats.add_stage(
+            "coarse_convergence",
+            sum(iteration["seconds"] for iteration in coarse_stats.iterations),
+        )
+        stats.merge_counters(
+            {
+                "coarse_iterations": len(coarse_stats.iterations),
+                "coarse_lines": len(coarse_data.lines),
+                "refined_candidates": len(image_data.endpoint_combinations),
+                "seeded_lines": seeded,
+            }
+        )
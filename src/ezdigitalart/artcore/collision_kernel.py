@@ -0,0 +1,209 @@
+import numpy as np
+
+# segments per batch in intersect_segments callers, bounds the expanded arrays
+SegmentChunkSize = 1 << 14
+
+
+def check_line_collisions(x1, y1, x2, y2, x3, y3, x4, y4):
+    """
+    Vectorized check_line_collision over broadcast arrays of segments, with
+    the same inclusive 0 <= u_a, u_b <= 1 test and the same float math.
+    """
+    denominator = (y4 - y3) * (x2 - x1) - (x4 - x3) * (y2 - y1)
+    valid = denominator != 0
+    denominator = np.where(valid, denominator, 1)
+    u_a = ((x4 - x3) * (y1 - y3) - (y4 - y3) * (x1 - x3)) / denominator
+    u_b = ((x2 - x1) * (y1 - y3) - (y2 - y1) * (x1 - x3)) / denominator
+    return valid & (u_a >= 0.0) & (u_a <= 1.0) & (u_b >= 0.0) & (u_b <= 1.0)
+
+
+def check_cell_collisions(x1, y1, x2, y2, cx1, cy1, size):
+    """Vectorized ImageData.check_cell_collision against squares at (cx1, cy1)."""
+    cx2 = cx1 + size
+    cy2 = cy1 + size
+    return (
+        check_line_collisions(x1, y1, x2, y2, cx1, cy1, cx1, cy2)
+        | check_line_collisions(x1, y1, x2, y2, cx2, cy1, cx2, cy2)
+        | check_line_collisions(x1, y1, x2, y2, cx1, cy1, cx2, cy1)
+        | check_line_collisions(x1, y1, x2, y2, cx1, cy2, cx2, cy2)
+    )
+
+
+def check_column_collisions(x1, y1, x2, y2, cx1, size, height):
+    """Vectorized ImageData.check_column_collision for columns starting at cx1."""
+    return check_line_collisions(
+        x1, y1, x2, y2, cx1, 0, cx1, height
+    ) | check_line_collisions(x1, y1, x2, y2, cx1 + size, 0, cx1 + size, height)
+
+
+def expand_ranges(first, last):
+    """
+    For inclusive ranges [first, last] return (owner, value) with one entry per
+    value, ordered by owner then value. Empty ranges produce nothing.
+    """
+    counts = np.maximum(last - first + 1, 0)
+    owner = np.repeat(np.arange(len(counts)), counts)
+    starts = np.zeros(len(counts), dtype=np.int64)
+    np.cumsum(counts[:-1], out=starts[1:])
+    value = first[owner] + np.arange(len(owner)) - starts[owner]
+    return owner, value
+
+
+def get_crossed_cells(x1, y1, x2, y2, grid_size, max_x_index, max_y_index):
+    """
+    Vectorized ImageData.get_crossed_cells: clip every segment to the slab of
+    each column it spans and keep the rows between its entry and exit height
+    (plus the spare row the scalar walk visits).
+
+    Returns (segment, column, row) arrays ordered by segment, column, row.
+    """
+    swap = x1 > x2
+    x1, y1, x2, y2 = (
+        np.where(swap, x2, x1),
+        np.where(swap, y2, y1),
+        np.where(swap, x1, x2),
+        np.where(swap, y1, y2),
+    )
+
+    first_column = np.maximum(np.ceil(x1 / grid_size).astype(np.int64) - 1, 0)
+    last_column = np.minimum(np.floor(x2 / grid_size).astype(np.int64), max_x_index)
+    segment, column = expand_ranges(first_column, last_column)
+
+    x1, y1, x2, y2 = x1[segment], y1[segment], x2[segment], y2[segment]
+    cx1 = np.maximum(x1, column * grid_size)
+    cx2 = np.minimum(x2, (column + 1) * grid_size)
+    vertical = x1 == x2
+    dx = np.where(vertical, 1, x2 - x1)
+    ya = np.where(vertical, y1, y1 + (cx1 - x1) * (y2 - y1) / dx)
+    yb = np.where(vertical, y2, y1 + (cx2 - x1) * (y2 - y1) / dx)
+    ya, yb = np.minimum(ya, yb), np.maximum(ya, yb)
+
+    first_row = np.maximum(np.floor(ya / grid_size).astype(np.int64) - 1, 0)
+    last_row = np.minimum(np.floor(yb / grid_size).astype(np.int64), max_y_index)
+    entry, row = expand_ranges(first_row, last_row)
+    return segment[entry], column[entry], row
+
+
+def intersect_segments(p1, p2, grid, grid_size, max_x_index, max_y_index):
+    """
+    Exact cell hits of many segments at once.
+
+    p1 and p2 are (n, 2) integer arrays of segment ends and grid the CellStore
+    (column, row) -> cell index map. Returns (segment, cell, visible, tests):
+    every cell passing check_cell_collision ordered by segment, column and
+    row; visible marks the hits get_intersecting_cells reports (not in the
+    last column or row and passing check_column_collision); tests is the
+    number of scalar collision tests the same work would take.
+    """
+    x1, y1 = p1[:, 0], p1[:, 1]
+    x2, y2 = p2[:, 0], p2[:, 1]
+    segment, column, row = get_crossed_cells(
+        x1, y1, x2, y2, grid_size, max_x_index, max_y_index
+    )
+
+    inside = (column < grid.shape[0]) & (row < grid.shape[1])
+    segment, column, row = segment[inside], column[inside], row[inside]
+    cell = grid[column, row].astype(np.int64)
+    occupied = cell >= 0
+    segment, column, row, cell = (
+        segment[occupied],
+        column[occupied],
+        row[occupied],
+        cell[occupied],
+    )
+    tests = len(cell)
+
+    hit = check_cell_collisions(
+        x1[segment],
+        y1[segment],
+        x2[segment],
+        y2[segment],
+        column * grid_size,
+        row * grid_size,
+        grid_size,
+    )
+    segment, column, row, cell = segment[hit], column[hit], row[hit], cell[hit]
+
+    # one column test per (segment, column) among the inner hits
+    inner = (column < max_x_index) & (row < max_y_index)
+    visible = np.zeros(len(cell), dtype=bool)
+    inner_index = np.nonzero(inner)[0]
+    if len(inner_index):
+        inner_segment = segment[inner_index]
+        inner_column = column[inner_index]
+        head = np.ones(len(inner_index), dtype=bool)
+        head[1:] = (inner_segment[1:] != inner_segment[:-1]) | (
+            inner_column[1:] != inner_column[:-1]
+        )
+        heads = inner_index[head]
+        column_hit = check_column_collisions(
+            x1[segment[heads]],
+            y1[segment[heads]],
+            x2[segment[heads]],
+            y2[segment[heads]],
+            column[heads] * grid_size,
+            grid_size,
+            (max_y_index + 1) * grid_size,
+        )
+        visible[inner_index] = column_hit[np.cumsum(head) - 1]
+        tests += len(heads)
+
+    return segment, cell, visible, tests
+
+
+def build_incidence(
+    pairs, location, grid, cell_count, grid_size, max_x_index, max_y_index
+):
+    """
+    Line x cell incidence of every pair of an EndpointPairs, in CSR form.
+
+    Returns (line_cell_indptr, line_cell_indices, cell_line_indptr,
+    cell_line_indices, tests) where the line rows hold the visible hits in
+    column, row order and the cell rows the ascending lines hitting each of
+    the cell_count cells numbered by grid.
+    """
+    line_count = len(pairs)
+    line_counts = np.zeros(line_count, dtype=np.int64)
+    line_indices = [np.zeros(0, dtype=np.int64)]
+    hit_cells = [np.zeros(0, dtype=np.int64)]
+    hit_lines = [np.zeros(0, dtype=np.int64)]
+    tests = 0
+
+    for start in range(0, line_count, SegmentChunkSize):
+        indices = np.arange(start, min(start + SegmentChunkSize, line_count))
+        first, second = pairs.get_pair_indices(indices)
+        segment, cell, visible, chunk_tests = intersect_segments(
+            location[first],
+            location[second],
+            grid,
+            grid_size,
+            max_x_index,
+            max_y_index,
+        )
+        tests += chunk_tests
+        line_counts[start : start + len(indices)] = np.bincount(
+            segment[visible], minlength=len(indices)
+        )
+        line_indices.append(cell[visible])
+        hit_cells.append(cell)
+        hit_lines.append(segment + start)
+
+    line_cell_indptr = np.zeros(line_count + 1, dtype=np.int64)
+    np.cumsum(line_counts, out=line_cell_indptr[1:])
+    line_cell_indices = np.concatenate(line_indices).astype(np.int32)
+
+    # lines are already ascending, a stable sort groups them by cell
+    hit_cells = np.concatenate(hit_cells)
+    hit_lines = np.concatenate(hit_lines)
+    order = np.argsort(hit_cells, kind="stable")
+    cell_line_indptr = np.zeros(cell_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(hit_cells, minlength=cell_count), out=cell_line_indptr[1:])
+    cell_line_indices = hit_lines[order]
+
+    return (
+        line_cell_indptr,
+        line_cell_indices,
+        cell_line_indptr,
+        cell_line_indices,
+        tests,
+    )
@@ -0,0 +1,82 @@
+import contextlib
+import time
+
+
+class ConversionStats:
+    """
+    Stage timings and counters of one conversion.
+
+    stages maps a stage name to seconds, iterations holds one entry per
+    convergence iteration and counters the work done by ImageData. When a
+    callback is given it is called as callback(name, seconds) whenever a stage
+    or iteration finishes. stopped_early names the AnytimeLimits budget that
+    cut the convergence short, if any.
+    """
+
+    def __init__(self, callback=None) -> None:
+        self.callback = callback
+        self.stages = {}
+        self.iterations = []
+        self.counters = {
+            "candidates_examined": 0,
+            "collision_tests": 0,
+            "lines_accepted": 0,
+            "lines_rejected_bad_fit": 0,
+        }
+        self.stopped_early = None
+
+    @classmethod
+    def from_dict(cls, data, callback=None):
+        """The ConversionStats as_dict returned data for."""
+        stats = cls(callback)
+        stats.stages = dict(data["stages"])
+        stats.iterations = list(data["iterations"])
+        stats.counters = dict(data["counters"])
+        stats.stopped_early = data["stopped_early"]
+        return stats
+
+    def __getstate__(self):
+        # the callback stays in the parent when ImageData goes to a worker process
+        state = dict(self.__dict__)
+        state["callback"] = None
+        return state
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.perf_counter() - start)
+
+    def add_stage(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+        if self.callback:
+            self.callback(name, seconds)
+
+    def add_iteration(self, seconds, remaining):
+        self.iterations.append({"seconds": seconds, "remaining": remaining})
+        if self.callback:
+            self.callback(f"iteration {len(self.iterations)}", seconds)
+
+    def count(self, name, value=1):
+        self.counters[name] += value
+
+    def merge_counters(self, counters):
+        for name, value in counters.items():
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def as_dict(self):
+        return {
+            "stages": dict(self.stages),
+            "iterations": list(self.iterations),
+            "counters": dict(self.counters),
+            "stopped_early": self.stopped_early,
+        }
+
+
+def stage(stats, name):
+    """stats.stage(name), or a no-op context when stats is None."""
+    if stats is None:
+        return contextlib.nullcontext()
+    return stats.stage(name)
@@ -0,0 +1,180 @@
+import math
+import numpy as np
+from .image_point import ImagePoint
+
+
+def get_bin_quotas(counts, total):
+    """
+    Split total over bins holding counts items, as evenly as the counts
+    allow: bins with fewer items than their share keep all of them and the
+    rest is shared among the larger bins. The quotas add up to
+    min(total, counts.sum()).
+    """
+    quotas = np.zeros(len(counts), dtype=np.int64)
+    remaining = int(total)
+    order = np.argsort(counts, kind="stable")
+    for position, index in enumerate(order.tolist()):
+        share = -(-remaining // (len(order) - position))
+        quotas[index] = min(int(counts[index]), share)
+        remaining -= int(quotas[index])
+    return quotas
+
+
+class EndpointPairs:
+    """
+    Sequence of the endpoint pairs that ImagePoint.allow_line accepts, in
+    itertools.combinations order, generated on demand from an integer rank.
+
+    Only O(endpoints) bookkeeping is kept for the full set. Caps (a minimum
+    line length, or at most max_candidates pairs spread over angle_bins
+    direction bins) are applied by streaming over the ranks in chunks and
+    keeping the surviving ranks in one compact array. Precomputed ranks (from
+    a GeometryCache) can be passed in instead.
+    """
+
+    chunk_size = 1 << 20
+
+    def __init__(
+        self, endpoints, min_length=0, max_candidates=None, angle_bins=1, ranks=None
+    ):
+        self.endpoints = endpoints
+        self.store = endpoints.store
+        self.min_length = min_length
+        self.max_candidates = max_candidates
+        self.angle_bins = max(angle_bins, 1)
+
+        edges = self.store.edges[: self.store.count]
+        count = len(edges)
+
+        # for every distinct edge mask, the running number of endpoints a line
+        # from that mask may reach: cumulative[m][t] counts allowed in [0, t)
+        self.cumulative = {}
+        for mask in np.unique(edges).tolist():
+            cumulative = np.zeros(count + 1, dtype=np.int64)
+            np.cumsum((edges & mask) == 0, out=cumulative[1:])
+            self.cumulative[mask] = cumulative
+
+        pairs_after = np.zeros(count, dtype=np.int64)
+        for mask, cumulative in self.cumulative.items():
+            first = np.nonzero(edges == mask)[0]
+            pairs_after[first] = cumulative[count] - cumulative[first + 1]
+        self.offsets = np.zeros(count + 1, dtype=np.int64)
+        np.cumsum(pairs_after, out=self.offsets[1:])
+        self.total = int(self.offsets[-1])
+
+        self.ranks = ranks
+        if ranks is None and (min_length > 0 or max_candidates is not None):
+            self.ranks = self.filter_ranks()
+
+    def __len__(self):
+        return self.total if self.ranks is None else len(self.ranks)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("endpoint pair index out of range")
+        first, second = self.get_pair_indices(np.array([index]))
+        return (
+            ImagePoint(self.store, int(first[0])),
+            ImagePoint(self.store, int(second[0])),
+        )
+
+    def __iter__(self):
+        for start in range(0, len(self), self.chunk_size):
+            indices = np.arange(start, min(start + self.chunk_size, len(self)))
+            first, second = self.get_pair_indices(indices)
+            for i, j in zip(first.tolist(), second.tolist()):
+                yield ImagePoint(self.store, i), ImagePoint(self.store, j)
+
+    def get_pair_indices(self, indices):
+        """Return the (first, second) endpoint indices of an array of pair indices."""
+        ranks = indices if self.ranks is None else self.ranks[indices]
+        return self.get_rank_pairs(ranks)
+
+    def get_rank_pairs(self, ranks):
+        ranks = np.asarray(ranks, dtype=np.int64)
+        first = np.searchsorted(self.offsets, ranks, side="right") - 1
+        second = np.empty_like(first)
+        masks = self.store.edges[first]
+        for mask, cumulative in self.cumulative.items():
+            selected = masks == mask
+            if selected.any():
+                target = (
+                    cumulative[first[selected] + 1]
+                    + ranks[selected]
+                    - self.offsets[first[selected]]
+                    + 1
+                )
+                second[selected] = np.searchsorted(cumulative, target) - 1
+        return first, second
+
+    def get_pair_ranks(self, first, second):
+        """
+        Inverse of get_rank_pairs: the ranks of arrays of endpoint index pairs
+        (in either order), -1 where allow_line rejects the pair.
+        """
+        first = np.asarray(first, dtype=np.int64)
+        second = np.asarray(second, dtype=np.int64)
+        first, second = np.minimum(first, second), np.maximum(first, second)
+        edges = self.store.edges
+        masks = edges[first]
+        allowed = (first != second) & ((masks & edges[second]) == 0)
+        ranks = np.full(len(first), -1, dtype=np.int64)
+        for mask, cumulative in self.cumulative.items():
+            selected = allowed & (masks == mask)
+            if selected.any():
+                ranks[selected] = (
+                    self.offsets[first[selected]]
+                    + cumulative[second[selected]]
+                    - cumulative[first[selected] + 1]
+                )
+        return ranks
+
+    def iter_rank_chunks(self):
+        for start in range(0, self.total, self.chunk_size):
+            ranks = np.arange(start, min(start + self.chunk_size, self.total))
+            yield ranks, self.get_rank_pairs(ranks)
+
+    def filter_ranks(self):
+        location = self.store.location
+        bin_size = math.pi / self.angle_bins
+
+        kept = []
+        bin_counts = np.zeros(self.angle_bins, dtype=np.int64)
+        for ranks, (first, second) in self.iter_rank_chunks():
+            delta = (location[second] - location[first]).astype(np.float64)
+            keep = np.hypot(delta[:, 0], delta[:, 1]) >= self.min_length
+            angle_bin = self.get_angle_bins(delta, bin_size)
+            if self.max_candidates is not None:
+                bin_counts += np.bincount(angle_bin[keep], minlength=self.angle_bins)
+            kept.append((ranks[keep], angle_bin[keep]))
+
+        if not kept:
+            return np.zeros(0, dtype=np.int64)
+        if self.max_candidates is None:
+            return np.concatenate([ranks for ranks, _ in kept])
+
+        # keep an evenly strided subset of the quota pairs of every bin
+        quotas = get_bin_quotas(bin_counts, self.max_candidates)
+        seen = np.zeros(self.angle_bins, dtype=np.int64)
+        result = []
+        for ranks, angle_bin in kept:
+            order = np.argsort(angle_bin, kind="stable")
+            sorted_bins = angle_bin[order]
+            group_start = np.searchsorted(sorted_bins, np.arange(self.angle_bins))
+            ordinal = np.empty_like(ranks)
+            ordinal[order] = (
+                np.arange(len(ranks)) - group_start[sorted_bins] + seen[sorted_bins]
+            )
+            seen += np.bincount(angle_bin, minlength=self.angle_bins)
+
+            count = bin_counts[angle_bin]
+            limit = quotas[angle_bin]
+            keep = (ordinal + 1) * limit // count > ordinal * limit // count
+            result.append(ranks[keep])
+        return np.concatenate(result)
+
+    def get_angle_bins(self, delta, bin_size):
+        angle = np.arctan2(delta[:, 1], delta[:, 0]) % math.pi
+        return np.minimum((angle // bin_size).astype(np.int64), self.angle_bins - 1)
@@ -0,0 +1,86 @@
+import numpy as np
+from PIL import ImageSequence
+from .grid_sampler import open_source_image
+
+# ΔE a cell color has to move by before a frame re-evaluates it, about the
+# smallest difference people notice
+FrameChangeThreshold = 2.3
+
+# cell arrays copied from a new frame into the cells that changed
+FrameCellArrays = (
+    "ci",
+    "ci_length",
+    "luminance",
+    "lab",
+    "desired_passes",
+    "maximum_passes",
+    "is_transparent",
+)
+
+
+def iter_frames(source):
+    """
+    Yield the frames of source: a sequence of paths, file objects or PIL
+    images, or a single animated image (GIF, APNG, multi-page TIFF).
+    """
+    if isinstance(source, (list, tuple)):
+        yield from source
+        return
+    im = open_source_image(source)
+    for frame in ImageSequence.Iterator(im):
+        yield frame.convert("RGBA")
+
+
+def get_changed_cells(image_data, frame_data, threshold):
+    """
+    Boolean mask of the cells of image_data whose Lab color (or transparency)
+    differs from frame_data by more than threshold, or None when the frames
+    don't have the same cells.
+    """
+    cells = image_data.cells
+    frame_cells = frame_data.cells
+    count = cells.count
+    if frame_cells.count != count or not np.array_equal(
+        cells.cell_indices[:count], frame_cells.cell_indices[:count]
+    ):
+        return None
+    d = frame_cells.lab[:count] - cells.lab[:count]
+    delta_e = np.sqrt(d[:, 0] * d[:, 0] + d[:, 1] * d[:, 1] + d[:, 2] * d[:, 2])
+    return (delta_e > threshold) | (
+        frame_cells.is_transparent[:count] != cells.is_transparent[:count]
+    )
+
+
+def drop_lines(image_data, changed):
+    """
+    Remove the accepted lines that cross a changed cell (see
+    ImageData.remove_lines), found through the lines touching those cells so
+    the work grows with the changed cells, not with the drawing. A cell's
+    own lines always touch it. Returns the indices of the cells those lines
+    belonged to.
+    """
+    indices = np.nonzero(changed)[0]
+    indptr = image_data.cell_line_indptr
+    counts = indptr[indices + 1] - indptr[indices]
+    starts = np.zeros(len(indices), dtype=np.int64)
+    np.cumsum(counts[:-1], out=starts[1:])
+    flat = np.arange(int(counts.sum())) + np.repeat(indptr[indices] - starts, counts)
+    crossing = image_data.cell_line_indices[flat]
+    return image_data.remove_lines(crossing[image_data.line_used[crossing]])
+
+
+def update_frame(image_data, frame_data, changed):
+    """
+    Warm start image_data for the next frame: drop the lines through changed
+    cells, copy the new colors of those cells and return the indices of the
+    cells to re-evaluate, the changed ones and the owners of the dropped
+    lines. The other cells those lines crossed keep their smaller passes
+    until new lines cross them or the next keyframe.
+    """
+    owners = drop_lines(image_data, changed)
+    cells = image_data.cells
+    frame_cells = frame_data.cells
+    indices = np.nonzero(changed)[0]
+    for name in FrameCellArrays:
+        getattr(cells, name)[indices] = getattr(frame_cells, name)[indices]
+    return np.union1d(indices, owners)
@@ -0,0 +1,163 @@
+import hashlib
+import os
+import pathlib
+import shutil
+import tempfile
+import numpy as np
+from .collision_kernel import build_incidence, expand_ranges
+from .endpoint_pairs import EndpointPairs
+
+# bump when the stored arrays or their meaning change
+GeometryFormat = 2
+
+GeometryArrays = (
+    "line_cell_indptr",
+    "line_cell_positions",
+    "position_line_indptr",
+    "position_line_indices",
+)
+
+
+class GeometryCache:
+    """
+    Directory of candidate line geometry, shared by every conversion with the
+    same grid.
+
+    The candidate pairs and the line x cell incidence only depend on the
+    endpoints, the grid extent and the candidate caps, not on the colors. They
+    are built once for a full grid, where cell (column, row) is numbered
+    column * rows + row, and stored as .npy files that later conversions (and
+    their worker processes) memory-map read-only. When some cells of an image
+    are missing the mapped arrays are renumbered to its cells on load.
+    """
+
+    def __init__(self, directory) -> None:
+        self.directory = pathlib.Path(directory)
+
+    def get_key(self, image_data):
+        store = image_data.endpoint_store
+        digest = hashlib.sha1()
+        digest.update(
+            repr(
+                (
+                    GeometryFormat,
+                    image_data.grid_size,
+                    image_data.max_x_index,
+                    image_data.max_y_index,
+                    image_data.min_line_length,
+                    image_data.max_candidates,
+                    image_data.angle_bins,
+                )
+            ).encode()
+        )
+        digest.update(store.location[: store.count].tobytes())
+        digest.update(store.edges[: store.count].tobytes())
+        return (
+            f"{image_data.max_x_index + 1}x{image_data.max_y_index + 1}"
+            f"_{image_data.grid_size}_{digest.hexdigest()[:16]}"
+        )
+
+    def initialize(self, image_data):
+        """Load the geometry of image_data, building the cache entry if needed."""
+        path = self.directory / self.get_key(image_data)
+        if not path.is_dir():
+            self.build(image_data, path)
+        self.load(image_data, path)
+
+    def build(self, image_data, path):
+        columns = image_data.max_x_index + 1
+        rows = image_data.max_y_index + 1
+        pairs = EndpointPairs(
+            image_data.endpoints,
+            min_length=image_data.min_line_length,
+            max_candidates=image_data.max_candidates,
+            angle_bins=image_data.angle_bins,
+        )
+        arrays = build_incidence(
+            pairs,
+            image_data.endpoint_store.location,
+            np.arange(columns * rows).reshape(columns, rows),
+            columns * rows,
+            image_data.grid_size,
+            image_data.max_x_index,
+            image_data.max_y_index,
+        )
+        if image_data.stats is not None:
+            image_data.stats.count("collision_tests", arrays[-1])
+
+        # write into a temporary directory and rename it, so concurrent
+        # conversions never see a partial entry
+        self.directory.mkdir(parents=True, exist_ok=True)
+        work = pathlib.Path(tempfile.mkdtemp(dir=self.directory, prefix=".build-"))
+        try:
+            for name, array in zip(GeometryArrays, arrays):
+                np.save(work / f"{name}.npy", array)
+            if pairs.ranks is not None:
+                np.save(work / "ranks.npy", pairs.ranks)
+            os.rename(work, path)
+        except OSError:
+            shutil.rmtree(work, ignore_errors=True)
+            if not path.is_dir():
+                raise
+
+    def load(self, image_data, path):
+        path = pathlib.Path(path)
+        arrays = {
+            name: np.load(path / f"{name}.npy", mmap_mode="r")
+            for name in GeometryArrays
+        }
+        ranks = None
+        if (path / "ranks.npy").exists():
+            ranks = np.load(path / "ranks.npy", mmap_mode="r")
+
+        image_data.endpoint_combinations = EndpointPairs(
+            image_data.endpoints,
+            min_length=image_data.min_line_length,
+            max_candidates=image_data.max_candidates,
+            angle_bins=image_data.angle_bins,
+            ranks=ranks,
+        )
+
+        cells = image_data.cells
+        rows = image_data.max_y_index + 1
+        position_cells = (
+            cells.grid[: image_data.max_x_index + 1, :rows].ravel().astype(np.int64)
+        )
+        if np.array_equal(position_cells, np.arange(len(position_cells))):
+            # every cell present in column, row order: use the mapped arrays
+            image_data.line_cell_indptr = arrays["line_cell_indptr"]
+            image_data.line_cell_indices = arrays["line_cell_positions"]
+            image_data.cell_line_indptr = arrays["position_line_indptr"]
+            image_data.cell_line_indices = arrays["position_line_indices"]
+            image_data.geometry_path = path
+        else:
+            self.renumber(image_data, arrays, position_cells, rows)
+            image_data.geometry_path = None
+
+        image_data.line_used = np.zeros(
+            len(image_data.endpoint_combinations), dtype=bool
+        )
+
+    def renumber(self, image_data, arrays, position_cells, rows):
+        """Map the full grid arrays to the cells image_data actually has."""
+        line_indptr = arrays["line_cell_indptr"]
+        line_cells = position_cells[arrays["line_cell_positions"]]
+        present = line_cells >= 0
+        owner = np.repeat(np.arange(len(line_indptr) - 1), np.diff(line_indptr))
+        image_data.line_cell_indptr = np.zeros(len(line_indptr), dtype=np.int64)
+        np.cumsum(
+            np.bincount(owner[present], minlength=len(line_indptr) - 1),
+            out=image_data.line_cell_indptr[1:],
+        )
+        image_data.line_cell_indices = line_cells[present].astype(np.int32)
+
+        cells = image_data.cells
+        cell_indices = cells.cell_indices[: cells.count]
+        positions = cell_indices[:, 0].astype(np.int64) * rows + cell_indices[:, 1]
+        position_indptr = arrays["position_line_indptr"]
+        starts = position_indptr[positions]
+        ends = position_indptr[positions + 1]
+        _, flat = expand_ranges(starts, ends - 1)
+        image_data.cell_line_indptr = np.zeros(cells.count + 1, dtype=np.int64)
+        np.cumsum(ends - starts, out=image_data.cell_line_indptr[1:])
+        image_data.cell_line_indices = np.asarray(arrays["position_line_indices"][flat])
@@ -0,0 +1,136 @@
+import numpy as np
+from PIL import Image
+
+
+def open_source_image(source):
+    """Image.open for a path or file object, a PIL image is used as is."""
+    if isinstance(source, Image.Image):
+        return source
+    return Image.open(source)
+
+
+def get_image_pixels(im):
+    """
+    Decode a PIL image into a (height, width, channels) uint8 array.
+
+    RGB and RGBA images are used as is, everything else is converted so the
+    sampler always sees 3 or 4 channels.
+    """
+    if im.mode not in ("RGB", "RGBA"):
+        has_alpha = im.mode in ("LA", "La", "PA", "RGBa") or "transparency" in im.info
+        im = im.convert("RGBA" if has_alpha else "RGB")
+    return np.asarray(im)
+
+
+def iter_pixel_bands(pixels, band_height):
+    """Yield consecutive horizontal bands of band_height rows (the last may be short)."""
+    for y_start in range(0, pixels.shape[0], band_height):
+        yield pixels[y_start : y_start + band_height]
+
+
+def get_average_rgb_band(band, size_per_pixel, alpha_aware):
+    """
+    Compute the root mean square color of every cell in one band of rows.
+
+    Matches the per pixel loops the converters originally sampled cells with:
+    with alpha_aware, fully transparent pixels are left out of the mean and a
+    cell holding at least size_per_pixel of them is reported as transparent.
+
+    Returns (colors, valid, transparent) indexed by column.
+    """
+    band_width = band.shape[1]
+    starts = np.arange(0, band_width, size_per_pixel)
+    widths = np.minimum(starts + size_per_pixel, band_width) - starts
+
+    squares = band[..., :3].astype(np.int64)
+    squares *= squares
+
+    if alpha_aware and band.shape[2] > 3:
+        alpha = band[..., 3]
+        opaque = alpha > 0
+        squares *= opaque[..., None]
+        num = np.add.reduceat(opaque.sum(axis=0), starts)
+        transparent_count = np.add.reduceat((alpha == 0).sum(axis=0), starts)
+        transparent = transparent_count >= size_per_pixel
+    else:
+        num = widths * band.shape[0]
+        transparent = np.zeros(len(starts), dtype=bool)
+
+    sums = np.add.reduceat(squares.sum(axis=0), starts, axis=0)
+    valid = (num > 0) | transparent
+    with np.errstate(divide="ignore", invalid="ignore"):
+        colors = np.sqrt(sums / num[:, None])
+    colors[~valid | transparent] = 0.0
+    return colors, valid, transparent
+
+
+def iter_average_rgb_bands(bands, size_per_pixel, alpha_aware=False):
+    """Yield (row_index, colors, valid, transparent) for each band of pixel rows."""
+    for row_index, band in enumerate(bands):
+        colors, valid, transparent = get_average_rgb_band(
+            band, size_per_pixel, alpha_aware
+        )
+        yield row_index, colors, valid, transparent
+
+
+class GridSample:
+    """Per cell average colors for a whole grid, indexed [column, row]."""
+
+    def __init__(self, colors, valid, transparent, alpha_aware) -> None:
+        self.colors = colors
+        self.valid = valid
+        self.transparent = transparent
+        self.alpha_aware = alpha_aware
+
+    def get_color(self, column_index, row_index):
+        """
+        Return the color tuple of a cell: None outside the image, (0, 0, 0, 0)
+        when transparent, else the root mean square RGB (alpha 255 when
+        alpha_aware).
+        """
+        if not self.valid[column_index, row_index]:
+            return None
+        if self.transparent[column_index, row_index]:
+            return (0, 0, 0, 0)
+
+        r, g, b = self.colors[column_index, row_index].tolist()
+        if self.alpha_aware:
+            return (r, g, b, 255)
+        return (r, g, b)
+
+
+def get_average_rgb_grid(
+    pixels, size_per_pixel, regions_x, regions_y, alpha_aware=False
+):
+    """Sample every size_per_pixel square of an image array in one pass per band."""
+    return get_average_rgb_grid_from_bands(
+        iter_pixel_bands(pixels, size_per_pixel),
+        size_per_pixel,
+        regions_x,
+        regions_y,
+        alpha_aware,
+    )
+
+
+def get_average_rgb_grid_from_bands(
+    bands, size_per_pixel, regions_x, regions_y, alpha_aware=False
+):
+    """
+    Sample a grid from an iterable of size_per_pixel high bands of pixel rows,
+    so the whole image never has to be in memory.
+    """
+    colors = np.zeros((regions_x, regions_y, 3))
+    valid = np.zeros((regions_x, regions_y), dtype=bool)
+    transparent = np.zeros((regions_x, regions_y), dtype=bool)
+
+    for y, band_colors, band_valid, band_transparent in iter_average_rgb_bands(
+        bands, size_per_pixel, alpha_aware
+    ):
+        if y >= regions_y:
+            break
+        count = min(len(band_valid), regions_x)
+        colors[:count, y] = band_colors[:count]
+        valid[:count, y] = band_valid[:count]
+        transparent[:count, y] = band_transparent[:count]
+
+    return GridSample(colors, valid, transparent, alpha_aware)
@@ -1,6 +1,150 @@
-class ImageCell:
-    def __init__(
+import numpy as np
+
+
+class CellStore:
+    """
+    Structure of arrays holding every cell of an ImageData.
+
+    Cells are addressed by their insertion index, or by (column, row) through
+    the index grid. Locations and sizes are integer pixel coordinates.
+    """
+
+    def __init__(self, capacity=64) -> None:
+        self.count = 0
+        self.cell_indices = np.zeros((capacity, 2), dtype=np.int32)
+        self.location = np.zeros((capacity, 2), dtype=np.int64)
+        self.size = np.zeros((capacity, 2), dtype=np.int64)
+        self.ci = np.zeros((capacity, 4), dtype=np.float64)
+        self.ci_length = np.zeros(capacity, dtype=np.uint8)
+        self.luminance = np.zeros(capacity, dtype=np.float64)
+        self.lab = np.zeros((capacity, 3), dtype=np.float64)
+        self.desired_passes = np.zeros(capacity, dtype=np.int32)
+        self.maximum_passes = np.zeros(capacity, dtype=np.int32)
+        self.passes = np.zeros(capacity, dtype=np.int32)
+        self.last_index = np.zeros(capacity, dtype=np.int64)
+        self.is_transparent = np.zeros(capacity, dtype=bool)
+
+        # [column, row] -> cell index, -1 where there is no cell
+        self.grid = np.full((0, 0), -1, dtype=np.int32)
+
+    def reserve(self, capacity):
+        if capacity <= len(self.passes):
+            return
+        capacity = max(capacity, 2 * len(self.passes))
+        for name in (
+            "cell_indices",
+            "location",
+            "size",
+            "ci",
+            "ci_length",
+            "luminance",
+            "lab",
+            "desired_passes",
+            "maximum_passes",
+            "passes",
+            "last_index",
+            "is_transparent",
+        ):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[: self.count] = old[: self.count]
+            setattr(self, name, new)
+
+    def reserve_grid(self, columns, rows):
+        old_columns, old_rows = self.grid.shape
+        if columns <= old_columns and rows <= old_rows:
+            return
+        if columns > old_columns:
+            columns = max(columns, 2 * old_columns)
+        if rows > old_rows:
+            rows = max(rows, 2 * old_rows)
+        grid = np.full((max(columns, old_columns), max(rows, old_rows)), -1, np.int32)
+        grid[:old_columns, :old_rows] = self.grid
+        self.grid = grid
+
+    def find(self, column_index, row_index):
+        """Return the index of the cell at (column, row), or -1."""
+        if (
+            0 <= column_index < self.grid.shape[0]
+            and 0 <= row_index < self.grid.shape[1]
+        ):
+            return int(self.grid[column_index, row_index])
+        return -1
+
+    def append(
         self,
+        column_index,
+        row_index,
+        location,
+        size,
+        ci,
+        luminance,
+        desired_passes,
+        lab,
+        is_transparent,
+    ):
+        index = self.count
+        self.reserve(index + 1)
+        self.reserve_grid(column_index + 1, row_index + 1)
+        self.count += 1
+
+        self.cell_indices[index] = (column_index, row_index)
+        self.location[index] = location
+        self.size[index] = size
+        self.ci[index, : len(ci)] = ci
+        self.ci_length[index] = len(ci)
+        self.luminance[index] = luminance
+        self.lab[index] = lab
+        self.desired_passes[index] = desired_passes
+        self.maximum_passes[index] = 100 if is_transparent else desired_passes * 2 + 4
+        self.passes[index] = 0
+        self.last_index[index] = -1
+        self.is_transparent[index] = is_transparent
+        self.grid[column_index, row_index] = index
+        return index
+
+
+class CellList:
+    """Read only sequence of ImageCell views over a CellStore."""
+
+    def __init__(self, store) -> None:
+        self.store = store
+
+    def __len__(self):
+        return self.store.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [ImageCell(self.store, i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += self.store.count
+        if not 0 <= index < self.store.count:
+            raise IndexError("cell index out of range")
+        return ImageCell(self.store, index)
+
+    def __iter__(self):
+        for index in range(self.store.count):
+            yield ImageCell(self.store, index)
+
+
+class ImageCell:
+    """
+    Attribute view of one cell in a CellStore.
+
+    Only passes and last_index can be assigned, the other attributes are read
+    from the store. Cells used to be built from their values, from_values
+    still does that (in a store of their own).
+    """
+
+    __slots__ = ("store", "index")
+
+    def __init__(self, store, index) -> None:
+        self.store = store
+        self.index = index
+
+    @classmethod
+    def from_values(
+        cls,
         key,
         cell_indices,
         location,
@@ -10,16 +154,85 @@ class ImageCell:
         desired_passes,
         lab,
         is_transparent,
-    ) -> None:
-        self.ci = ci
-        self.key = key
-        self.luminance = luminance
-        self.lab = lab
-        self.source_size = size
-        self.source_location = location
-        self.cell_indices = cell_indices
-        self.desired_passes = desired_passes
-        self.passes = 0
-        self.last_index = -1
-        self.is_transparent = is_transparent
-        self.maximum_passes = 100 if is_transparent else desired_passes * 2 + 4
+    ):
+        """A standalone cell, key is derived from cell_indices."""
+        store = CellStore(1)
+        index = store.append(
+            *cell_indices,
+            location,
+            size,
+            ci,
+            luminance,
+            desired_passes,
+            lab,
+            is_transparent,
+        )
+        return cls(store, index)
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, ImageCell)
+            and self.store is other.store
+            and self.index == other.index
+        )
+
+    def __hash__(self):
+        return hash((id(self.store), self.index))
+
+    @property
+    def key(self):
+        return "{}_{}".format(*self.cell_indices)
+
+    @property
+    def cell_indices(self):
+        return tuple(self.store.cell_indices[self.index].tolist())
+
+    @property
+    def source_location(self):
+        return tuple(self.store.location[self.index].tolist())
+
+    @property
+    def source_size(self):
+        return tuple(self.store.size[self.index].tolist())
+
+    @property
+    def ci(self):
+        return tuple(
+            self.store.ci[self.index, : self.store.ci_length[self.index]].tolist()
+        )
+
+    @property
+    def luminance(self):
+        return float(self.store.luminance[self.index])
+
+    @property
+    def lab(self):
+        return tuple(self.store.lab[self.index].tolist())
+
+    @property
+    def desired_passes(self):
+        return int(self.store.desired_passes[self.index])
+
+    @property
+    def maximum_passes(self):
+        return int(self.store.maximum_passes[self.index])
+
+    @property
+    def is_transparent(self):
+        return bool(self.store.is_transparent[self.index])
+
+    @property
+    def passes(self):
+        return int(self.store.passes[self.index])
+
+    @passes.setter
+    def passes(self, value):
+        self.store.passes[self.index] = value
+
+    @property
+    def last_index(self):
+        return int(self.store.last_index[self.index])
+
+    @last_index.setter
+    def last_index(self, value):
+        self.store.last_index[self.index] = value
@@ -1,15 +1,27 @@
+import bisect
 import itertools
 import math
-import sys
-from tracemalloc import start
-from .image_cell import ImageCell
-from .image_point import ImagePoint
+from collections import OrderedDict
+import numpy as np
+from .collision_kernel import build_incidence, intersect_segments
+from .image_cell import CellList, CellStore, ImageCell
+from .image_point import EndpointList, EndpointStore
+from .endpoint_pairs import EndpointPairs
 from .string_line import StringLine
 
 WhiteThreshold = 95
 DeltaEGoodThreshold = 10.0
 DeltaEBadThreshold = 100.0
 
+# attributes a GeometryCache provides, left out when pickling a mapped ImageData
+GeometryState = (
+    "endpoint_combinations",
+    "line_cell_indptr",
+    "line_cell_indices",
+    "cell_line_indptr",
+    "cell_line_indices",
+)
+
 
 def compare_lab(l1, l2):
     dl = l2[0] - l1[0]
@@ -70,12 +82,6 @@ def convert_rgb_to_lab(inputColor):
     return (round(L, 4), round(a, 4), round(b, 4))
 
 
-def rotated_sequence(seq, start_index):
-    n = len(seq)
-    for i in range(n):
-        yield seq[(i + start_index) % n]
-
-
 def convert_rgb_to_luminance(rgb_tuple):
     if isinstance(rgb_tuple[0], int):
         R = float(rgb_tuple[0]) / 255.0
@@ -91,6 +97,74 @@ def convert_rgb_to_luminance(rgb_tuple):
     return 0.299 * R + 0.587 * G + 0.114 * B
 
 
+def convert_rgb_array_to_lab(rgb_array):
+    """
+    Batch convert_rgb_to_lab: takes an (N, 3) array of 0-255 RGB values and
+    returns an (N, 3) array of Lab values, rounded the same way.
+    """
+    rgb = np.asarray(rgb_array, dtype=np.float64)[:, :3] / 255
+    rgb = np.where(rgb > 0.04045, ((rgb + 0.055) / 1.055) ** 2.4, rgb / 12.92) * 100
+
+    xyz = np.empty_like(rgb)
+    xyz[:, 0] = rgb[:, 0] * 0.4124 + rgb[:, 1] * 0.3576 + rgb[:, 2] * 0.1805
+    xyz[:, 1] = rgb[:, 0] * 0.2126 + rgb[:, 1] * 0.7152 + rgb[:, 2] * 0.0722
+    xyz[:, 2] = rgb[:, 0] * 0.0193 + rgb[:, 1] * 0.1192 + rgb[:, 2] * 0.9505
+    xyz = np.round(xyz, 4) / (95.047, 100.0, 108.883)
+    xyz = np.where(xyz > 0.008856, xyz**0.3333333333333333, 7.787 * xyz + 16 / 116)
+
+    lab = np.empty_like(xyz)
+    lab[:, 0] = 116 * xyz[:, 1] - 16
+    lab[:, 1] = 500 * (xyz[:, 0] - xyz[:, 1])
+    lab[:, 2] = 200 * (xyz[:, 1] - xyz[:, 2])
+    return np.round(lab, 4)
+
+
+def convert_rgb_array_to_luminance(rgb_array):
+    """Batch convert_rgb_to_luminance for an (N, 3) array of 0-255 RGB values."""
+    rgb = np.asarray(rgb_array, dtype=np.float64)[:, :3] / 255.0
+    return 0.299 * rgb[:, 0] + 0.587 * rgb[:, 1] + 0.114 * rgb[:, 2]
+
+
+class ColorCache:
+    """
+    Bounded LRU memo of (luminance, lab) for callers adding cells one at a time.
+
+    Colors are quantized to 1 / quantization of an RGB step and converted at the
+    quantized value, so a hit never depends on which color filled the slot.
+    """
+
+    def __init__(self, maxsize=65536, quantization=4) -> None:
+        self.maxsize = maxsize
+        self.quantization = quantization
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def convert(self, ci):
+        key = (
+            round(ci[0] * self.quantization),
+            round(ci[1] * self.quantization),
+            round(ci[2] * self.quantization),
+        )
+        value = self.entries.get(key)
+        if value is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return value
+
+        self.misses += 1
+        rgb = tuple(float(c) / self.quantization for c in key)
+        value = (convert_rgb_to_luminance(rgb), convert_rgb_to_lab(rgb))
+        self.entries[key] = value
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        return value
+
+
+def is_transparent_color(ci):
+    return len(ci) > 3 and ci[3] == 0
+
+
 def check_line_collision(x1, y1, x2, y2, x3, y3, x4, y4):
     # LINE/LINE
 
@@ -110,70 +184,159 @@ def check_line_collision(x1, y1, x2, y2, x3, y3, x4, y4):
 
 class ImageData:
     def __init__(self) -> None:
-        self.lookup = dict()
-        self.items = []
-        self.endpoints = []
+        self.cells = CellStore()
+        self.items = CellList(self.cells)
+        self.endpoint_store = EndpointStore()
+        self.endpoints = EndpointList(self.endpoint_store)
         self.max_y_index = 0
         self.max_x_index = 0
         self.line_lookup = dict()
         self.lines = []
         self.endpoint_combinations = None
 
+        # caps on the candidate lines generated by initialize_best_fit
+        self.min_line_length = 0
+        self.max_candidates = None
+        self.angle_bins = 1
+
+        # line x cell incidence in CSR form: the cells crossed by each entry of
+        # endpoint_combinations, and the lines touching each cell
+        self.line_cell_indptr = None
+        self.line_cell_indices = None
+        self.cell_line_indptr = None
+        self.cell_line_indices = None
+        self.line_used = None
+
+        # score candidate lines with NumPy over the incidence arrays instead of
+        # one compare_lab call per crossed cell
+        self.batch_scoring = True
+
+        # run the segment/cell collision tests with the NumPy kernel, many
+        # segments at a time, instead of scalar check_cell_collision calls
+        self.vectorized_collisions = True
+
+        # optional GeometryCache the candidate lines and incidence arrays are
+        # loaded from; geometry_path is set while they are memory-mapped from it
+        self.geometry_cache = None
+        self.geometry_path = None
+
+        # optional ConversionStats collecting candidate and line counters
+        self.stats = None
+
+        # optional ColorCache used by add_cell
+        self.color_cache = None
+
+        # optional Palette the cell colors were quantized to (see apply_palette),
+        # batched scoring then looks fits up in its ΔE matrix
+        self.palette = None
+
         # the number of desired passes for 0% luminance
         self.passes_scaler = 10
 
         self.grid_size = 32
 
-    def add_cell(self, column_index, row_index, ci, location, size):
-        key = f"{column_index}_{row_index}"
-        if key not in self.lookup:
-            if column_index > self.max_x_index:
-                self.max_x_index = column_index
-            if row_index > self.max_y_index:
-                self.max_y_index = row_index
-
-            is_transparent = len(ci) > 3 and ci[3] == 0
-            indices = (column_index, row_index)
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        if self.geometry_path is not None:
+            # worker processes map the cached geometry instead of copying it
+            for name in GeometryState:
+                state[name] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.geometry_path is not None:
+            line_used = self.line_used
+            self.geometry_cache.load(self, self.geometry_path)
+            self.line_used = line_used
 
-            if is_transparent:
+    def add_cell(self, column_index, row_index, ci, location, size):
+        if self.cells.find(column_index, row_index) < 0:
+            if is_transparent_color(ci):
                 luminance = 0
                 lab = (0, 0, 0)
-                desired_passes = 0
+            elif self.color_cache is not None:
+                luminance, lab = self.color_cache.convert(ci)
             else:
                 luminance = convert_rgb_to_luminance(ci)
                 lab = convert_rgb_to_lab(ci)
-                desired_passes = int(round((1.0 - luminance) * self.passes_scaler, 0))
-                if lab[0] > WhiteThreshold:
-                    desired_passes = 0
-
-            cell_data = ImageCell(
-                key,
-                indices,
-                location,
-                size,
-                ci,
-                luminance,
-                desired_passes,
-                lab,
-                is_transparent,
+
+            self.insert_cell(
+                column_index, row_index, ci, location, size, luminance, lab
             )
-            self.lookup[key] = cell_data
-            self.items.append(cell_data)
         else:
-            print(f"duplicate: {key}")
+            print(f"duplicate: {column_index}_{row_index}")
+
+    def add_cells(self, cells):
+        """
+        Add many cells at once, converting all colors in one batch.
+
+        cells is a sequence of (column_index, row_index, ci, location, size)
+        tuples, the same arguments add_cell takes.
+        """
+        opaque = [
+            i for i, cell in enumerate(cells) if not is_transparent_color(cell[2])
+        ]
+        luminances = [0] * len(cells)
+        labs = [(0, 0, 0)] * len(cells)
+        if opaque:
+            rgb = np.array([cells[i][2][:3] for i in opaque], dtype=np.float64)
+            for i, luminance, lab in zip(
+                opaque,
+                convert_rgb_array_to_luminance(rgb).tolist(),
+                convert_rgb_array_to_lab(rgb).tolist(),
+            ):
+                luminances[i] = luminance
+                labs[i] = lab
+
+        self.cells.reserve(self.cells.count + len(cells))
+        for (column_index, row_index, ci, location, size), luminance, lab in zip(
+            cells, luminances, labs
+        ):
+            if self.cells.find(column_index, row_index) < 0:
+                self.insert_cell(
+                    column_index, row_index, ci, location, size, luminance, lab
+                )
+            else:
+                print(f"duplicate: {column_index}_{row_index}")
+
+    def insert_cell(self, column_index, row_index, ci, location, size, luminance, lab):
+        if column_index > self.max_x_index:
+            self.max_x_index = column_index
+        if row_index > self.max_y_index:
+            self.max_y_index = row_index
+
+        is_transparent = is_transparent_color(ci)
+        if is_transparent:
+            desired_passes = 0
+        else:
+            desired_passes = int(round((1.0 - luminance) * self.passes_scaler, 0))
+            if lab[0] > WhiteThreshold:
+                desired_passes = 0
+
+        return self.cells.append(
+            column_index,
+            row_index,
+            location,
+            size,
+            ci,
+            luminance,
+            desired_passes,
+            lab,
+            is_transparent,
+        )
 
     def add_endpoint(
         self, x_index, y_index, location, left_edge, right_edge, top_edge, bottom_edge
     ):
-        endpoint = ImagePoint(
+        self.endpoint_store.append(
             x_index, y_index, location, left_edge, right_edge, top_edge, bottom_edge
         )
-        self.endpoints.append(endpoint)
 
     def get_cell(self, column_index, row_index):
-        key = f"{column_index}_{row_index}"
-        if key in self.lookup:
-            return self.lookup[key]
+        index = self.cells.find(column_index, row_index)
+        if index >= 0:
+            return ImageCell(self.cells, index)
         else:
             return None
 
@@ -229,6 +392,17 @@ class ImageData:
 
     def get_intersecting_cells(self, line_start, line_end):
         """ """
+        if self.vectorized_collisions:
+            _, cell, visible, _ = intersect_segments(
+                np.array([line_start]),
+                np.array([line_end]),
+                self.cells.grid,
+                self.grid_size,
+                self.max_x_index,
+                self.max_y_index,
+            )
+            return [self.items[i] for i in cell[visible].tolist()]
+
         result = []
 
         for x in range(self.max_x_index):
@@ -241,66 +415,327 @@ class ImageData:
 
         return result
 
+    def get_crossed_cells(self, line_start, line_end):
+        """
+        Walk the grid column by column along a line and yield the (column, row)
+        of every square it may touch, in column then row order.
+
+        The walk is a superset of what check_cell_collision accepts (one spare
+        row per column), callers confirm each candidate with the exact test.
+        """
+        x1, y1 = line_start
+        x2, y2 = line_end
+        if x1 > x2:
+            x1, y1, x2, y2 = x2, y2, x1, y1
+
+        first_column = max(math.ceil(x1 / self.grid_size) - 1, 0)
+        last_column = min(math.floor(x2 / self.grid_size), self.max_x_index)
+        for column_index in range(first_column, last_column + 1):
+            cx1 = max(x1, column_index * self.grid_size)
+            cx2 = min(x2, (column_index + 1) * self.grid_size)
+            if x1 == x2:
+                ya, yb = y1, y2
+            else:
+                ya = y1 + (cx1 - x1) * (y2 - y1) / (x2 - x1)
+                yb = y1 + (cx2 - x1) * (y2 - y1) / (x2 - x1)
+            if ya > yb:
+                ya, yb = yb, ya
+
+            first_row = max(math.floor(ya / self.grid_size) - 1, 0)
+            last_row = min(math.floor(yb / self.grid_size), self.max_y_index)
+            for row_index in range(first_row, last_row + 1):
+                yield column_index, row_index
+
+    def build_intersection_index(self):
+        """
+        Precompute, for every entry of endpoint_combinations, the cells
+        get_intersecting_cells would return, and for every cell the indices
+        of the lines passing check_cell_collision against it.
+        """
+        if self.vectorized_collisions:
+            self.build_intersection_index_vectorized()
+            return
+
+        line_counts = []
+        line_indices = []
+        cell_lines = [[] for _ in range(self.cells.count)]
+        collision_tests = 0
+
+        for line_index, (p1, p2) in enumerate(self.endpoint_combinations):
+            count = 0
+            column_hits = {}
+            for column_index, row_index in self.get_crossed_cells(
+                p1.location, p2.location
+            ):
+                cell_index = self.cells.find(column_index, row_index)
+                if cell_index < 0:
+                    continue
+                collision_tests += 1
+                if not self.check_cell_collision(
+                    column_index, row_index, p1.location, p2.location
+                ):
+                    continue
+
+                cell_lines[cell_index].append(line_index)
+
+                # get_intersecting_cells never visits the last column or row
+                if column_index < self.max_x_index and row_index < self.max_y_index:
+                    if column_index not in column_hits:
+                        collision_tests += 1
+                        column_hits[column_index] = self.check_column_collision(
+                            column_index, p1.location, p2.location
+                        )
+                    if column_hits[column_index]:
+                        line_indices.append(cell_index)
+                        count += 1
+
+            line_counts.append(count)
+
+        if self.stats is not None:
+            self.stats.count("collision_tests", collision_tests)
+
+        self.line_cell_indptr = np.zeros(len(line_counts) + 1, dtype=np.int64)
+        np.cumsum(line_counts, out=self.line_cell_indptr[1:])
+        self.line_cell_indices = np.array(line_indices, dtype=np.int32)
+
+        self.cell_line_indptr = np.zeros(len(cell_lines) + 1, dtype=np.int64)
+        np.cumsum([len(lines) for lines in cell_lines], out=self.cell_line_indptr[1:])
+        self.cell_line_indices = np.fromiter(
+            itertools.chain.from_iterable(cell_lines),
+            dtype=np.int64,
+            count=int(self.cell_line_indptr[-1]),
+        )
+        self.line_used = np.zeros(len(line_counts), dtype=bool)
+
+    def build_intersection_index_vectorized(self):
+        """build_intersection_index over chunks of lines with intersect_segments."""
+        (
+            self.line_cell_indptr,
+            self.line_cell_indices,
+            self.cell_line_indptr,
+            self.cell_line_indices,
+            collision_tests,
+        ) = build_incidence(
+            self.endpoint_combinations,
+            self.endpoint_store.location,
+            self.cells.grid,
+            self.cells.count,
+            self.grid_size,
+            self.max_x_index,
+            self.max_y_index,
+        )
+        self.line_used = np.zeros(len(self.endpoint_combinations), dtype=bool)
+
+        if self.stats is not None:
+            self.stats.count("collision_tests", collision_tests)
+
+    def get_line_cells(self, line_index):
+        """Indices of the cells crossed by an entry of endpoint_combinations."""
+        return self.line_cell_indices[
+            self.line_cell_indptr[line_index] : self.line_cell_indptr[line_index + 1]
+        ]
+
+    def get_cell_lines(self, cell_index):
+        """Ascending indices of the endpoint_combinations touching a cell."""
+        return self.cell_line_indices[
+            self.cell_line_indptr[cell_index] : self.cell_line_indptr[cell_index + 1]
+        ]
+
     def initialize_best_fit(self):
-        all_combinations = itertools.combinations(self.endpoints, 2)
-        self.endpoint_combinations = []
-        for item_tuple in all_combinations:
-            if item_tuple[0].allow_line(item_tuple[1]):
-                self.endpoint_combinations.append(item_tuple)
+        if self.geometry_cache is not None:
+            self.geometry_cache.initialize(self)
+            return
+
+        # every allowed itertools.combinations pair of endpoints, by rank
+        self.endpoint_combinations = EndpointPairs(
+            self.endpoints,
+            min_length=self.min_line_length,
+            max_candidates=self.max_candidates,
+            angle_bins=self.angle_bins,
+        )
+
+        self.build_intersection_index()
+
+    def accept_line(self, entry, line_index):
+        p1, p2 = self.endpoint_combinations[line_index]
+        key = p1.line_id(p2)
+        string_line = StringLine(
+            key, p1.location, p2.location, entry.ci, line_index, entry.index
+        )
+        self.line_lookup[key] = string_line
+        self.lines.append(string_line)
+        self.line_used[line_index] = True
+        entry.last_index = line_index
+        if self.stats is not None:
+            self.stats.count("lines_accepted")
+
+    def remove_lines(self, removed):
+        """
+        Undo accepting the lines removed (endpoint_combinations indices of
+        lines in self.lines): take back the passes they added to the crossed
+        cells that were a good fit for their cell, mark them unused and move
+        the last_index of their cells back to the last line those cells still
+        have. Returns the indices of the cells that owned the lines.
+        """
+        removed = np.unique(np.asarray(removed, dtype=np.int64))
+        if len(removed) == 0:
+            return np.zeros(0, dtype=np.int64)
+        owners = np.zeros(len(removed), dtype=np.int64)
+        for i, line_index in enumerate(removed.tolist()):
+            p1, p2 = self.endpoint_combinations[line_index]
+            owners[i] = self.line_lookup.pop(p1.line_id(p2)).cell_index
+
+        # gather the crossed cells of every removed line into one flat array
+        counts = self.line_cell_indptr[removed + 1] - self.line_cell_indptr[removed]
+        starts = np.zeros(len(removed), dtype=np.int64)
+        np.cumsum(counts[:-1], out=starts[1:])
+        flat = np.arange(int(counts.sum())) + np.repeat(
+            self.line_cell_indptr[removed] - starts, counts
+        )
+        cells = self.line_cell_indices[flat].astype(np.int64)
+        cell_owners = np.repeat(owners, counts)
+
+        # the colors must still be the ones the lines were accepted with
+        good = self.get_good_fits(cells, cell_owners)
+        np.subtract.at(self.cells.passes, cells[good], 1)
+        self.line_used[removed] = False
+
+        # one pass over the kept lines, in acceptance order
+        touched = np.unique(owners)
+        last_index = dict.fromkeys(touched.tolist(), -1)
+        lines = []
+        for line in self.lines:
+            if self.line_used[line.line_index]:
+                lines.append(line)
+                if line.cell_index in last_index:
+                    last_index[line.cell_index] = line.line_index
+        self.lines = lines
+        self.cells.last_index[touched] = list(last_index.values())
+        return touched
+
+    def get_good_fits(self, cells, cell_index):
+        """Whether each of the cells is within DeltaEGoodThreshold of cell_index."""
+        if self.palette is not None:
+            colors = self.palette.cell_colors
+            return self.palette.good[colors[cells], colors[cell_index]]
+        d = self.cells.lab[cells] - self.cells.lab[cell_index]
+        delta_e = np.sqrt(d[:, 0] * d[:, 0] + d[:, 1] * d[:, 1] + d[:, 2] * d[:, 2])
+        return delta_e < DeltaEGoodThreshold
+
+    def try_accept_line(self, entry, line_index):
+        """
+        Accept one line for the entry if it is unused and still a fit against the
+        current passes, adding passes like create_best_fit_line does.
+        """
+        cells = self.get_line_cells(line_index)
+        if self.line_used[line_index] or len(cells) == 0:
+            return False
+
+        good = self.get_good_fits(cells, entry.index)
+        passes = self.cells.passes
+        if (~good & (passes[cells] + 1 >= self.cells.maximum_passes[cells])).any():
+            if self.stats is not None:
+                self.stats.count("lines_rejected_bad_fit")
+            return False
+
+        self.accept_line(entry, line_index)
+        np.add.at(passes, cells[good], 1)
+        return True
 
     def create_best_fit_line(self, entry):
+        if self.batch_scoring:
+            self.create_best_fit_line_batched(entry)
+            return
+
         # only create lines for this entry for non-white spaces
         if entry.lab[0] < WhiteThreshold:
             start_index = (entry.last_index + 1) % len(self.endpoint_combinations)
-            index = start_index
-            for item_tuple in rotated_sequence(self.endpoint_combinations, start_index):
-                key = item_tuple[0].line_id(item_tuple[1])
-                if key not in self.line_lookup:
+
+            # endpoint_combinations order rotated to start_index, restricted to
+            # the lines touching the entry
+            candidates = self.get_cell_lines(entry.index).tolist()
+            split = bisect.bisect_left(candidates, start_index)
+            for index in itertools.chain(candidates[split:], candidates[:split]):
+                if not self.line_used[index]:
                     good_fit = 0
                     bad_fit = 0
-                    p1 = item_tuple[0]
-                    p2 = item_tuple[1]
-                    if self.check_cell_collision(
-                        entry.cell_indices[0],
-                        entry.cell_indices[1],
-                        p1.location,
-                        p2.location,
-                    ):
-                        cell_list = self.get_intersecting_cells(
-                            p1.location, p2.location
-                        )
-                        if cell_list:
-                            for cell_item in cell_list:
-                                if entry.key == cell_item.key:
-                                    # this is of course a good fit
+                    cell_list = [self.items[i] for i in self.get_line_cells(index)]
+                    if cell_list:
+                        if self.stats is not None:
+                            self.stats.count("candidates_examined")
+                        for cell_item in cell_list:
+                            if entry.index == cell_item.index:
+                                # this is of course a good fit
+                                good_fit += 1
+                            else:
+                                delta_e = compare_lab(entry.lab, cell_item.lab)
+                                if delta_e < DeltaEGoodThreshold:
                                     good_fit += 1
+                                elif delta_e > DeltaEBadThreshold:
+                                    if cell_item.passes + 1 >= cell_item.maximum_passes:
+                                        bad_fit += 1
                                 else:
-                                    delta_e = compare_lab(entry.lab, cell_item.lab)
-                                    if delta_e < DeltaEGoodThreshold:
-                                        good_fit += 1
-                                    elif delta_e > DeltaEBadThreshold:
-                                        if (
-                                            cell_item.passes + 1
-                                            >= cell_item.maximum_passes
-                                        ):
-                                            bad_fit += 1
-                                    else:
-                                        if (
-                                            cell_item.passes + 1
-                                            >= cell_item.maximum_passes
-                                        ):
-                                            bad_fit += 1
-
-                            if bad_fit == 0:
-                                string_line = StringLine(
-                                    key, p1.location, p2.location, entry.ci
-                                )
-                                self.line_lookup[key] = string_line
-                                self.lines.append(string_line)
-                                entry.last_index = index
-
-                                for cell_item in cell_list:
-                                    delta_e = compare_lab(entry.lab, cell_item.lab)
-                                    if delta_e < DeltaEGoodThreshold:
-                                        cell_item.passes += 1
-                index += 1
+                                    if cell_item.passes + 1 >= cell_item.maximum_passes:
+                                        bad_fit += 1
+
+                        if bad_fit > 0 and self.stats is not None:
+                            self.stats.count("lines_rejected_bad_fit")
+
+                        if bad_fit == 0:
+                            self.accept_line(entry, index)
+
+                            for cell_item in cell_list:
+                                delta_e = compare_lab(entry.lab, cell_item.lab)
+                                if delta_e < DeltaEGoodThreshold:
+                                    cell_item.passes += 1
+
+    def create_best_fit_line_batched(self, entry):
+        """
+        Vectorized create_best_fit_line: every unused line touching the entry is
+        scored at once and all acceptable ones are kept in rotated order.
+
+        Accepting a line only adds passes to cells within DeltaEGoodThreshold of
+        the entry, which can never count as a bad fit for it, so scoring all
+        candidates against the passes at the start gives the same lines as the
+        one at a time loop.
+        """
+        if self.cells.lab[entry.index, 0] >= WhiteThreshold:
+            return
+
+        line_indptr = self.line_cell_indptr
+        passes = self.cells.passes
+
+        start_index = (entry.last_index + 1) % len(self.endpoint_combinations)
+        candidates = self.get_cell_lines(entry.index)
+        split = np.searchsorted(candidates, start_index)
+        candidates = np.concatenate((candidates[split:], candidates[:split]))
+        candidates = candidates[~self.line_used[candidates]]
+
+        counts = line_indptr[candidates + 1] - line_indptr[candidates]
+        candidates = candidates[counts > 0]
+        counts = counts[counts > 0]
+        if len(candidates) == 0:
+            return
+
+        # gather the crossed cells of every candidate into one flat array
+        segment_starts = np.zeros(len(counts), dtype=np.int64)
+        np.cumsum(counts[:-1], out=segment_starts[1:])
+        flat = np.arange(int(counts.sum())) + np.repeat(
+            line_indptr[candidates] - segment_starts, counts
+        )
+        cells = self.line_cell_indices[flat]
+
+        good = self.get_good_fits(cells, entry.index)
+        bad = ~good & (passes[cells] + 1 >= self.cells.maximum_passes[cells])
+
+        accepted = np.add.reduceat(bad, segment_starts) == 0
+        if self.stats is not None:
+            self.stats.count("candidates_examined", len(candidates))
+            self.stats.count("lines_rejected_bad_fit", int((~accepted).sum()))
+        if not accepted.any():
+            return
+
+        for index in candidates[accepted].tolist():
+            self.accept_line(entry, index)
+
+        np.add.at(passes, cells[np.repeat(accepted, counts) & good], 1)
@@ -1,30 +1,144 @@
-class ImagePoint:
-    def __init__(
+import numpy as np
+
+LeftEdge = 1
+RightEdge = 2
+TopEdge = 4
+BottomEdge = 8
+
+
+class EndpointStore:
+    """
+    Structure of arrays holding the line endpoints of an ImageData.
+
+    Edge membership is kept as a bit mask, two endpoints may be joined by a
+    line when their masks share no bit.
+    """
+
+    def __init__(self, capacity=64) -> None:
+        self.count = 0
+        self.x_index = np.zeros(capacity, dtype=np.int32)
+        self.y_index = np.zeros(capacity, dtype=np.int32)
+        self.location = np.zeros((capacity, 2), dtype=np.int64)
+        self.edges = np.zeros(capacity, dtype=np.uint8)
+
+    def reserve(self, capacity):
+        if capacity <= len(self.edges):
+            return
+        capacity = max(capacity, 2 * len(self.edges))
+        for name in ("x_index", "y_index", "location", "edges"):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[: self.count] = old[: self.count]
+            setattr(self, name, new)
+
+    def append(
         self, x_index, y_index, location, left_edge, right_edge, top_edge, bottom_edge
-    ) -> None:
-        self.x_index = x_index
-        self.y_index = y_index
-        self.location = location
-        self.left_edge = left_edge
-        self.right_edge = right_edge
-        self.top_edge = top_edge
-        self.bottom_edge = bottom_edge
+    ):
+        index = self.count
+        self.reserve(index + 1)
+        self.count += 1
+
+        self.x_index[index] = x_index
+        self.y_index[index] = y_index
+        self.location[index] = location
+        self.edges[index] = (
+            (LeftEdge if left_edge else 0)
+            | (RightEdge if right_edge else 0)
+            | (TopEdge if top_edge else 0)
+            | (BottomEdge if bottom_edge else 0)
+        )
+        return index
+
+
+class EndpointList:
+    """Read only sequence of ImagePoint views over an EndpointStore."""
+
+    def __init__(self, store) -> None:
+        self.store = store
+
+    def __len__(self):
+        return self.store.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [ImagePoint(self.store, i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += self.store.count
+        if not 0 <= index < self.store.count:
+            raise IndexError("endpoint index out of range")
+        return ImagePoint(self.store, index)
+
+    def __iter__(self):
+        for index in range(self.store.count):
+            yield ImagePoint(self.store, index)
+
+
+class ImagePoint:
+    """
+    Read only attribute view of one endpoint in an EndpointStore.
+
+    Endpoints used to be built from their values, from_values still does that
+    (in a store of their own).
+    """
+
+    __slots__ = ("store", "index")
+
+    def __init__(self, store, index) -> None:
+        self.store = store
+        self.index = index
+
+    @classmethod
+    def from_values(
+        cls, x_index, y_index, location, left_edge, right_edge, top_edge, bottom_edge
+    ):
+        store = EndpointStore(1)
+        index = store.append(
+            x_index, y_index, location, left_edge, right_edge, top_edge, bottom_edge
+        )
+        return cls(store, index)
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, ImagePoint)
+            and self.store is other.store
+            and self.index == other.index
+        )
+
+    def __hash__(self):
+        return hash((id(self.store), self.index))
+
+    @property
+    def x_index(self):
+        return int(self.store.x_index[self.index])
+
+    @property
+    def y_index(self):
+        return int(self.store.y_index[self.index])
+
+    @property
+    def location(self):
+        return tuple(self.store.location[self.index].tolist())
+
+    @property
+    def left_edge(self):
+        return bool(self.store.edges[self.index] & LeftEdge)
+
+    @property
+    def right_edge(self):
+        return bool(self.store.edges[self.index] & RightEdge)
+
+    @property
+    def top_edge(self):
+        return bool(self.store.edges[self.index] & TopEdge)
+
+    @property
+    def bottom_edge(self):
+        return bool(self.store.edges[self.index] & BottomEdge)
 
     def allow_line(self, other):
         if not other:
-            result = False
-        elif self.left_edge and other.left_edge:
-            result = False
-        elif self.top_edge and other.top_edge:
-            result = False
-        elif self.right_edge and other.right_edge:
-            result = False
-        elif self.bottom_edge and other.bottom_edge:
-            result = False
-        else:
-            result = True
-
-        return result
+            return False
+        return not self.store.edges[self.index] & other.store.edges[other.index]
 
     def unique_id(self):
         return f"{self.x_index}_{self.y_index}"
@@ -1,49 +1,29 @@
-from PIL import Image
+import itertools
 import math
-import svgwrite
-from svglib.svglib import svg2rlg
-from reportlab.graphics import renderPDF, renderPM
 import pathlib
+import time
+import numpy as np
+from .cancellation import check_stop
+from .conversion_stats import ConversionStats, stage
+from .geometry_cache import GeometryCache
 from .image_data import ImageData
-
-
-def get_average_rgb_square(pxa, image_width, image_height, x_start, y_start, width):
-    num = 0
-    r = 0
-    g = 0
-    b = 0
-    transparent_count = 0
-
-    for x_offset in range(width):
-        for y_offset in range(width):
-            x = x_start + x_offset
-            y = y_start + y_offset
-
-            if x >= 0 and x < image_width and y >= 0 and y < image_height:
-                ci = pxa[x, y]
-
-                if len(ci) > 2:
-                    a = ci[3]
-                    if a == 0:
-                        transparent_count += 1
-                else:
-                    a = 255
-
-                if transparent_count >= width:
-                    # return transparent color
-                    return (0, 0, 0, 0)
-
-                if a > 0:
-                    num += 1
-                    r += ci[0] * ci[0]
-                    g += ci[1] * ci[1]
-                    b += ci[2] * ci[2]
-
-    # Return the sqrt of the mean of squared R, G, and B sums
-    if num:
-        return (math.sqrt(r / num), math.sqrt(g / num), math.sqrt(b / num), 255)
-    else:
-        return None
+from .parallel_convergence import converge_parallel
+from .priority_convergence import converge_priority
+from .anytime import AnytimeLimits
+from .coarse_to_fine import initialize_coarse_to_fine
+from .palette import apply_palette
+from .line_export import load_lines, save_lines
+from .frame_sequence import (
+    FrameChangeThreshold,
+    get_changed_cells,
+    iter_frames,
+    update_frame,
+)
+from .svg_writer import open_svg_writer, rgb
+from .raster_renderer import check_png_backend, render_lines
+from .grid_sampler import get_image_pixels, get_average_rgb_grid, open_source_image
+from .result_cache import ResultCache
+from .tiled_input import LargeImagePixels, TiledImage
 
 
 class LineArtGenerator:
@@ -53,16 +33,322 @@ class LineArtGenerator:
         self.export_png_path = None
         self.debug = False
 
-    def convert(self, input_path, output_path):
+        # "stream" writes SVG elements straight to disk, "svgwrite" builds a DOM;
+        # compress_svg writes gzip (None: only for a .svgz output_path)
+        self.svg_backend = "stream"
+        self.compress_svg = None
+
+        # "raster" draws the PNG directly with Pillow (png_antialias is the
+        # supersampling factor, 1 turns it off), "reportlab" renders the SVG file
+        self.png_backend = "raster"
+
+        # "full" decodes the source at once, "tiled" reads it in strips of
+        # about strip_height rows (memory-mapped or reduced where possible)
+        self.input_mode = "full"
+        self.strip_height = 2048
+
+        # pixel limit of tiled input (None for none), it bypasses Pillow's
+        # decompression bomb check for trusted large scans
+        self.max_input_pixels = LargeImagePixels
+        self.png_antialias = 4
+
+        # number of worker processes for the convergence loop, 1 runs inline
+        self.workers = 1
+
+        # "rounds" rescans all cells until nothing changes, "priority" works
+        # through a queue of unsatisfied cells (single process, different lines)
+        self.scheduler = "rounds"
+
+        # "flat" scores every endpoint pair, "coarse_to_fine" solves a grid
+        # coarse_factor times coarser first and only keeps the candidate lines
+        # around its result (refine_radius cells, None for coarse_factor // 2)
+        self.search = "flat"
+        self.coarse_factor = 4
+        self.refine_radius = None
+
+        # quantize the cell colors to at most palette_size colors (k-means in
+        # Lab) before the line search; the SVG then groups runs of lines with
+        # the same color in <g stroke="..."> elements
+        self.palette_size = None
+
+        # optional caps on the candidate lines, see EndpointPairs
+        self.min_line_length = 0
+        self.max_candidates = None
+        self.angle_bins = 1
+
+        # directory of the GeometryCache shared by conversions with the same
+        # grid, None rebuilds the candidate lines for every image
+        self.geometry_cache_dir = None
+
+        # directory of a ResultCache keyed by the decoded pixels and settings,
+        # trimmed to result_cache_size bytes; on a hit convert returns the
+        # ConversionStats stored with the entry when it would return any
+        self.result_cache_dir = None
+        self.result_cache_size = 1 << 30
+
+        # opt-in instrumentation: with collect_stats (or a stats_callback, called
+        # as callback(name, seconds) after every stage) convert returns a
+        # ConversionStats with stage timings and ImageData counters
+        self.collect_stats = False
+        self.stats_callback = None
+
+        # optional callable polled between stages and convergence steps, when
+        # it returns True convert raises ConversionCancelled
+        self.should_stop = None
+
+        # anytime mode: convergence stops with the lines found so far once
+        # time_budget seconds have passed since it started (after its first
+        # accepted lines) or max_lines lines exist. Snapshots of the lines are
+        # taken after every iteration, every snapshot_interval seconds and
+        # every snapshot_lines new lines (if set): snapshot_callback is called
+        # as callback(image_data, number) and a partial SVG is written to
+        # snapshot_path.format(number=number)
+        self.time_budget = None
+        self.max_lines = None
+        self.snapshot_interval = None
+        self.snapshot_lines = None
+        self.snapshot_callback = None
+        self.snapshot_path = None
+
+        # convert_sequence re-evaluates the cells whose Lab color moved by more
+        # than this ΔE since the previous frame
+        self.frame_change_threshold = FrameChangeThreshold
+        # convert every this many frames from scratch, the lines kept by warm
+        # starts constrain the new ones and the fit slowly drifts (None: never)
+        self.keyframe_interval = None
+
+        # directory the accepted lines are saved to as .npy arrays (see
+        # save_lines), render_export draws them again without converting
+        self.export_lines_path = None
+
+    def convert(self, input_path, output_path=None):
+        # a time budget makes the output depend on the machine, don't cache it;
+        # the cache doesn't keep line exports or snapshots either
+        if (
+            self.result_cache_dir is not None
+            and self.time_budget is None
+            and self.export_lines_path is None
+            and self.snapshot_callback is None
+            and self.snapshot_path is None
+        ):
+            cache = ResultCache(self.result_cache_dir, self.result_cache_size)
+            return cache.convert(self, input_path, output_path, self.convert_uncached)
+        return self.convert_uncached(input_path, output_path)
+
+    def convert_uncached(self, input_path, output_path=None):
         """
         1. Read Image
            a. get average color / darkness for grid (alt: circle?)
         2. Create list of starting / ending points
         3. Iterate all points. Add number of passes based on darkness... Best fit line for
+
+        Returns a ConversionStats when collect_stats or stats_callback is set.
         """
-        im = Image.open(input_path)
-        px = im.load()
+        check_png_backend(self.png_backend, self.export_png_path, output_path)
+        stats = self.create_stats()
+        limits = AnytimeLimits(
+            self.time_budget,
+            self.max_lines,
+            snapshot_interval=self.snapshot_interval,
+            snapshot_lines=self.snapshot_lines,
+        )
+
+        image_data = self.create_image_data(stats)
+        size_per_pixel, regions_x, regions_y = self.prepare(
+            image_data, input_path, stats
+        )
+
+        svg_size = (regions_x * size_per_pixel, regions_y * size_per_pixel)
+        limits.callback = self.get_snapshot_callback(svg_size)
+
+        with stage(stats, "convergence"):
+            self.run_scheduler(image_data, stats, limits)
+
+        if output_path is not None:
+            with stage(stats, "svg_export"):
+                self.write_svg(image_data, output_path, svg_size)
+
+        if self.export_png_path:
+            with stage(stats, "png_export"):
+                self.write_png(image_data, output_path, svg_size)
+
+        if self.export_lines_path is not None:
+            with stage(stats, "lines_export"):
+                save_lines(image_data, self.export_lines_path)
+
+        return stats
+
+    def convert_sequence(
+        self, frames, output_pattern=None, png_pattern=None, lines_pattern=None
+    ):
+        """
+        Convert the frames of an animation (see iter_frames) to numbered files,
+        output_pattern.format(frame=number), png_pattern.format(frame=number)
+        and line exports in lines_pattern.format(frame=number), with number
+        counting from 0.
+
+        The first frame is converted like convert does. Later frames keep its
+        ImageData with the endpoint geometry: cells whose Lab moved by more
+        than frame_change_threshold take the new colors, the accepted lines
+        through them are dropped, and only those cells and the owners of the
+        dropped lines go through the scheduler again, starting from the lines
+        that are left. A frame with a different grid, and every keyframe_interval-th
+        frame, is converted from scratch.
+
+        Returns the ConversionStats of every frame (None entries unless
+        collect_stats or stats_callback is set).
+        """
+        if self.palette_size or self.search != "flat":
+            raise ValueError("sequence mode needs search='flat' and no palette")
+
+        results = []
+        image_data = None
+        grid_shape = None
+        for number, frame in enumerate(iter_frames(frames)):
+            check_stop(self.should_stop)
+            stats = self.create_stats()
+            limits = AnytimeLimits(self.time_budget, self.max_lines)
+
+            frame_data = self.create_image_data(stats)
+            with stage(stats, "sampling"):
+                frame_shape = self.sample(frame_data, frame)
+            changed = None
+            keyframe = self.keyframe_interval and number % self.keyframe_interval == 0
+            if frame_shape == grid_shape and not keyframe:
+                changed = get_changed_cells(
+                    image_data, frame_data, self.frame_change_threshold
+                )
+
+            if changed is None:
+                image_data = frame_data
+                grid_shape = frame_shape
+                self.prepare(image_data, frame, stats, grid_shape)
+                with stage(stats, "convergence"):
+                    self.run_scheduler(image_data, stats, limits)
+            else:
+                image_data.stats = stats
+                with stage(stats, "warm_start"):
+                    cell_indices = update_frame(image_data, frame_data, changed)
+                if stats is not None:
+                    stats.merge_counters({"cells_changed": int(changed.sum())})
+                with stage(stats, "convergence"):
+                    self.run_scheduler(image_data, stats, limits, cell_indices)
+
+            size_per_pixel, regions_x, regions_y = grid_shape
+            svg_size = (regions_x * size_per_pixel, regions_y * size_per_pixel)
+            output_path = None
+            if output_pattern is not None:
+                output_path = str(output_pattern).format(frame=number)
+                with stage(stats, "svg_export"):
+                    self.write_svg(image_data, output_path, svg_size)
+            if png_pattern is not None:
+                with stage(stats, "png_export"):
+                    self.write_png(
+                        image_data,
+                        output_path,
+                        svg_size,
+                        str(png_pattern).format(frame=number),
+                    )
+            if lines_pattern is not None:
+                with stage(stats, "lines_export"):
+                    save_lines(image_data, str(lines_pattern).format(frame=number))
+            results.append(stats)
+        return results
+
+    def render_export(self, lines_path, output_path=None, png_path=None):
+        """
+        Draw the lines saved in lines_path (export_lines_path of an earlier
+        conversion) to an SVG and/or a PNG with the current output settings,
+        without sampling or converging. Exports of a palette conversion are
+        grouped by stroke like the original SVG.
+        """
+        drawing = load_lines(lines_path)
+        if output_path is not None:
+            self.write_svg(drawing, output_path, drawing.size)
+        if png_path is not None:
+            self.write_png(drawing, output_path, drawing.size, png_path)
+
+    def create_stats(self):
+        if self.collect_stats or self.stats_callback:
+            return ConversionStats(self.stats_callback)
+        return None
+
+    def create_image_data(self, stats=None):
         image_data = ImageData()
+        image_data.min_line_length = self.min_line_length
+        image_data.max_candidates = self.max_candidates
+        image_data.angle_bins = self.angle_bins
+        image_data.stats = stats
+        if self.geometry_cache_dir is not None:
+            image_data.geometry_cache = GeometryCache(self.geometry_cache_dir)
+        return image_data
+
+    def prepare(self, image_data, input_path, stats=None, grid_shape=None):
+        """
+        Sample the image (unless its grid_shape is passed, the cells being
+        sampled already), add the endpoints and the candidate lines. Returns
+        (size_per_pixel, regions_x, regions_y).
+        """
+        should_stop = self.should_stop
+        if grid_shape is None:
+            with stage(stats, "sampling"):
+                grid_shape = self.sample(image_data, input_path)
+        size_per_pixel, regions_x, regions_y = grid_shape
+        if self.palette_size:
+            with stage(stats, "palette"):
+                apply_palette(image_data, self.palette_size)
+        with stage(stats, "endpoints"):
+            self.add_endpoints(image_data, size_per_pixel, regions_x, regions_y)
+        check_stop(should_stop)
+        with stage(stats, "initialize_best_fit"):
+            if self.search == "coarse_to_fine":
+                initialize_coarse_to_fine(
+                    image_data, self.converge, self.coarse_factor, self.refine_radius
+                )
+            elif self.search == "flat":
+                image_data.initialize_best_fit()
+            else:
+                raise ValueError(f"unknown search: {self.search}")
+        check_stop(should_stop)
+        return grid_shape
+
+    def run_scheduler(self, image_data, stats=None, limits=None, cell_indices=None):
+        """
+        Converge with the configured scheduler, restricted to cell_indices when
+        they are passed (a warm start re-evaluating only some cells).
+        """
+        if limits is None:
+            limits = AnytimeLimits()
+        limits.start_clock(image_data)
+        if self.scheduler == "priority":
+            converge_priority(image_data, stats, self.should_stop, limits, cell_indices)
+        elif self.scheduler != "rounds":
+            raise ValueError(f"unknown scheduler: {self.scheduler}")
+        elif self.workers > 1:
+            converge_parallel(
+                image_data,
+                self.workers,
+                stats=stats,
+                should_stop=self.should_stop,
+                limits=limits,
+                debug=self.debug,
+                cell_indices=cell_indices,
+            )
+        else:
+            self.converge(image_data, stats, limits, cell_indices)
+        limits.report(stats)
+
+    def sample(self, image_data, input_path):
+        """
+        Average the image into the cell grid and add the cells to image_data.
+        Returns (size_per_pixel, regions_x, regions_y).
+        """
+        if self.input_mode == "tiled":
+            im = TiledImage(input_path, self.strip_height, self.max_input_pixels)
+        elif self.input_mode == "full":
+            im = open_source_image(input_path)
+        else:
+            raise ValueError(f"unknown input mode: {self.input_mode}")
 
         w = im.width
         h = im.height
@@ -71,23 +357,32 @@ class LineArtGenerator:
         size_per_pixel = p_x if p_x > p_y else p_y
         regions_x = math.ceil(w / size_per_pixel)
         regions_y = math.ceil(h / size_per_pixel)
-        dwg = svgwrite.Drawing(
-            output_path,
-            profile="tiny",
-            size=(regions_x * size_per_pixel, regions_y * size_per_pixel),
-        )
 
         # Import the color and luminance region into custom sized grid
+        if self.input_mode == "tiled":
+            grid = im.get_average_rgb_grid(
+                size_per_pixel, regions_x, regions_y, alpha_aware=True
+            )
+        else:
+            grid = get_average_rgb_grid(
+                get_image_pixels(im),
+                size_per_pixel,
+                regions_x,
+                regions_y,
+                alpha_aware=True,
+            )
+        cells = []
         for x in range(regions_x):
             for y in range(regions_y):
-                ci = get_average_rgb_square(
-                    px, w, h, x * size_per_pixel, y * size_per_pixel, size_per_pixel
-                )
+                ci = grid.get_color(x, y)
                 if ci is not None:
                     region_size = (size_per_pixel, size_per_pixel)
                     region_location = (x * size_per_pixel, y * size_per_pixel)
-                    image_data.add_cell(x, y, ci, region_location, region_size)
+                    cells.append((x, y, ci, region_location, region_size))
+        image_data.add_cells(cells)
+        return size_per_pixel, regions_x, regions_y
 
+    def add_endpoints(self, image_data, size_per_pixel, regions_x, regions_y):
         # add points surrounding the image as the valid line start and end points
         for x in range(regions_x + 1):
             for y in range(regions_y + 1):
@@ -107,35 +402,114 @@ class LineArtGenerator:
                         bottom_edge,
                     )
 
-        # paint the endpoints (for debug)
-        for endpoint in image_data.endpoints:
-            # Draw a small white circle in the top left of box
-            dwg.add(
+    def write_svg(self, image_data, output_path, svg_size):
+        # write svg file to disk
+        with open_svg_writer(
+            output_path,
+            svg_size,
+            backend=self.svg_backend,
+            compress=self.compress_svg,
+            keep_text=self.debug,
+        ) as dwg:
+            # paint the endpoints (for debug)
+            for endpoint in image_data.endpoints:
+                # Draw a small white circle in the top left of box
                 dwg.circle(
                     center=endpoint.location,
                     r=1,
-                    stroke=svgwrite.rgb(15, 15, 15, "%"),
+                    stroke=rgb(15, 15, 15, "%"),
                     fill="white",
                 )
+
+            if image_data.palette is not None:
+                runs = itertools.groupby(
+                    image_data.lines, key=lambda line: rgb(*line.ci[:3])
+                )
+                for stroke, lines in runs:
+                    with dwg.group(stroke=stroke, stroke_width=1):
+                        for line in lines:
+                            dwg.line(line.p1, line.p2)
+            else:
+                for line in image_data.lines:
+                    dwg.line(
+                        line.p1,
+                        line.p2,
+                        stroke=rgb(line.ci[0], line.ci[1], line.ci[2]),
+                        stroke_width=1,
+                    )
+
+        if self.debug:
+            # output our svg image as raw xml
+            print(dwg.tostring())
+
+    def write_png(self, image_data, output_path, svg_size, png_path=None):
+        png_path = png_path or self.export_png_path
+        if self.png_backend == "raster" or output_path is None:
+            im = render_lines(
+                svg_size,
+                image_data.lines,
+                image_data.endpoints,
+                antialias=self.png_antialias,
             )
+            im.save(png_path, format="PNG")
+        elif not hasattr(output_path, "write") and pathlib.Path(output_path).exists():
+            # svglib and reportlab are slow to import, only load them when used
+            from reportlab.graphics import renderPM
+            from svglib.svglib import svg2rlg
+
+            drawing = svg2rlg(output_path)
+            renderPM.drawToFile(drawing, png_path, fmt="PNG", bg=0x00FFFFFF)
+
+    def get_snapshot_callback(self, svg_size):
+        if self.snapshot_callback is None and self.snapshot_path is None:
+            return None
 
-        image_data.initialize_best_fit()
+        def snapshot(image_data, number):
+            if self.snapshot_path is not None:
+                self.write_svg(
+                    image_data, str(self.snapshot_path).format(number=number), svg_size
+                )
+            if self.snapshot_callback is not None:
+                self.snapshot_callback(image_data, number)
+
+        return snapshot
 
+    def converge(self, image_data, stats=None, limits=None, cell_indices=None):
+        """
+        Add best fit lines for unsatisfied cells until nothing changes.
+        stats (a ConversionStats) receives the time of every iteration, limits
+        (AnytimeLimits) can stop early and takes a snapshot after each one.
+        cell_indices restricts the rounds to those cells.
+        """
+        if limits is None:
+            limits = AnytimeLimits()
+        entries = image_data.items
+        if cell_indices is not None:
+            entries = [image_data.items[i] for i in np.unique(cell_indices).tolist()]
         done = False
         maximum_iterations = 100
         iteration_count = 0
         last_remaining = 0
 
         while not done:
+            start = time.perf_counter()
             remaining = 0
-            for entry in image_data.items:
+            for entry in entries:
                 if entry.passes < entry.desired_passes:
+                    check_stop(self.should_stop)
+                    if limits.poll(image_data):
+                        break
                     remaining += entry.desired_passes - entry.passes
                     image_data.create_best_fit_line(entry)
 
             maximum_iterations -= 1
+            limits.snapshot(image_data)
+            if stats is not None:
+                stats.add_iteration(time.perf_counter() - start, remaining)
 
-            if remaining == 0:
+            if limits.exhausted:
+                done = True
+            elif remaining == 0:
                 done = True
             elif remaining == last_remaining:
                 done = True
@@ -143,31 +517,7 @@ class LineArtGenerator:
                 done = True
 
             iteration_count += 1
-            if not done:
+            if not done and self.debug:
                 print(f"iterations = {iteration_count}, remaining = {remaining}")
 
             last_remaining = remaining
-
-        for line in image_data.lines:
-            dwg.add(
-                dwg.line(
-                    line.p1,
-                    line.p2,
-                    stroke=svgwrite.rgb(line.ci[0], line.ci[1], line.ci[2]),
-                    stroke_width=1,
-                )
-            )
-
-        if self.debug:
-            # output our svg image as raw xml
-            print(dwg.tostring())
-
-        # write svg file to disk
-        dwg.save()
-
-        if self.export_png_path:
-            if pathlib.Path(output_path).exists():
-                drawing = svg2rlg(output_path)
-                renderPM.drawToFile(
-                    drawing, self.export_png_path, fmt="PNG", bg=0x00FFFFFF
-                )
@@ -0,0 +1,158 @@
+import os
+import pathlib
+import numpy as np
+from .image_data import convert_rgb_array_to_lab
+from .image_point import EndpointList, EndpointStore
+from .palette import Palette
+from .raster_renderer import get_stroke_color
+from .string_line import StringLine
+
+# one accepted line: its endpoints (indices into endpoints.npy), the stroke
+# color the SVG uses, its position in acceptance order and where it came from
+LineDtype = np.dtype(
+    [
+        ("p1", "<i4"),
+        ("p2", "<i4"),
+        ("color", "u1", (3,)),
+        ("order", "<u4"),
+        ("line_index", "<i8"),
+        ("cell_index", "<i4"),
+    ]
+)
+
+EndpointDtype = np.dtype(
+    [
+        ("x_index", "<i4"),
+        ("y_index", "<i4"),
+        ("location", "<i8", (2,)),
+        ("edges", "u1"),
+    ]
+)
+
+
+def get_line_array(image_data):
+    """The accepted lines of image_data as a LineDtype array, in order."""
+    lines = image_data.lines
+    array = np.zeros(len(lines), dtype=LineDtype)
+    if not lines:
+        return array
+    line_indices = np.array([line.line_index for line in lines], dtype=np.int64)
+    array["p1"], array["p2"] = image_data.endpoint_combinations.get_pair_indices(
+        line_indices
+    )
+    array["color"] = [get_stroke_color(line.ci) for line in lines]
+    array["order"] = np.arange(len(lines))
+    array["line_index"] = line_indices
+    array["cell_index"] = [line.cell_index for line in lines]
+    return array
+
+
+def get_endpoint_array(image_data):
+    store = image_data.endpoint_store
+    array = np.zeros(store.count, dtype=EndpointDtype)
+    for name in EndpointDtype.names:
+        array[name] = getattr(store, name)[: store.count]
+    return array
+
+
+def save_array(path, array):
+    # write next to the target and rename, readers never see a partial file
+    work = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(work, "wb") as file:
+            np.save(file, array)
+        os.replace(work, path)
+    finally:
+        if work.exists():
+            work.unlink()
+
+
+def save_lines(image_data, path):
+    """
+    Write the accepted lines of image_data to the directory path as
+    lines.npy (LineDtype) and endpoints.npy (EndpointDtype), plus the palette
+    colors as palette.npy when image_data has a palette, replacing an earlier
+    export there.
+    """
+    path = pathlib.Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    save_array(path / "endpoints.npy", get_endpoint_array(image_data))
+    save_array(path / "lines.npy", get_line_array(image_data))
+    if image_data.palette is not None:
+        save_array(path / "palette.npy", image_data.palette.rgb.astype(np.uint8))
+    elif (path / "palette.npy").exists():
+        (path / "palette.npy").unlink()
+
+
+def load_lines(path, mmap_mode="r"):
+    """Open a save_lines directory as a LineDrawing, memory-mapped by default."""
+    path = pathlib.Path(path)
+    lines = np.load(path / "lines.npy", mmap_mode=mmap_mode)
+    endpoints = np.load(path / "endpoints.npy", mmap_mode=mmap_mode)
+    if lines.dtype != LineDtype or endpoints.dtype != EndpointDtype:
+        raise ValueError(f"{path} is not a line export")
+    drawing = LineDrawing(lines, endpoints)
+    if (path / "palette.npy").exists():
+        rgb = np.load(path / "palette.npy").astype(np.float64)
+        drawing.palette = Palette(rgb, convert_rgb_array_to_lab(rgb), None)
+    return drawing
+
+
+class LineDrawing:
+    """
+    Exported lines with the attributes of ImageData that
+    LineArtGenerator.write_svg and write_png read, so they render again
+    without the converter.
+
+    line_array and the endpoint store fields are views of the (possibly
+    memory-mapped) arrays; lines builds StringLines from them when accessed.
+    palette is the Palette of the export (without cell_colors) or None, it
+    makes write_svg group the strokes like for the original conversion.
+    """
+
+    def __init__(self, line_array, endpoint_array) -> None:
+        self.line_array = line_array
+        self.endpoint_array = endpoint_array
+        self.endpoint_store = EndpointStore(0)
+        self.endpoint_store.count = len(endpoint_array)
+        for name in EndpointDtype.names:
+            setattr(self.endpoint_store, name, endpoint_array[name])
+        self.endpoints = EndpointList(self.endpoint_store)
+        self.palette = None
+
+    def __len__(self):
+        return len(self.line_array)
+
+    @property
+    def size(self):
+        """The SVG size, the endpoints span the whole drawing."""
+        if self.endpoint_store.count == 0:
+            return (0, 0)
+        return tuple(self.endpoint_store.location.max(axis=0).tolist())
+
+    @property
+    def lines(self):
+        store = self.endpoint_store
+        lines = []
+        for p1, p2, color, line_index, cell_index in zip(
+            self.line_array["p1"].tolist(),
+            self.line_array["p2"].tolist(),
+            self.line_array["color"].tolist(),
+            self.line_array["line_index"].tolist(),
+            self.line_array["cell_index"].tolist(),
+        ):
+            key = (
+                f"{store.x_index[p1]}_{store.y_index[p1]}"
+                f"_{store.x_index[p2]}_{store.y_index[p2]}"
+            )
+            lines.append(
+                StringLine(
+                    key,
+                    tuple(store.location[p1].tolist()),
+                    tuple(store.location[p2].tolist()),
+                    tuple(color),
+                    line_index,
+                    cell_index,
+                )
+            )
+        return lines
@@ -0,0 +1,140 @@
+import numpy as np
+from .image_data import (
+    DeltaEGoodThreshold,
+    WhiteThreshold,
+    convert_rgb_array_to_lab,
+    convert_rgb_array_to_luminance,
+)
+
+# (colors x palette entries) distances computed at a time while assigning
+AssignChunkSize = 1 << 20
+
+
+def get_distances(lab, centers):
+    d = lab[:, np.newaxis, :] - centers[np.newaxis, :, :]
+    return np.sqrt(
+        d[..., 0] * d[..., 0] + d[..., 1] * d[..., 1] + d[..., 2] * d[..., 2]
+    )
+
+
+def assign(lab, centers):
+    """Index of the nearest center for every Lab color."""
+    step = max(AssignChunkSize // max(len(centers), 1), 1)
+    return np.concatenate(
+        [
+            get_distances(lab[start : start + step], centers).argmin(axis=1)
+            for start in range(0, len(lab), step)
+        ]
+    )
+
+
+def fit_kmeans(lab, weights, size, iterations=20, seed=0):
+    """
+    Weighted k-means of Lab colors with k-means++ seeding, returns the
+    (size, 3) centers and the center index of every color.
+    """
+    rng = np.random.default_rng(seed)
+    probabilities = weights / weights.sum()
+    centers = [lab[rng.choice(len(lab), p=probabilities)]]
+    closest = get_distances(lab, np.array(centers))[:, 0] ** 2
+    while len(centers) < size:
+        spread = weights * closest
+        if spread.sum() <= 0:
+            break
+        center = lab[rng.choice(len(lab), p=spread / spread.sum())]
+        centers.append(center)
+        closest = np.minimum(closest, get_distances(lab, center[np.newaxis])[:, 0] ** 2)
+    centers = np.array(centers)
+
+    labels = None
+    for _ in range(iterations):
+        new_labels = assign(lab, centers)
+        if labels is not None and np.array_equal(labels, new_labels):
+            break
+        labels = new_labels
+        totals = np.bincount(labels, weights, minlength=len(centers))
+        for channel in range(3):
+            sums = np.bincount(labels, weights * lab[:, channel], len(centers))
+            # an empty cluster keeps its center
+            np.divide(sums, totals, out=centers[:, channel], where=totals > 0)
+    return centers, labels
+
+
+class Palette:
+    """
+    The colors cells are quantized to, with the palette x palette ΔE matrix.
+
+    rgb holds integer 0-255 colors and lab their Lab values, good is
+    delta_e < DeltaEGoodThreshold so line scoring can look fits up by the
+    cell_colors (palette index) of two cells instead of computing ΔE.
+    """
+
+    def __init__(self, rgb, lab, cell_colors) -> None:
+        self.rgb = rgb
+        self.lab = lab
+        self.cell_colors = cell_colors
+        self.delta_e = get_distances(lab, lab)
+        self.good = self.delta_e < DeltaEGoodThreshold
+
+    def __len__(self):
+        return len(self.rgb)
+
+
+def apply_palette(image_data, size, iterations=20, seed=0):
+    """
+    Quantize the opaque cell colors of image_data to at most size colors with
+    k-means in Lab, replacing their ci, lab and luminance by the palette
+    entry, and set image_data.palette. The desired and maximum passes are
+    recomputed from the palette color like insert_cell does, so a cell that
+    snapped across WhiteThreshold gets the passes of its new color. Transparent
+    cells share one extra entry with their Lab (0, 0, 0).
+    """
+    cells = image_data.cells
+    count = cells.count
+    opaque = np.nonzero(~cells.is_transparent[:count])[0]
+
+    rgb = np.zeros((0, 3))
+    labels = np.zeros(0, dtype=np.int64)
+    if len(opaque):
+        colors, inverse, weights = np.unique(
+            cells.ci[opaque, :3], axis=0, return_inverse=True, return_counts=True
+        )
+        inverse = inverse.reshape(-1)
+        lab = convert_rgb_array_to_lab(colors)
+        if len(colors) <= size:
+            color_labels = np.arange(len(colors))
+        else:
+            _, color_labels = fit_kmeans(
+                lab, weights.astype(np.float64), size, iterations, seed
+            )
+        # the palette color of a cluster is the mean RGB of its cells
+        color_labels = np.unique(color_labels, return_inverse=True)[1].reshape(-1)
+        totals = np.bincount(color_labels, weights)
+        rgb = np.stack(
+            [
+                np.bincount(color_labels, weights * colors[:, channel]) / totals
+                for channel in range(3)
+            ],
+            axis=1,
+        )
+        rgb = np.round(rgb)
+        labels = color_labels[inverse]
+
+    palette_lab = convert_rgb_array_to_lab(rgb) if len(rgb) else np.zeros((0, 3))
+    cell_colors = np.full(count, len(rgb), dtype=np.int64)
+    cell_colors[opaque] = labels
+    if len(opaque) < count:
+        rgb = np.concatenate([rgb, np.zeros((1, 3))])
+        palette_lab = np.concatenate([palette_lab, np.zeros((1, 3))])
+
+    cells.ci[opaque, :3] = rgb[labels]
+    cells.lab[opaque] = palette_lab[labels]
+    if len(opaque):
+        luminance = convert_rgb_array_to_luminance(rgb[labels])
+        desired_passes = np.round((1.0 - luminance) * image_data.passes_scaler)
+        desired_passes[palette_lab[labels, 0] > WhiteThreshold] = 0
+        cells.luminance[opaque] = luminance
+        cells.desired_passes[opaque] = desired_passes
+        cells.maximum_passes[opaque] = desired_passes * 2 + 4
+    image_data.palette = Palette(rgb, palette_lab, cell_colors)
+    return image_data.palette
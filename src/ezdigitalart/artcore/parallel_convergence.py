@@ -0,0 +1,275 @@
+import concurrent.futures
+import contextlib
+import pathlib
+import tempfile
+import time
+import numpy as np
+from .anytime import AnytimeLimits
+from .cancellation import check_stop
+from .conversion_stats import ConversionStats
+from .image_cell import ImageCell
+
+# the ImageData each worker process scores against and the memory-mapped
+# state it copies at the start of every round, set once by the initializer
+worker_image_data = None
+worker_state = None
+
+# ImageData arrays the parent keeps in memory-mapped files while the workers
+# run, (owner, attribute) pairs
+SharedArrays = (("cells", "passes"), ("cells", "last_index"), (None, "line_used"))
+
+
+def initialize_worker(image_data, state_dir, collect_stats=False):
+    global worker_image_data, worker_state
+    worker_image_data = image_data
+    worker_image_data.stats = ConversionStats() if collect_stats else None
+    worker_state = []
+    for owner_name, name in SharedArrays:
+        owner = getattr(image_data, owner_name) if owner_name else image_data
+        # private arrays to score against, a forked worker would otherwise
+        # write to the parent's mapped ones
+        setattr(owner, name, np.array(getattr(owner, name)))
+        shared = np.load(pathlib.Path(state_dir) / f"{name}.npy", mmap_mode="r")
+        worker_state.append((getattr(owner, name), shared))
+
+
+def propose_lines(cell_indices):
+    """
+    Run create_best_fit_line for one tile of cells against the shared state at
+    the start of the round and return the accepted lines in order, as an
+    array of (cell_index, line_index) rows, with the worker's counters when it
+    collects stats.
+    """
+    image_data = worker_image_data
+    for private, shared in worker_state:
+        private[:] = shared
+    image_data.lines = []
+    image_data.line_lookup = dict()
+
+    for cell_index in cell_indices:
+        entry = ImageCell(image_data.cells, cell_index)
+        if entry.passes < entry.desired_passes:
+            image_data.create_best_fit_line(entry)
+
+    counters = None
+    if image_data.stats is not None:
+        # lines_accepted is counted when the proposals are reconciled
+        counters = {
+            "candidates_examined": image_data.stats.counters["candidates_examined"],
+            "lines_rejected_bad_fit": image_data.stats.counters[
+                "lines_rejected_bad_fit"
+            ],
+        }
+        image_data.stats = ConversionStats()
+
+    proposals = np.array(
+        [(line.cell_index, line.line_index) for line in image_data.lines],
+        dtype=np.int64,
+    )
+    return proposals.reshape(-1, 2), counters
+
+
+def get_cell_tiles(image_data, tile_count):
+    """Assign every cell to one of tile_count vertical bands of columns."""
+    columns = image_data.cells.cell_indices[: image_data.cells.count, 0]
+    bounds = np.linspace(0, image_data.max_x_index + 1, tile_count + 1)[1:-1]
+    return np.searchsorted(bounds, columns, side="right")
+
+
+@contextlib.contextmanager
+def shared_state(image_data):
+    """
+    Move the SharedArrays of image_data into memory-mapped .npy files in a
+    temporary directory for the duration, and yield that directory. The
+    workers read the state from them instead of receiving copies every round.
+    """
+    with tempfile.TemporaryDirectory(prefix="ezdigitalart-") as state_dir:
+        owners = []
+        for owner_name, name in SharedArrays:
+            owner = getattr(image_data, owner_name) if owner_name else image_data
+            array = getattr(owner, name)
+            shared = np.lib.format.open_memmap(
+                pathlib.Path(state_dir) / f"{name}.npy",
+                mode="w+",
+                dtype=array.dtype,
+                shape=array.shape,
+            )
+            shared[:] = array
+            setattr(owner, name, shared)
+            owners.append((owner, name))
+        try:
+            yield state_dir
+        finally:
+            for owner, name in owners:
+                setattr(owner, name, np.array(getattr(owner, name)))
+
+
+def get_passes_before(cells, proposal_of, adds):
+    """
+    For every (proposal, cell) incidence, the passes the earlier proposals add
+    to the same cell: adds (0 or 1 per incidence) summed over the incidences
+    of the cell with a smaller proposal number.
+    """
+    order = np.lexsort((proposal_of, cells))
+    sorted_cells = cells[order]
+    sorted_adds = adds[order].astype(np.int64)
+    running = np.cumsum(sorted_adds) - sorted_adds
+    group_starts = np.nonzero(np.r_[True, sorted_cells[1:] != sorted_cells[:-1]])[0]
+    group_sizes = np.diff(np.r_[group_starts, len(sorted_cells)])
+    running -= np.repeat(running[group_starts], group_sizes)
+    before = np.zeros(len(cells), dtype=np.int64)
+    before[order] = running
+    return before
+
+
+def replay_proposals(image_data, proposals, stats=None):
+    """
+    Accept the proposals of one round, in order, with one vectorized check
+    instead of a try_accept_line call per line.
+
+    The check assumes every earlier proposal is accepted, so a line is kept
+    only if no cell it is a bad fit for would reach its maximum_passes even
+    then; the serial rule can only see fewer passes. Likewise the lines of a
+    cell are skipped when the earlier proposals could already have satisfied
+    it. Lines proposed twice are kept once. Returns the number of lines kept.
+    """
+    cells = image_data.cells
+    if len(proposals) == 0:
+        return 0
+    owners = proposals[:, 0]
+    line_indices = proposals[:, 1]
+
+    indptr = image_data.line_cell_indptr
+    counts = indptr[line_indices + 1] - indptr[line_indices]
+    starts = np.zeros(len(proposals), dtype=np.int64)
+    np.cumsum(counts[:-1], out=starts[1:])
+    flat = np.arange(int(counts.sum())) + np.repeat(
+        indptr[line_indices] - starts, counts
+    )
+    crossed = image_data.line_cell_indices[flat].astype(np.int64)
+    proposal_of = np.repeat(np.arange(len(proposals)), counts)
+    good = image_data.get_good_fits(crossed, owners[proposal_of])
+    before = get_passes_before(crossed, proposal_of, good)
+
+    passes = cells.passes[crossed] + before
+    bad = ~good & (passes + 1 >= cells.maximum_passes[crossed])
+    fits = np.ones(len(proposals), dtype=bool)
+    np.logical_and.at(fits, proposal_of, ~bad)
+
+    # like the serial loop, a cell that earlier proposals already satisfied
+    # adds no lines of its own; its lines come in one run per worker
+    first = np.r_[True, owners[1:] != owners[:-1]]
+    own = good & (crossed == owners[proposal_of])
+    owner_passes = np.zeros(len(proposals), dtype=np.int64)
+    owner_passes[proposal_of[own]] = passes[own]
+    run_starts = np.nonzero(first)[0]
+    run_passes = np.repeat(
+        owner_passes[run_starts], np.diff(np.r_[run_starts, len(proposals)])
+    )
+    active = run_passes < cells.desired_passes[owners]
+
+    unique = np.zeros(len(proposals), dtype=bool)
+    unique[np.unique(line_indices, return_index=True)[1]] = True
+    accepted = fits & active & unique & ~image_data.line_used[line_indices]
+    if stats is not None:
+        stats.count("lines_rejected_bad_fit", int((active & ~fits).sum()))
+
+    for cell_index, line_index in proposals[accepted].tolist():
+        image_data.accept_line(ImageCell(cells, cell_index), line_index)
+    np.add.at(cells.passes, crossed[np.repeat(accepted, counts) & good], 1)
+    return int(accepted.sum())
+
+
+def converge_parallel(
+    image_data,
+    workers,
+    maximum_iterations=100,
+    stats=None,
+    should_stop=None,
+    limits=None,
+    debug=False,
+    cell_indices=None,
+):
+    """
+    Parallel version of the LineArtGenerator convergence loop.
+
+    Every round the unsatisfied cells are split into one tile per worker. The
+    workers propose lines for their tile from the same state, which they read
+    from memory-mapped files (see shared_state) rather than receiving it. The
+    proposals of all tiles are then checked together in tile order by
+    replay_proposals, which drops lines another tile already took or that may
+    no longer fit.
+
+    The lines depend on the worker count, as it decides the tiles, but not on
+    timing: the same image, settings and worker count always give the same
+    lines. They differ from the serial converge and between worker counts.
+
+    stats (a ConversionStats) receives one entry per iteration and the counters
+    of the workers, should_stop is polled before every round. limits
+    (AnytimeLimits) is polled before every round, a round already handed to
+    the workers is not interrupted and lines past max_lines are trimmed at
+    the end. debug prints the progress of every round. cell_indices restricts
+    the rounds to those cells.
+    """
+    if limits is None:
+        limits = AnytimeLimits()
+    cells = image_data.cells
+    count = cells.count
+    tiles = get_cell_tiles(image_data, workers)
+    selected = np.ones(count, dtype=bool)
+    if cell_indices is not None:
+        selected[:] = False
+        selected[cell_indices] = True
+
+    with shared_state(image_data) as state_dir, concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=initialize_worker,
+        initargs=(image_data, state_dir, stats is not None),
+    ) as executor:
+        done = False
+        iteration_count = 0
+        last_remaining = 0
+
+        while not done:
+            check_stop(should_stop)
+            if limits.poll(image_data):
+                break
+            start = time.perf_counter()
+            deficit = cells.desired_passes[:count] - cells.passes[:count]
+            unsatisfied = (deficit > 0) & selected
+            remaining = int(deficit[unsatisfied].sum())
+
+            futures = [
+                executor.submit(
+                    propose_lines,
+                    np.nonzero(unsatisfied & (tiles == tile))[0].tolist(),
+                )
+                for tile in range(workers)
+            ]
+            proposals = []
+            for future in futures:
+                tile_proposals, counters = future.result()
+                if counters is not None:
+                    stats.merge_counters(counters)
+                proposals.append(tile_proposals)
+            replay_proposals(image_data, np.concatenate(proposals), stats)
+
+            maximum_iterations -= 1
+            limits.snapshot(image_data)
+            if stats is not None:
+                stats.add_iteration(time.perf_counter() - start, remaining)
+
+            if remaining == 0:
+                done = True
+            elif remaining == last_remaining:
+                done = True
+            elif maximum_iterations <= 0:
+                done = True
+
+            iteration_count += 1
+            if not done and debug:
+                print(f"iterations = {iteration_count}, remaining = {remaining}")
+
+            last_remaining = remaining
+
+    limits.trim(image_data)
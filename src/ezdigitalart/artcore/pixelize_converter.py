@@ -1,33 +1,25 @@
-from PIL import Image
+import contextlib
 import math
-import svgwrite
-from svglib.svglib import svg2rlg
-from reportlab.graphics import renderPDF, renderPM
+import numpy as np
 import pathlib
-
-
-def get_average_rgb_square(pxa, image_width, image_height, x_start, y_start, width):
-    num = 0
-    r = 0
-    g = 0
-    b = 0
-    for x_offset in range(width):
-        for y_offset in range(width):
-            x = x_start + x_offset
-            y = y_start + y_offset
-
-            if x >= 0 and x < image_width and y >= 0 and y < image_height:
-                ci = pxa[x, y]
-                r += ci[0] * ci[0]
-                g += ci[1] * ci[1]
-                b += ci[2] * ci[2]
-                num += 1
-
-    # Return the sqrt of the mean of squared R, G, and B sums
-    if num:
-        return (math.sqrt(r / num), math.sqrt(g / num), math.sqrt(b / num))
-    else:
-        return None
+from .grid_sampler import (
+    get_image_pixels,
+    open_source_image,
+    get_average_rgb_grid,
+    iter_average_rgb_bands,
+    iter_pixel_bands,
+)
+from .cancellation import check_stop
+from .conversion_stats import ConversionStats, stage
+from .result_cache import ResultCache
+from .tiled_input import LargeImagePixels, TiledImage
+from .svg_writer import open_svg_writer, rgb
+from .raster_renderer import (
+    PngStreamWriter,
+    check_png_backend,
+    get_grid_row,
+    render_grid,
+)
 
 
 class PixelizeConverter:
@@ -37,9 +29,63 @@ class PixelizeConverter:
         self.export_png_path = None
         self.debug = False
 
-    def convert(self, input_path, output_path):
-        im = Image.open(input_path)
-        px = im.load()
+        # "stream" writes SVG elements straight to disk, "svgwrite" builds a DOM;
+        # compress_svg writes gzip (None: only for a .svgz output_path)
+        self.svg_backend = "stream"
+        self.compress_svg = None
+
+        # "raster" writes the PNG straight from the sampled grid with Pillow,
+        # "reportlab" renders the SVG file
+        self.png_backend = "raster"
+
+        # "full" decodes the source at once, "tiled" reads it in strips of
+        # about strip_height rows (memory-mapped or reduced where possible)
+        self.input_mode = "full"
+        self.strip_height = 2048
+
+        # pixel limit of tiled input (None for none), it bypasses Pillow's
+        # decompression bomb check for trusted large scans
+        self.max_input_pixels = LargeImagePixels
+
+        # directory of a ResultCache keyed by the decoded pixels and settings,
+        # trimmed to result_cache_size bytes; on a hit convert returns the
+        # ConversionStats stored with the entry when it would return any
+        self.result_cache_dir = None
+        self.result_cache_size = 1 << 30
+
+        # write each row of cells to the SVG and PNG as soon as its band of
+        # source rows is sampled (stream SVG backend and raster PNG only). The
+        # source is still decoded whole unless input_mode is "tiled", only
+        # the output side streams then
+        self.streaming = False
+
+        # opt-in stage timings, see LineArtGenerator
+        self.collect_stats = False
+        self.stats_callback = None
+
+        # optional callable polled between stages, columns and streamed bands,
+        # when it returns True convert raises ConversionCancelled
+        self.should_stop = None
+
+    def convert(self, input_path, output_path=None):
+        if self.result_cache_dir is not None:
+            cache = ResultCache(self.result_cache_dir, self.result_cache_size)
+            return cache.convert(self, input_path, output_path, self.convert_uncached)
+        return self.convert_uncached(input_path, output_path)
+
+    def convert_uncached(self, input_path, output_path=None):
+        """Returns a ConversionStats when collect_stats or stats_callback is set."""
+        check_png_backend(self.png_backend, self.export_png_path, output_path)
+        stats = None
+        if self.collect_stats or self.stats_callback:
+            stats = ConversionStats(self.stats_callback)
+
+        if self.input_mode == "tiled":
+            im = TiledImage(input_path, self.strip_height, self.max_input_pixels)
+        elif self.input_mode == "full":
+            im = open_source_image(input_path)
+        else:
+            raise ValueError(f"unknown input mode: {self.input_mode}")
 
         w = im.width
         h = im.height
@@ -48,28 +94,119 @@ class PixelizeConverter:
         size_per_pixel = p_x if p_x > p_y else p_y
         regions_x = math.ceil(w / size_per_pixel)
         regions_y = math.ceil(h / size_per_pixel)
-        dwg = svgwrite.Drawing(output_path, profile="tiny", size=(regions_x, regions_y))
 
-        for x in range(regions_x):
-            for y in range(regions_y):
-                ci = get_average_rgb_square(
-                    px, w, h, x * size_per_pixel, y * size_per_pixel, size_per_pixel
+        if self.streaming:
+            # sampling and export are interleaved, time them as one stage
+            with stage(stats, "streaming"):
+                self.convert_streaming(
+                    im, size_per_pixel, regions_x, regions_y, output_path
                 )
-                if ci is not None:
-                    dwg.add(
-                        dwg.rect((x, y), (1, 1), fill=svgwrite.rgb(ci[0], ci[1], ci[2]))
-                    )
+            return stats
+
+        check_stop(self.should_stop)
+        with stage(stats, "sampling"):
+            if self.input_mode == "tiled":
+                grid = im.get_average_rgb_grid(size_per_pixel, regions_x, regions_y)
+            else:
+                grid = get_average_rgb_grid(
+                    get_image_pixels(im), size_per_pixel, regions_x, regions_y
+                )
+
+        svg_size = (regions_x, regions_y)
+
+        check_stop(self.should_stop)
+        if output_path is not None:
+            with stage(stats, "svg_export"):
+                self.write_svg(grid, output_path, svg_size)
+
+        check_stop(self.should_stop)
+        if self.export_png_path:
+            with stage(stats, "png_export"):
+                self.write_png(grid, output_path)
+
+        return stats
+
+    def write_svg(self, grid, output_path, svg_size):
+        regions_x, regions_y = svg_size
+        # write svg file to disk
+        with open_svg_writer(
+            output_path,
+            svg_size,
+            backend=self.svg_backend,
+            compress=self.compress_svg,
+            keep_text=self.debug,
+        ) as dwg:
+            for x in range(regions_x):
+                check_stop(self.should_stop)
+                for y in range(regions_y):
+                    ci = grid.get_color(x, y)
+                    if ci is not None:
+                        dwg.rect((x, y), (1, 1), fill=rgb(ci[0], ci[1], ci[2]))
 
         if self.debug:
             # output our svg image as raw xml
             print(dwg.tostring())
 
-        # write svg file to disk
-        dwg.save()
+    def write_png(self, grid, output_path):
+        if self.png_backend == "raster" or output_path is None:
+            im = render_grid(grid)
+            im.save(self.export_png_path, format="PNG")
+        elif not hasattr(output_path, "write") and pathlib.Path(output_path).exists():
+            # svglib and reportlab are slow to import, only load them when used
+            from reportlab.graphics import renderPM
+            from svglib.svglib import svg2rlg
 
-        if self.export_png_path:
-            if pathlib.Path(output_path).exists():
-                drawing = svg2rlg(output_path)
-                renderPM.drawToFile(
-                    drawing, self.export_png_path, fmt="PNG", bg=0x00FFFFFF
+            drawing = svg2rlg(output_path)
+            renderPM.drawToFile(drawing, self.export_png_path, fmt="PNG", bg=0x00FFFFFF)
+
+    def convert_streaming(self, im, size_per_pixel, regions_x, regions_y, output_path):
+        """
+        Sample the source band by band and emit each finished row of cells
+        right away, so only one band of the outputs is held in memory. With
+        input_mode "full" the bands are views of the fully decoded source,
+        only tiled input also keeps the source to about one band. The rects
+        come out in row order instead of column order.
+        """
+        if self.svg_backend != "stream" or self.png_backend != "raster":
+            raise ValueError("streaming needs the stream svg and raster png backends")
+
+        if self.input_mode == "tiled":
+            cell_size, bands = im.get_cell_bands(size_per_pixel)
+        else:
+            cell_size = size_per_pixel
+            bands = iter_pixel_bands(get_image_pixels(im), size_per_pixel)
+
+        with contextlib.ExitStack() as stack:
+            dwg = None
+            if output_path is not None:
+                dwg = stack.enter_context(
+                    open_svg_writer(
+                        output_path,
+                        (regions_x, regions_y),
+                        compress=self.compress_svg,
+                        keep_text=self.debug,
+                    )
+                )
+            png = None
+            if self.export_png_path:
+                png = stack.enter_context(
+                    PngStreamWriter(self.export_png_path, (regions_x, regions_y))
                 )
+
+            for y, colors, valid, _ in iter_average_rgb_bands(bands, cell_size):
+                check_stop(self.should_stop)
+                if y >= regions_y:
+                    break
+                colors = colors[:regions_x]
+                valid = valid[:regions_x]
+                if dwg is not None:
+                    columns = np.nonzero(valid)[0]
+                    dwg.unit_rects(y, columns, colors[columns])
+                    dwg.flush()
+                if png is not None:
+                    png.write_rows(get_grid_row(colors, valid)[None])
+                    png.flush()
+
+        if dwg is not None and self.debug:
+            # output our svg image as raw xml
+            print(dwg.tostring())
@@ -0,0 +1,80 @@
+import heapq
+import time
+import numpy as np
+from .anytime import AnytimeLimits
+from .cancellation import check_stop
+from .image_cell import ImageCell
+from .image_data import WhiteThreshold
+
+
+def get_deficits(cells):
+    count = cells.count
+    return cells.desired_passes[:count] - cells.passes[:count]
+
+
+def converge_priority(
+    image_data, stats=None, should_stop=None, limits=None, cell_indices=None
+):
+    """
+    Work queue version of the LineArtGenerator convergence loop.
+
+    Unsatisfied cells are kept in a heap keyed by their remaining passes, the
+    largest deficit first. Keys are refreshed lazily: accepting a line only
+    changes the passes of the cells it crosses, so a popped cell whose deficit
+    changed since it was pushed goes back with its current deficit, and one
+    that got satisfied meanwhile is dropped. A cell that gains no line is
+    retired, as passes and used lines only grow it could not gain one later.
+    White cells never get lines and are not queued at all.
+
+    The cells are visited in a different order than the rounds of converge, so
+    the lines differ. stats (a ConversionStats) receives the queue as a single
+    iteration, should_stop is polled before every cell.
+
+    limits (AnytimeLimits) is polled before every cell and can stop the queue
+    early, it takes a snapshot at the end. cell_indices restricts the queue to
+    those cells (a warm start only re-evaluating some of them).
+    """
+    if limits is None:
+        limits = AnytimeLimits()
+    start = time.perf_counter()
+    cells = image_data.cells
+    deficits = get_deficits(cells)
+    remaining = int(deficits[deficits > 0].sum())
+
+    queued = (deficits > 0) & (cells.lab[: cells.count, 0] < WhiteThreshold)
+    if cell_indices is not None:
+        selected = np.zeros(cells.count, dtype=bool)
+        selected[cell_indices] = True
+        queued &= selected
+    heap = [
+        (-int(deficits[cell_index]), cell_index)
+        for cell_index in np.nonzero(queued)[0].tolist()
+    ]
+    heapq.heapify(heap)
+
+    passes = cells.passes
+    desired_passes = cells.desired_passes
+    while heap:
+        key, cell_index = heapq.heappop(heap)
+        deficit = int(desired_passes[cell_index] - passes[cell_index])
+        if deficit <= 0:
+            continue
+        if deficit != -key:
+            heapq.heappush(heap, (-deficit, cell_index))
+            continue
+
+        check_stop(should_stop)
+        if limits.poll(image_data):
+            break
+        line_count = len(image_data.lines)
+        image_data.create_best_fit_line(ImageCell(cells, cell_index))
+        if len(image_data.lines) == line_count:
+            continue
+
+        deficit = int(desired_passes[cell_index] - passes[cell_index])
+        if deficit > 0:
+            heapq.heappush(heap, (-deficit, cell_index))
+
+    limits.snapshot(image_data)
+    if stats is not None:
+        stats.add_iteration(time.perf_counter() - start, remaining)
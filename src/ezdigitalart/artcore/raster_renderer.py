@@ -0,0 +1,155 @@
+import struct
+import zlib
+import numpy as np
+from PIL import Image, ImageDraw
+
+WhiteBackground = (255, 255, 255)
+
+# svgwrite.rgb(15, 15, 15, "%") used for the endpoint circles
+EndpointStroke = (38, 38, 38)
+
+
+def check_png_backend(png_backend, png_path, output_path):
+    """
+    Raise ValueError when a PNG is asked for with the "reportlab" backend,
+    which reads the SVG back from disk, but the SVG goes to a file object.
+    """
+    if png_path and png_backend == "reportlab" and hasattr(output_path, "write"):
+        raise ValueError("png_backend 'reportlab' needs an SVG output path")
+
+
+def get_stroke_color(ci):
+    # the SVG output writes colors through rgb(), which truncates like this
+    return (int(ci[0]) & 255, int(ci[1]) & 255, int(ci[2]) & 255)
+
+
+def render_lines(size, lines, endpoints=(), antialias=1, background=WhiteBackground):
+    """
+    Draw StringLines (and the endpoint markers the SVG contains) straight onto
+    a Pillow canvas of size (width, height).
+
+    antialias is a supersampling factor, the canvas is drawn that many times
+    larger and reduced with a box filter. 1 draws aliased 1 pixel lines.
+    """
+    scale = max(int(antialias), 1)
+    im = Image.new("RGB", (size[0] * scale, size[1] * scale), background)
+    draw = ImageDraw.Draw(im)
+
+    radius = scale
+    for endpoint in endpoints:
+        x, y = endpoint.location
+        draw.ellipse(
+            (
+                x * scale - radius,
+                y * scale - radius,
+                x * scale + radius,
+                y * scale + radius,
+            ),
+            fill=WhiteBackground,
+            outline=EndpointStroke,
+        )
+
+    for line in lines:
+        draw.line(
+            (
+                line.p1[0] * scale,
+                line.p1[1] * scale,
+                line.p2[0] * scale,
+                line.p2[1] * scale,
+            ),
+            fill=get_stroke_color(line.ci),
+            width=scale,
+        )
+
+    if scale > 1:
+        im = im.reduce(scale)
+    return im
+
+
+class PngStreamWriter:
+    """
+    Write an 8 bit RGB or RGBA PNG row by row, so an image can be produced
+    (and read by a client) before all of its rows exist. target may be a path
+    or an open binary file, which is left open.
+    """
+
+    def __init__(self, target, size, mode="RGB", level=6) -> None:
+        if hasattr(target, "write"):
+            self.file = target
+            self.owns_file = False
+        else:
+            self.file = open(target, "wb")
+            self.owns_file = True
+
+        self.width, self.height = size
+        self.channels = len(mode)
+        self.rows_written = 0
+        self.compressor = zlib.compressobj(level)
+
+        color_type = {"RGB": 2, "RGBA": 6}[mode]
+        self.file.write(b"\x89PNG\r\n\x1a\n")
+        self.write_chunk(
+            b"IHDR",
+            struct.pack(">IIBBBBB", self.width, self.height, 8, color_type, 0, 0, 0),
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        elif self.owns_file:
+            self.file.close()
+
+    def write_chunk(self, kind, data):
+        self.file.write(struct.pack(">I", len(data)))
+        self.file.write(kind)
+        self.file.write(data)
+        self.file.write(struct.pack(">I", zlib.crc32(kind + data)))
+
+    def write_rows(self, rows):
+        """Append (count, width, channels) uint8 rows below the ones written."""
+        rows = np.asarray(rows, dtype=np.uint8).reshape(len(rows), -1)
+        # every scanline starts with filter type 0 (none)
+        scanlines = np.zeros((len(rows), rows.shape[1] + 1), dtype=np.uint8)
+        scanlines[:, 1:] = rows
+        self.rows_written += len(rows)
+        data = self.compressor.compress(scanlines.tobytes())
+        if data:
+            self.write_chunk(b"IDAT", data)
+
+    def flush(self):
+        data = self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            self.write_chunk(b"IDAT", data)
+        self.file.flush()
+
+    def close(self):
+        if self.file is None:
+            return
+        if self.rows_written != self.height:
+            raise ValueError(
+                f"PNG needs {self.height} rows, {self.rows_written} were written"
+            )
+        self.write_chunk(b"IDAT", self.compressor.flush())
+        self.write_chunk(b"IEND", b"")
+        if self.owns_file:
+            self.file.close()
+        else:
+            self.file.flush()
+        self.file = None
+
+
+def get_grid_row(colors, valid, background=WhiteBackground):
+    """One row of render_grid pixels from the colors and valid flags of a row."""
+    channels = np.asarray(colors).astype(np.int64) & 255
+    return np.where(valid[:, None], channels, background).astype(np.uint8)
+
+
+def render_grid(grid, background=WhiteBackground):
+    """Render a GridSample as one pixel per cell, cells without color stay white."""
+    colors = np.asarray(grid.colors).astype(np.int64) & 255
+    pixels = np.where(grid.valid[..., None], colors, background).astype(np.uint8)
+    # grid arrays are indexed [column, row], images [row, column]
+    return Image.fromarray(np.ascontiguousarray(pixels.transpose(1, 0, 2)), "RGB")
@@ -0,0 +1,251 @@
+import contextlib
+import errno
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import tempfile
+from .conversion_stats import ConversionStats
+from .grid_sampler import get_image_pixels, open_source_image
+from .image_data import (
+    DeltaEBadThreshold,
+    DeltaEGoodThreshold,
+    ImageData,
+    WhiteThreshold,
+)
+from .svg_writer import is_compressed_path
+from .tiled_input import TiledImage, get_raw_strips
+
+# bump when the converters' output for the same settings changes
+ResultFormat = 3
+
+# converter attributes that don't change the output
+IgnoredSettings = (
+    "debug",
+    "export_png_path",
+    "collect_stats",
+    "stats_callback",
+    "should_stop",
+    "geometry_cache_dir",
+    "result_cache_dir",
+    "result_cache_size",
+    "strip_height",
+    "max_input_pixels",
+    "snapshot_path",
+    "snapshot_interval",
+    "snapshot_lines",
+)
+
+SettingTypes = (bool, int, float, str, type(None))
+
+
+def write_output(target, data, text):
+    """Write cached output bytes to a path or an open (text or binary) file."""
+    if hasattr(target, "write"):
+        target.write(data.decode("utf-8") if text else data)
+    else:
+        with open(target, "wb") as file:
+            file.write(data)
+
+
+class ResultCache:
+    """
+    Directory of converter outputs keyed by a hash of the decoded pixels and
+    every setting that affects the output.
+
+    Each entry holds the SVG and/or PNG bytes one conversion wrote, and the
+    ConversionStats it returned (result.json, see ConversionStats.as_dict)
+    when there were any. A hit copies them to the requested targets without
+    running the converter. Entries are built in a temporary directory and
+    renamed into place, and renamed away before they are deleted, so
+    concurrent readers never see a partial one. The entries are evicted
+    least recently used first once they take more than max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes=1 << 30) -> None:
+        self.directory = pathlib.Path(directory)
+        self.max_bytes = max_bytes
+
+    def get_settings(self, converter):
+        settings = {
+            name: value
+            for name, value in vars(converter).items()
+            if name not in IgnoredSettings and isinstance(value, SettingTypes)
+        }
+        image_data = ImageData()
+        settings.update(
+            converter=type(converter).__name__,
+            passes_scaler=image_data.passes_scaler,
+            grid_size=image_data.grid_size,
+            white_threshold=WhiteThreshold,
+            good_threshold=DeltaEGoodThreshold,
+            bad_threshold=DeltaEBadThreshold,
+            format=ResultFormat,
+        )
+        return sorted(settings.items())
+
+    def hash_pixels(self, digest, pixels):
+        digest.update(repr((pixels.shape, pixels.dtype.str)).encode())
+        digest.update(pixels.tobytes())
+
+    def hash_file(self, digest, source):
+        with contextlib.ExitStack() as stack:
+            if hasattr(source, "read"):
+                source.seek(0)
+                file = source
+            else:
+                file = stack.enter_context(open(source, "rb"))
+            for chunk in iter(lambda: file.read(1 << 20), b""):
+                digest.update(chunk)
+
+    def get_key(self, converter, source):
+        """
+        Return (key, source): the entry name and the source to convert, an
+        already decoded image where hashing decoded it.
+        """
+        digest = hashlib.sha256(repr(self.get_settings(converter)).encode())
+        if getattr(converter, "input_mode", "full") == "tiled":
+            position = source.tell() if hasattr(source, "seek") else None
+            im = TiledImage(source, max_pixels=converter.max_input_pixels)
+            if get_raw_strips(im.im) is not None:
+                for band in im.iter_bands(converter.strip_height):
+                    self.hash_pixels(digest, band)
+            else:
+                # decoding a compressed source whole is what tiled input avoids
+                self.hash_file(digest, source)
+            if position is not None:
+                source.seek(position)
+        else:
+            source = open_source_image(source)
+            self.hash_pixels(digest, get_image_pixels(source))
+        return digest.hexdigest()[:32], source
+
+    def convert(self, converter, source, output_path, convert):
+        """
+        Produce the outputs of convert(source, output_path) (the uncached
+        conversion of converter) from the cache, running it on a miss. Returns
+        what convert returns; on a hit that is the stored ConversionStats of
+        the conversion that made the entry, with a result_cache_hits counter
+        of 1 (its stats_callback is not called again), or None when converter
+        collects no stats.
+        """
+        key, source = self.get_key(converter, source)
+        entry = self.directory / key
+
+        # the suffix makes the writer compress just like for output_path
+        svg_name = None
+        if output_path is not None:
+            compressed = not hasattr(output_path, "write") and is_compressed_path(
+                output_path
+            )
+            svg_name = "output.svgz" if compressed else "output.svg"
+        png_path = converter.export_png_path
+        names = [name for name in (svg_name, png_path and "output.png") if name]
+        # an entry made without stats can't answer a caller that wants them
+        wants_stats = getattr(converter, "collect_stats", False) or getattr(
+            converter, "stats_callback", None
+        )
+        if wants_stats:
+            names.append("result.json")
+
+        outputs = self.load(entry, names)
+        if outputs is None:
+            result, outputs = self.store(
+                converter, source, svg_name, png_path, entry, convert
+            )
+            self.evict()
+        else:
+            result = None
+            if wants_stats:
+                result = ConversionStats.from_dict(json.loads(outputs["result.json"]))
+                result.merge_counters({"result_cache_hits": 1})
+
+        if svg_name is not None:
+            write_output(
+                output_path, outputs[svg_name], text=hasattr(output_path, "write")
+            )
+        if png_path:
+            write_output(png_path, outputs["output.png"], text=False)
+        return result
+
+    def load(self, entry, names):
+        """
+        Read the files names of entry, or return None when one is missing
+        (also when evict or store replace the entry meanwhile).
+        """
+        try:
+            outputs = {name: (entry / name).read_bytes() for name in names}
+            os.utime(entry)
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        return outputs
+
+    def store(self, converter, source, svg_name, png_path, entry, convert):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        work = pathlib.Path(tempfile.mkdtemp(dir=self.directory, prefix=".build-"))
+        converter.export_png_path = work / "output.png" if png_path else None
+        try:
+            result = convert(source, work / svg_name if svg_name else None)
+        except BaseException:
+            shutil.rmtree(work, ignore_errors=True)
+            raise
+        finally:
+            converter.export_png_path = png_path
+        if result is not None:
+            (work / "result.json").write_text(json.dumps(result.as_dict()))
+        outputs = {
+            name: (work / name).read_bytes()
+            for name in (svg_name, png_path and "output.png")
+            if name
+        }
+
+        # keep copies of the outputs of an older entry that this conversion
+        # didn't write, the older entry stays whole until it is swapped out
+        try:
+            for path in entry.iterdir():
+                if not (work / path.name).exists():
+                    shutil.copyfile(path, work / path.name)
+        except FileNotFoundError:
+            pass
+        self.retire(entry)
+        try:
+            os.rename(work, entry)
+        except OSError as error:
+            shutil.rmtree(work, ignore_errors=True)
+            # another thread or process stored the same entry first
+            if error.errno not in (errno.EEXIST, errno.ENOTEMPTY):
+                raise
+        return result, outputs
+
+    def retire(self, entry):
+        """
+        Remove an entry by renaming it away first, so a reader sees either the
+        whole entry or none.
+        """
+        trash = pathlib.Path(tempfile.mkdtemp(dir=self.directory, prefix=".trash-"))
+        try:
+            os.rename(entry, trash / entry.name)
+        except FileNotFoundError:
+            pass
+        shutil.rmtree(trash, ignore_errors=True)
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits max_bytes."""
+        entries = []
+        total = 0
+        for entry in self.directory.iterdir():
+            if entry.name.startswith("."):
+                continue
+            try:
+                size = sum(path.stat().st_size for path in entry.iterdir())
+                entries.append((entry.stat().st_mtime, size, entry))
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            total += size
+
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self.retire(entry)
+            total -= size
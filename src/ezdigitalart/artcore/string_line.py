@@ -1,6 +1,10 @@
 class StringLine:
-    def __init__(self, key, p1, p2, ci) -> None:
+    def __init__(self, key, p1, p2, ci, line_index=None, cell_index=None) -> None:
         self.key = key
         self.p1 = p1
         self.p2 = p2
         self.ci = ci
+
+        # the endpoint_combinations entry and the cell that produced the line
+        self.line_index = line_index
+        self.cell_index = cell_index
@@ -0,0 +1,218 @@
+import contextlib
+import gzip
+import io
+import pathlib
+import numpy as np
+
+
+def rgb(r=0, g=0, b=0, mode="RGB"):
+    """Same color strings as svgwrite.rgb."""
+    if mode.upper() == "RGB":
+        return "rgb(%d,%d,%d)" % (int(r) & 255, int(g) & 255, int(b) & 255)
+    elif mode == "%":
+        return "rgb(%d%%,%d%%,%d%%)" % tuple(
+            min(max(float(value), 0), 100) for value in (r, g, b)
+        )
+    else:
+        raise ValueError("Invalid mode '%s'" % mode)
+
+
+def value_to_string(value):
+    # svgwrite rounds floats to 4 digits for the tiny profile
+    if isinstance(value, float):
+        value = round(value, 4)
+    return (
+        str(value)
+        .replace("&", "&amp;")
+        .replace("<", "&lt;")
+        .replace(">", "&gt;")
+        .replace('"', "&quot;")
+    )
+
+
+def is_compressed_path(path):
+    return pathlib.Path(path).suffix.lower() == ".svgz"
+
+
+class SvgStreamWriter:
+    """
+    Write a tiny profile SVG element by element, without building a DOM or
+    validating attributes. The output matches svgwrite.Drawing.save for the
+    elements the converters use. Writes gzip when compress is set, which
+    defaults to True for a .svgz path.
+
+    target may be a path or an open text file, which is left open.
+    """
+
+    def __init__(self, target, size, compress=None, keep_text=False) -> None:
+        if hasattr(target, "write"):
+            self.file = target
+            self.owns_file = False
+        else:
+            if compress is None:
+                compress = is_compressed_path(target)
+            if compress:
+                raw = gzip.GzipFile(target, "wb", mtime=0)
+                self.file = io.TextIOWrapper(raw, encoding="utf-8")
+            else:
+                self.file = open(target, "w", encoding="utf-8")
+            self.owns_file = True
+
+        self.parts = [] if keep_text else None
+        self.file.write('<?xml version="1.0" encoding="utf-8" ?>\n')
+        self.write(
+            "<svg "
+            + self.format_attributes(
+                {
+                    "baseProfile": "tiny",
+                    "height": size[1],
+                    "version": "1.2",
+                    "width": size[0],
+                    "xmlns": "http://www.w3.org/2000/svg",
+                    "xmlns:ev": "http://www.w3.org/2001/xml-events",
+                    "xmlns:xlink": "http://www.w3.org/1999/xlink",
+                }
+            )
+            + "><defs />"
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, text):
+        self.file.write(text)
+        if self.parts is not None:
+            self.parts.append(text)
+
+    def format_attributes(self, attributes):
+        return " ".join(
+            f'{name}="{value_to_string(value)}"'
+            for name, value in sorted(attributes.items())
+            if value is not None and value != ""
+        )
+
+    def element(self, name, **attributes):
+        attributes = {key.replace("_", "-"): value for key, value in attributes.items()}
+        self.write(f"<{name} {self.format_attributes(attributes)} />")
+
+    def rect(self, insert, size, **attributes):
+        self.element(
+            "rect",
+            x=insert[0],
+            y=insert[1],
+            width=size[0],
+            height=size[1],
+            **attributes,
+        )
+
+    def circle(self, center, r, **attributes):
+        self.element("circle", cx=center[0], cy=center[1], r=r, **attributes)
+
+    def line(self, start, end, **attributes):
+        self.element(
+            "line", x1=start[0], y1=start[1], x2=end[0], y2=end[1], **attributes
+        )
+
+    @contextlib.contextmanager
+    def group(self, **attributes):
+        """Write the elements added in the with block inside a <g> element."""
+        attributes = {key.replace("_", "-"): value for key, value in attributes.items()}
+        self.write(f"<g {self.format_attributes(attributes)}>")
+        yield self
+        self.write("</g>")
+
+    def unit_rects(self, y, columns, colors):
+        """
+        Write one 1x1 rect per entry of columns in row y, filled with the
+        matching rgb() color, like rect() would but in a single write.
+        """
+        channels = np.asarray(colors).astype(np.int64) & 255
+        self.write(
+            "".join(
+                f'<rect fill="rgb({r},{g},{b})" height="1" width="1" x="{x}" y="{y}" />'
+                for x, (r, g, b) in zip(np.asarray(columns).tolist(), channels.tolist())
+            )
+        )
+
+    def flush(self):
+        """Push what was written so far to the target, for streaming consumers."""
+        self.file.flush()
+
+    def tostring(self):
+        """The SVG written so far, without the xml header (needs keep_text)."""
+        return "".join(self.parts)
+
+    def close(self):
+        if self.file is None:
+            return
+        self.write("</svg>")
+        if self.owns_file:
+            self.file.close()
+        else:
+            self.file.flush()
+        self.file = None
+
+
+class SvgDrawingWriter:
+    """The SvgStreamWriter interface on top of svgwrite.Drawing."""
+
+    def __init__(self, target, size, compress=None) -> None:
+        import svgwrite
+
+        self.target = target
+        if compress is None and not hasattr(target, "write"):
+            compress = is_compressed_path(target)
+        self.compress = compress
+        self.dwg = svgwrite.Drawing(target, profile="tiny", size=size)
+        self.parent = self.dwg
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+    def rect(self, insert, size, **attributes):
+        self.parent.add(self.dwg.rect(insert, size, **attributes))
+
+    def circle(self, center, r, **attributes):
+        self.parent.add(self.dwg.circle(center=center, r=r, **attributes))
+
+    def line(self, start, end, **attributes):
+        self.parent.add(self.dwg.line(start, end, **attributes))
+
+    @contextlib.contextmanager
+    def group(self, **attributes):
+        parent = self.parent
+        self.parent = parent.add(self.dwg.g(**attributes))
+        try:
+            yield self
+        finally:
+            self.parent = parent
+
+    def tostring(self):
+        return self.dwg.tostring()
+
+    def close(self):
+        if hasattr(self.target, "write"):
+            self.dwg.write(self.target)
+        elif self.compress:
+            with gzip.GzipFile(self.target, "wb", mtime=0) as raw:
+                with io.TextIOWrapper(raw, encoding="utf-8") as file:
+                    self.dwg.write(file)
+        else:
+            self.dwg.save()
+
+
+def open_svg_writer(target, size, backend="stream", compress=None, keep_text=False):
+    """Open an SVG writer for the converters, backend is "stream" or "svgwrite"."""
+    if backend == "stream":
+        return SvgStreamWriter(target, size, compress=compress, keep_text=keep_text)
+    elif backend == "svgwrite":
+        return SvgDrawingWriter(target, size, compress=compress)
+    else:
+        raise ValueError(f"unknown svg backend: {backend}")
@@ -0,0 +1,204 @@
+import math
+import struct
+import numpy as np
+from PIL import Image
+from .grid_sampler import get_average_rgb_grid_from_bands, get_image_pixels
+
+# raw decoder modes that can be read straight from a memory-mapped file:
+# bytes per pixel, the channels giving R, G, B and the alpha channel (or None)
+RawModes = {
+    "L": (1, (0, 0, 0), None),
+    "RGB": (3, (0, 1, 2), None),
+    "BGR": (3, (2, 1, 0), None),
+    "RGBX": (4, (0, 1, 2), None),
+    "BGRX": (4, (2, 1, 0), None),
+    "RGBA": (4, (0, 1, 2), 3),
+    "BGRA": (4, (2, 1, 0), 3),
+}
+
+# largest JPEG DCT scaling Image.draft can apply
+MaximumDraftScale = 8
+
+# default pixel limit of open_large_image, far above Image.MAX_IMAGE_PIXELS
+# but still refusing sizes no scan has
+LargeImagePixels = 1 << 32
+
+
+def open_large_image(path, max_pixels=LargeImagePixels):
+    """
+    Image.open with max_pixels (None for no limit) instead of the process wide
+    Image.MAX_IMAGE_PIXELS decompression bomb check, for trusted large scans.
+    Raises Image.DecompressionBombError for larger images.
+    """
+    if isinstance(path, Image.Image):
+        im = path
+    else:
+        im = open_unchecked(path)
+    if max_pixels is not None and im.width * im.height > max_pixels:
+        im.close()
+        raise Image.DecompressionBombError(
+            f"image size ({im.width * im.height} pixels) exceeds the limit of "
+            f"{max_pixels} pixels"
+        )
+    return im
+
+
+def open_unchecked(path):
+    # the plugin loop of Image.open, which checks the size against the global
+    # limit only after the format factory returned
+    if hasattr(path, "read"):
+        path.seek(0)
+        prefix = path.read(16)
+    else:
+        with open(path, "rb") as file:
+            prefix = file.read(16)
+    Image.init()
+    for format_name in Image.ID:
+        factory, accept = Image.OPEN[format_name]
+        if accept:
+            # accept returns a str for a recognized but unsupported file
+            result = accept(prefix)
+            if not result or isinstance(result, str):
+                continue
+        if hasattr(path, "read"):
+            path.seek(0)
+        try:
+            return factory(path, None)
+        except (SyntaxError, IndexError, TypeError, struct.error):
+            continue
+    raise Image.UnidentifiedImageError(f"cannot identify image file {path!r}")
+
+
+def get_raw_strips(im):
+    """
+    Memory-map the pixel rows of an uncompressed image (BMP, PPM, raw TIFF
+    strips). Returns a list of (y_start, rows) with rows a read-only
+    (height, width, bytes per pixel) array, or None when the file can't be
+    mapped this way.
+    """
+    filename = getattr(im, "filename", None)
+    if not filename or not im.tile or "transparency" in im.info:
+        return None
+
+    strips = []
+    for tile in im.tile:
+        codec_name, extents, offset, args = tile[:4]
+        if codec_name != "raw":
+            return None
+        # raw decoder arguments are rawmode or (rawmode, stride, orientation)
+        if isinstance(args, str):
+            args = (args,)
+        rawmode, stride, orientation = (tuple(args) + (0, 1)[len(args) - 1 :])[:3]
+        if rawmode not in RawModes or abs(orientation) != 1:
+            return None
+        x_start, y_start, x_end, y_end = extents
+        if x_start != 0 or x_end != im.width:
+            return None
+
+        pixel_bytes = RawModes[rawmode][0]
+        stride = stride or im.width * pixel_bytes
+        height = y_end - y_start
+        rows = np.memmap(filename, np.uint8, "r", offset, (height, stride))
+        rows = rows[:, : im.width * pixel_bytes].reshape(height, im.width, pixel_bytes)
+        if orientation < 0:
+            rows = rows[::-1]
+        strips.append((y_start, rows))
+    return sorted(strips, key=lambda strip: strip[0])
+
+
+class TiledImage:
+    """
+    Source image read in strips of rows instead of being decoded at once.
+
+    Uncompressed files are memory-mapped, so only the strip being sampled is
+    paged in. JPEG files are decoded at a reduced resolution with Image.draft
+    when the grid is coarse enough. Other sources (PNG, compressed TIFF, JPEG
+    at full resolution) would be decoded whole, iter_bands raises ValueError
+    for them instead.
+    """
+
+    def __init__(self, path, strip_height=2048, max_pixels=LargeImagePixels) -> None:
+        self.im = open_large_image(path, max_pixels)
+        self.width = self.im.width
+        self.height = self.im.height
+        self.strip_height = strip_height
+        self.scale = 1
+
+    def draft(self, size_per_pixel):
+        """
+        Let the decoder reduce the image by the largest power of two (up to 8)
+        dividing size_per_pixel, so cells stay whole pixels. Returns the scale.
+        """
+        if self.im.format != "JPEG":
+            return self.scale
+
+        scale = 1
+        while scale * 2 <= MaximumDraftScale and size_per_pixel % (scale * 2) == 0:
+            scale *= 2
+        if scale > 1:
+            self.im.draft(
+                self.im.mode,
+                (math.ceil(self.width / scale), math.ceil(self.height / scale)),
+            )
+            # the decoder may pick a smaller power of two than asked for
+            while scale > 1 and math.ceil(self.width / scale) != self.im.width:
+                scale //= 2
+        self.scale = scale
+        return scale
+
+    def iter_bands(self, band_height):
+        """
+        Return an iterator over consecutive (rows, width, 3 or 4) uint8 bands of
+        band_height rows. Raises ValueError when the source can't be streamed.
+        """
+        raw_strips = get_raw_strips(self.im) if self.scale == 1 else None
+        if raw_strips is not None:
+            rawmode = self.im.tile[0][3]
+            rawmode = rawmode if isinstance(rawmode, str) else rawmode[0]
+            return self.iter_mapped_bands(raw_strips, rawmode, band_height)
+        if self.scale == 1:
+            raise ValueError(
+                f"tiled input can't read {self.im.format} data without decoding "
+                "it whole, use input_mode 'full'"
+            )
+        return self.iter_drafted_bands(band_height)
+
+    def iter_drafted_bands(self, band_height):
+        im = self.im
+        strip_height = max(self.strip_height // band_height, 1) * band_height
+        for y_start in range(0, im.height, strip_height):
+            strip = get_image_pixels(
+                im.crop((0, y_start, im.width, min(y_start + strip_height, im.height)))
+            )
+            for band_start in range(0, strip.shape[0], band_height):
+                yield strip[band_start : band_start + band_height]
+
+    def iter_mapped_bands(self, raw_strips, rawmode, band_height):
+        _, channels, alpha = RawModes[rawmode]
+        channels = list(channels) + ([alpha] if alpha is not None else [])
+        for y_start in range(0, self.height, band_height):
+            y_end = min(y_start + band_height, self.height)
+            parts = [
+                rows[max(y_start - strip_start, 0) : y_end - strip_start]
+                for strip_start, rows in raw_strips
+                if strip_start < y_end and strip_start + len(rows) > y_start
+            ]
+            band = np.concatenate(parts) if len(parts) > 1 else parts[0]
+            yield np.ascontiguousarray(band[..., channels])
+
+    def get_cell_bands(self, size_per_pixel):
+        """
+        Return (cell_size, bands): the cell size in decoded pixels and an iterator
+        over the bands of one cell row each.
+        """
+        cell_size = size_per_pixel // self.draft(size_per_pixel)
+        return cell_size, self.iter_bands(cell_size)
+
+    def get_average_rgb_grid(
+        self, size_per_pixel, regions_x, regions_y, alpha_aware=False
+    ):
+        """get_average_rgb_grid of the whole image, sampled strip by strip."""
+        cell_size, bands = self.get_cell_bands(size_per_pixel)
+        return get_average_rgb_grid_from_bands(
+            bands, cell_size, regions_x, regions_y, alpha_aware
+        )
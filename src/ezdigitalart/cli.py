@@ -1,21 +1,253 @@
-import imp
-import pathlib
+import argparse
+import concurrent.futures
+import contextlib
+import glob
+import io
+import json
 import os
-from artcore import PixelizeConverter
-from artcore import LineArtGenerator
+import pathlib
+import sys
+import time
+
+# the converter classes (and numpy, Pillow) are only imported when a
+# conversion runs
+from .artcore import Converters, create_converter
+
+ImageSuffixes = (".png", ".jpg", ".jpeg", ".bmp", ".gif", ".tif", ".tiff", ".webp")
+
+
+def get_pattern_root(pattern):
+    """The directory a glob pattern starts from, its parts before any wildcard."""
+    path = pathlib.Path(pattern)
+    root = []
+    for part in path.parts[:-1]:
+        if glob.has_magic(part):
+            break
+        root.append(part)
+    return pathlib.Path(*root) if root else pathlib.Path()
+
+
+def find_inputs(patterns):
+    """
+    Expand directories and glob patterns into a sorted list of (image path,
+    path relative to the directory or the pattern root) pairs.
+    """
+    result = {}
+    for pattern in patterns:
+        path = pathlib.Path(pattern)
+        if path.is_dir():
+            root = path
+            candidates = path.iterdir()
+        else:
+            root = get_pattern_root(pattern)
+            candidates = (pathlib.Path(p) for p in glob.glob(pattern, recursive=True))
+        for candidate in candidates:
+            if candidate.is_file() and candidate.suffix.lower() in ImageSuffixes:
+                result.setdefault(candidate, candidate.relative_to(root))
+    return sorted(result.items())
+
+
+def find_collisions(tasks):
+    """The output paths more than one input would write, with those inputs."""
+    sources = {}
+    for input_path, output_path, _ in tasks:
+        sources.setdefault(output_path, []).append(input_path)
+    return {path: inputs for path, inputs in sources.items() if len(inputs) > 1}
+
+
+def get_settings_path(output_path):
+    """Hidden file next to an SVG recording the settings it was converted with."""
+    return output_path.with_name(f".{output_path.name}.settings")
+
+
+def is_up_to_date(input_path, output_paths, settings):
+    """
+    Whether every output is newer than the input and the outputs were made
+    with the same settings (a JSON string, see get_settings_path).
+    """
+    input_time = input_path.stat().st_mtime
+    for output_path in output_paths:
+        if not output_path.exists() or output_path.stat().st_mtime < input_time:
+            return False
+    try:
+        return get_settings_path(output_paths[0]).read_text() == settings
+    except OSError:
+        return False
+
+
+def convert_file(
+    converter_name,
+    input_path,
+    output_path,
+    png_path,
+    cols,
+    rows,
+    geometry_cache=None,
+    input_mode="full",
+    result_cache=None,
+):
+    """
+    Run one conversion, returning (input_path, seconds, stage seconds, error
+    message). The stages are empty for converters without ConversionStats.
+    """
+    converter = create_converter(converter_name)
+    converter.collect_stats = True
+    converter.cols = cols
+    converter.rows = rows
+    converter.export_png_path = png_path
+    converter.input_mode = input_mode
+    if geometry_cache is not None:
+        converter.geometry_cache_dir = geometry_cache
+    if result_cache is not None:
+        converter.result_cache_dir = result_cache
+
+    start = time.perf_counter()
+    try:
+        # the converters report progress on stdout, keep batch output readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            stats = converter.convert(input_path, output_path)
+        stages = {}
+        # a result cache hit carries the timings of the run that filled it
+        if stats is not None and not stats.counters.get("result_cache_hits"):
+            stages = stats.stages
+        error = None
+    except Exception as ex:
+        stages = {}
+        error = f"{type(ex).__name__}: {ex}"
+    return input_path, time.perf_counter() - start, stages, error
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Convert images to pixelized or line art SVG/PNG files."
+    )
+    parser.add_argument("inputs", nargs="+", help="image files, directories or globs")
+    parser.add_argument("-o", "--output-dir", required=True, type=pathlib.Path)
+    parser.add_argument("-c", "--converter", choices=Converters, default="lineart")
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=os.cpu_count() or 1, help="worker processes"
+    )
+    parser.add_argument("--cols", type=int, default=32)
+    parser.add_argument("--rows", type=int, default=32)
+    parser.add_argument("--png", action="store_true", help="also export a PNG")
+    parser.add_argument(
+        "--tiled",
+        action="store_true",
+        help="read large uncompressed or JPEG images in strips instead of "
+        "decoding them at once",
+    )
+    parser.add_argument(
+        "--geometry-cache",
+        type=pathlib.Path,
+        help="directory caching the line art candidate geometry per grid",
+    )
+    parser.add_argument(
+        "--result-cache",
+        type=pathlib.Path,
+        help="directory caching outputs by image content and settings",
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="convert even if outputs are up to date"
+    )
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    inputs = find_inputs(args.inputs)
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+
+    # outputs mirror the relative input paths, a.png and a.jpg still collide
+    tasks = []
+    for input_path, relative in inputs:
+        output_path = args.output_dir / relative.with_suffix(".svg")
+        png_path = args.output_dir / relative.with_suffix(".png") if args.png else None
+        tasks.append((input_path, output_path, png_path))
+    collisions = find_collisions(tasks)
+    for output_path, sources in collisions.items():
+        names = ", ".join(str(path) for path in sources)
+        print(f"skipped, same output {output_path}: {names}", file=sys.stderr)
+
+    input_mode = "tiled" if args.tiled else "full"
+    settings = json.dumps(
+        {
+            "converter": args.converter,
+            "cols": args.cols,
+            "rows": args.rows,
+            "input_mode": input_mode,
+        },
+        sort_keys=True,
+    )
+    pending = []
+    skipped = 0
+    for input_path, output_path, png_path in tasks:
+        if output_path in collisions:
+            continue
+        outputs = [output_path] + ([png_path] if png_path else [])
+        if not args.force and is_up_to_date(input_path, outputs, settings):
+            skipped += 1
+        else:
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+            # a conversion that fails leaves its outputs marked as stale
+            with contextlib.suppress(FileNotFoundError):
+                get_settings_path(output_path).unlink()
+            pending.append((input_path, output_path, png_path))
+    scan_time = time.perf_counter() - start
 
+    start = time.perf_counter()
+    convert_times = []
+    stage_times = {}
+    failures = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max(args.jobs, 1)) as pool:
+        futures = {
+            pool.submit(
+                convert_file,
+                args.converter,
+                input_path,
+                output_path,
+                png_path,
+                args.cols,
+                args.rows,
+                args.geometry_cache if args.converter == "lineart" else None,
+                input_mode,
+                args.result_cache,
+            ): output_path
+            for input_path, output_path, png_path in pending
+        }
+        for future in concurrent.futures.as_completed(futures):
+            input_path, seconds, stages, error = future.result()
+            if error:
+                failures += 1
+                print(f"failed: {input_path}: {error}", file=sys.stderr)
+            else:
+                get_settings_path(futures[future]).write_text(settings)
+                convert_times.append(seconds)
+                for name, stage_seconds in stages.items():
+                    stage_times[name] = stage_times.get(name, 0.0) + stage_seconds
+    wall_time = time.perf_counter() - start
 
-def main():
-    print("Hello World!")
-    cwd = os.getcwd()
-    input_path = pathlib.Path(cwd, "data", "photo-test2.png")
-    output_path = pathlib.Path(cwd, "work", "outputtest7.svg")
+    converted = len(convert_times)
+    colliding = sum(len(sources) for sources in collisions.values())
+    print(
+        f"converted {converted}, skipped {skipped} up to date, "
+        f"{colliding} colliding, failed {failures} "
+        f"({args.converter}, {args.jobs} jobs)"
+    )
+    print(f"  scan:    {scan_time:8.3f} s")
+    print(f"  convert: {wall_time:8.3f} s wall", end="")
+    if converted:
+        print(
+            f", {sum(convert_times) / converted:.3f} s per image, "
+            f"{converted / wall_time:.2f} images/sec"
+        )
+    else:
+        print()
+    # summed over the worker processes, so they add up to more than the wall time
+    for name, seconds in stage_times.items():
+        print(
+            f"    {name + ':':<20} {seconds:8.3f} s, {seconds / converted:.3f} s per image"
+        )
 
-    # converter = PixelizeConverter()
-    converter = LineArtGenerator()
-    converter.export_png_path = pathlib.Path(cwd, "work", "outputtest7.png")
-    converter.convert(input_path, output_path)
+    return 1 if failures or colliding else 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,193 @@
+import asyncio
+import concurrent.futures
+import contextlib
+import io
+import multiprocessing
+import os
+import sys
+import time
+from .artcore import Converters, create_converter
+from .artcore.cancellation import ConversionCancelled
+
+# one cancel flag per in-flight request, shared with the executor workers
+worker_cancel_flags = None
+
+
+def initialize_worker(cancel_flags, quiet):
+    global worker_cancel_flags
+    worker_cancel_flags = cancel_flags
+    if quiet:
+        # worker processes drop the converters' progress output
+        sys.stdout = open(os.devnull, "w")
+
+
+class ConversionResult:
+    """Output of one conversion: SVG and PNG bytes (None when not asked for)."""
+
+    def __init__(self, svg, png, seconds) -> None:
+        self.svg = svg
+        self.png = png
+        self.seconds = seconds
+
+
+def run_conversion(converter_name, source, svg, png, options, slot, deadline):
+    """
+    Convert in-memory image data (bytes or a PIL image) in an executor worker.
+
+    The converter stops with ConversionCancelled once the request's cancel
+    flag is set or the deadline (a time.time() value) has passed.
+    """
+    converter = create_converter(converter_name)
+    for name, value in options.items():
+        if not hasattr(converter, name):
+            raise ValueError(f"unknown {converter_name} option: {name}")
+        setattr(converter, name, value)
+
+    def should_stop():
+        return bool(worker_cancel_flags[slot]) or (
+            deadline is not None and time.time() > deadline
+        )
+
+    if hasattr(converter, "should_stop"):
+        converter.should_stop = should_stop
+
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    svg_file = io.StringIO() if svg else None
+    png_file = io.BytesIO() if png else None
+    converter.export_png_path = png_file
+
+    start = time.perf_counter()
+    converter.convert(source, svg_file)
+    return ConversionResult(
+        svg_file.getvalue().encode("utf-8") if svg else None,
+        png_file.getvalue() if png else None,
+        time.perf_counter() - start,
+    )
+
+
+class ConversionService:
+    """
+    Run conversions for an asyncio application on a managed executor.
+
+    At most max_pending requests are handed to the executor at a time, later
+    callers of convert_async wait for a free place (backpressure). A request
+    that is cancelled or runs past its timeout returns right away and sets its
+    cancel flag, which the converters poll between steps; its place is only
+    released once the worker has stopped.
+
+    The converters only print progress with their debug option; worker
+    processes discard stdout.
+
+        async with ConversionService(workers=4) as service:
+            result = await service.convert_async(data, png=True, timeout=30)
+    """
+
+    def __init__(self, workers=None, max_pending=None, executor="process") -> None:
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or 2 * self.workers
+        self.executor_type = executor
+        self.executor = None
+        self.cancel_flags = None
+        self.free_slots = None
+        self.semaphore = None
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
+
+    def start(self):
+        if self.executor is not None:
+            return
+        self.cancel_flags = multiprocessing.Array("b", self.max_pending, lock=False)
+        self.free_slots = list(range(self.max_pending))
+        if self.executor_type == "process":
+            executor_class = concurrent.futures.ProcessPoolExecutor
+        elif self.executor_type == "thread":
+            executor_class = concurrent.futures.ThreadPoolExecutor
+        else:
+            raise ValueError(f"unknown executor: {self.executor_type}")
+        self.executor = executor_class(
+            max_workers=self.workers,
+            initializer=initialize_worker,
+            initargs=(self.cancel_flags, self.executor_type == "process"),
+        )
+
+    def close(self):
+        """Shut the executor down, blocking until running conversions finish."""
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    async def aclose(self):
+        """close for coroutines: waits for the shutdown off the event loop."""
+        executor = self.executor
+        if executor is not None:
+            self.executor = None
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, executor.shutdown, True)
+
+    async def convert_async(
+        self,
+        source,
+        converter="lineart",
+        svg=True,
+        png=False,
+        timeout=None,
+        **options,
+    ):
+        """
+        Convert source (image file bytes or a PIL image) and return a
+        ConversionResult. options are converter attributes such as cols, rows
+        or scheduler. Raises asyncio.TimeoutError when the request takes longer
+        than timeout seconds, including the time spent waiting for a place.
+        """
+        if converter not in Converters:
+            raise ValueError(f"unknown converter: {converter}")
+        self.start()
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_pending)
+
+        deadline = None if timeout is None else time.time() + timeout
+        loop = asyncio.get_running_loop()
+        await asyncio.wait_for(self.semaphore.acquire(), timeout)
+        slot = self.free_slots.pop()
+        self.cancel_flags[slot] = 0
+        try:
+            future = loop.run_in_executor(
+                self.executor,
+                run_conversion,
+                converter,
+                source,
+                svg,
+                png,
+                options,
+                slot,
+                deadline,
+            )
+        except BaseException:
+            self.release_slot(slot)
+            raise
+        # the place is only free again once the worker is idle
+        future.add_done_callback(lambda _: self.release_slot(slot, future))
+
+        remaining = None if deadline is None else max(deadline - time.time(), 0)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), remaining)
+        except ConversionCancelled:
+            # the worker saw the deadline first
+            raise asyncio.TimeoutError() from None
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            # answer now, the worker stops at its next check
+            self.cancel_flags[slot] = 1
+            raise
+
+    def release_slot(self, slot, future=None):
+        if future is not None and not future.cancelled():
+            # an abandoned request's error is not reported
+            future.exception()
+        self.free_slots.append(slot)
+        self.semaphore.release()
@@ -0,0 +1,77 @@
+import contextlib
+import io
+import numpy as np
+from PIL import Image, ImageDraw
+from ezdigitalart.artcore import LineArtGenerator
+from ezdigitalart.artcore.anytime import AnytimeLimits
+
+
+def create_image_data():
+    im = Image.new("RGB", (512, 512), "white")
+    draw = ImageDraw.Draw(im)
+    draw.ellipse((64, 64, 448, 448), fill=(40, 40, 40))
+    draw.rectangle((200, 100, 320, 400), fill=(180, 30, 30))
+    generator = LineArtGenerator()
+    image_data = generator.create_image_data()
+    with contextlib.redirect_stdout(io.StringIO()):
+        generator.prepare(image_data, im)
+        generator.converge(image_data)
+    return image_data
+
+
+def count_passes(image_data):
+    passes = np.zeros(image_data.cells.count, dtype=np.int64)
+    for line in image_data.lines:
+        cells = image_data.get_line_cells(line.line_index)
+        np.add.at(passes, cells[image_data.get_good_fits(cells, line.cell_index)], 1)
+    return passes
+
+
+def test_trim_takes_back_passes():
+    image_data = create_image_data()
+    assert len(image_data.lines) > 100
+    kept = image_data.lines[:100]
+    used = image_data.line_used.copy()
+    removed_owners = {line.cell_index for line in image_data.lines[100:]}
+
+    AnytimeLimits(max_lines=100).trim(image_data)
+
+    cells = image_data.cells
+    assert image_data.lines == kept
+    assert set(image_data.line_lookup) == {line.key for line in kept}
+    assert np.array_equal(cells.passes[: cells.count], count_passes(image_data))
+    assert image_data.line_used.sum() == 100
+    assert (used >= image_data.line_used).all()
+
+    # the cells that lost lines resume after the last line they still have
+    last_index = {line.cell_index: line.line_index for line in kept}
+    for cell_index in removed_owners:
+        assert cells.last_index[cell_index] == last_index.get(cell_index, -1)
+
+
+def test_max_lines_is_reported_in_stats():
+    im = Image.new("RGB", (256, 256), (40, 40, 40))
+    generator = LineArtGenerator()
+    generator.max_lines = 10
+    generator.collect_stats = True
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        stats = generator.convert(im)
+    assert stats.stopped_early == "max_lines"
+    assert stats.counters["lines_accepted"] >= 10
+    assert "budget" not in output.getvalue()
+
+
+def test_time_budget_starts_at_convergence():
+    im = Image.new("RGB", (256, 256), (40, 40, 40))
+    generator = LineArtGenerator()
+    generator.time_budget = 1e-6
+    generator.collect_stats = True
+    snapshots = []
+    generator.snapshot_callback = lambda image_data, number: snapshots.append(
+        len(image_data.lines)
+    )
+    generator.snapshot_lines = 1
+    stats = generator.convert(im)
+    assert stats.stopped_early == "time_budget"
+    assert stats.counters["lines_accepted"] > 0
+    assert snapshots and snapshots[0] > 0
@@ -0,0 +1,45 @@
+import contextlib
+import io
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+from ezdigitalart.artcore import LineArtGenerator
+
+
+def create_image():
+    im = Image.new("RGB", (320, 256), "white")
+    draw = ImageDraw.Draw(im)
+    draw.ellipse((32, 32, 288, 224), fill=(40, 40, 40))
+    draw.rectangle((120, 60, 200, 200), fill=(180, 30, 30))
+    return im
+
+
+def converge(batch_scoring, palette_size=None):
+    generator = LineArtGenerator()
+    generator.palette_size = palette_size
+    image_data = generator.create_image_data()
+    image_data.batch_scoring = batch_scoring
+    with contextlib.redirect_stdout(io.StringIO()):
+        generator.prepare(image_data, create_image())
+        generator.converge(image_data)
+    return image_data
+
+
+def get_lines(image_data):
+    return [
+        (line.key, line.p1, line.p2, line.ci, line.line_index, line.cell_index)
+        for line in image_data.lines
+    ]
+
+
+@pytest.mark.parametrize("palette_size", [None, 4])
+def test_batched_scoring_matches_per_cell_scoring(palette_size):
+    batched = converge(True, palette_size)
+    scalar = converge(False, palette_size)
+    assert len(batched.lines) > 0
+    assert get_lines(batched) == get_lines(scalar)
+    count = batched.cells.count
+    assert np.array_equal(batched.cells.passes[:count], scalar.cells.passes[:count])
+    assert np.array_equal(
+        batched.cells.last_index[:count], scalar.cells.last_index[:count]
+    )
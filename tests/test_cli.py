@@ -0,0 +1,55 @@
+import contextlib
+import io
+from PIL import Image
+from ezdigitalart.cli import get_settings_path, main
+
+
+def run(*argv):
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+        code = main(list(argv))
+    return code, output.getvalue()
+
+
+def create_inputs(directory, names):
+    for name in names:
+        path = directory / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        Image.new("RGB", (64, 64), (90, 20, 20)).save(path)
+
+
+def test_inputs_mirror_their_directories(tmp_path):
+    create_inputs(tmp_path / "in", ["a/x.png", "b/x.png"])
+    code, _ = run(
+        str(tmp_path / "in" / "**" / "*.png"),
+        "-o",
+        str(tmp_path / "out"),
+        "-c",
+        "pixelize",
+        "-j",
+        "1",
+    )
+    assert code == 0
+    assert (tmp_path / "out" / "a" / "x.svg").exists()
+    assert (tmp_path / "out" / "b" / "x.svg").exists()
+
+
+def test_colliding_inputs_are_skipped(tmp_path):
+    create_inputs(tmp_path / "in", ["x.png", "x.jpg", "y.png"])
+    code, output = run(
+        str(tmp_path / "in"), "-o", str(tmp_path / "out"), "-c", "pixelize", "-j", "1"
+    )
+    assert code == 1
+    assert "converted 1," in output and "2 colliding" in output
+    assert (tmp_path / "out" / "y.svg").exists()
+    assert not (tmp_path / "out" / "x.svg").exists()
+
+
+def test_changed_settings_are_not_up_to_date(tmp_path):
+    create_inputs(tmp_path / "in", ["x.png"])
+    argv = [str(tmp_path / "in"), "-o", str(tmp_path / "out"), "-j", "1"]
+    assert "converted 1," in run(*argv, "-c", "pixelize")[1]
+    assert "skipped 1 up to date" in run(*argv, "-c", "pixelize")[1]
+    assert "converted 1," in run(*argv, "-c", "pixelize", "--cols", "8")[1]
+    assert "converted 1," in run(*argv, "--cols", "8")[1]
+    assert "lineart" in get_settings_path(tmp_path / "out" / "x.svg").read_text()
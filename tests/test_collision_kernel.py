@@ -0,0 +1,36 @@
+import contextlib
+import io
+import numpy as np
+from PIL import Image, ImageDraw
+from ezdigitalart.artcore import LineArtGenerator
+
+
+def prepare(vectorized_collisions):
+    im = Image.new("RGB", (300, 236), "white")
+    ImageDraw.Draw(im).ellipse((40, 30, 260, 200), fill=(60, 90, 160))
+    generator = LineArtGenerator()
+    image_data = generator.create_image_data()
+    image_data.vectorized_collisions = vectorized_collisions
+    with contextlib.redirect_stdout(io.StringIO()):
+        generator.prepare(image_data, im)
+    return image_data
+
+
+def test_kernel_matches_the_scalar_collision_tests():
+    vectorized = prepare(True)
+    scalar = prepare(False)
+    for name in (
+        "line_cell_indptr",
+        "line_cell_indices",
+        "cell_line_indptr",
+        "cell_line_indices",
+    ):
+        assert np.array_equal(getattr(vectorized, name), getattr(scalar, name)), name
+
+    assert len(vectorized.line_cell_indices) > 0
+    pairs = vectorized.endpoint_combinations
+    for line_index in range(0, len(pairs), 7):
+        p1, p2 = pairs[line_index]
+        expected = scalar.get_intersecting_cells(p1.location, p2.location)
+        cells = vectorized.get_intersecting_cells(p1.location, p2.location)
+        assert [cell.index for cell in cells] == [cell.index for cell in expected]
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+from ezdigitalart.artcore.endpoint_pairs import EndpointPairs, get_bin_quotas
+from ezdigitalart.artcore.image_data import ImageData
+
+
+def create_endpoints(columns, rows, size=10):
+    image_data = ImageData()
+    for x in range(columns + 1):
+        for y in range(rows + 1):
+            edges = (x == 0, x >= columns, y == 0, y >= rows)
+            if any(edges):
+                image_data.add_endpoint(x, y, (x * size, y * size), *edges)
+    return image_data.endpoints
+
+
+def test_bin_quotas_add_up_to_the_total():
+    counts = np.array([3, 100, 0, 40, 7])
+    quotas = get_bin_quotas(counts, 60)
+    assert quotas.sum() == 60
+    assert (quotas <= counts).all()
+    assert list(quotas[[0, 2, 4]]) == [3, 0, 7]
+    assert get_bin_quotas(counts, 1000).tolist() == counts.tolist()
+
+
+@pytest.mark.parametrize("angle_bins", [1, 3, 7, 16])
+@pytest.mark.parametrize("max_candidates", [1, 50, 999, 5000])
+def test_max_candidates_is_exact(angle_bins, max_candidates):
+    endpoints = create_endpoints(12, 9)
+    total = len(EndpointPairs(endpoints))
+    pairs = EndpointPairs(
+        endpoints, max_candidates=max_candidates, angle_bins=angle_bins
+    )
+    assert len(pairs) == min(max_candidates, total)
+    assert len(np.unique(pairs.ranks)) == len(pairs)
+    assert (np.diff(pairs.ranks) > 0).all()
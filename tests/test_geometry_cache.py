@@ -0,0 +1,51 @@
+import contextlib
+import io
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+from ezdigitalart.artcore import LineArtGenerator
+
+IncidenceArrays = (
+    "line_cell_indptr",
+    "line_cell_indices",
+    "cell_line_indptr",
+    "cell_line_indices",
+)
+
+
+def converge(geometry_cache_dir, max_candidates):
+    im = Image.new("RGB", (288, 224), "white")
+    ImageDraw.Draw(im).ellipse((30, 20, 250, 200), fill=(120, 40, 60))
+    generator = LineArtGenerator()
+    generator.geometry_cache_dir = geometry_cache_dir
+    generator.max_candidates = max_candidates
+    image_data = generator.create_image_data()
+    with contextlib.redirect_stdout(io.StringIO()):
+        generator.prepare(image_data, im)
+        generator.converge(image_data)
+    return image_data
+
+
+def get_lines(image_data):
+    return [(line.key, line.line_index, line.cell_index) for line in image_data.lines]
+
+
+def get_pairs(image_data):
+    pairs = image_data.endpoint_combinations
+    return np.stack(pairs.get_pair_indices(np.arange(len(pairs))))
+
+
+@pytest.mark.parametrize("max_candidates", [None, 500])
+def test_cached_geometry_matches_a_fresh_build(tmp_path, max_candidates):
+    fresh = converge(None, max_candidates)
+    built = converge(tmp_path, max_candidates)
+    loaded = converge(tmp_path, max_candidates)
+    assert len(list(tmp_path.iterdir())) == 1
+    assert loaded.geometry_path is not None
+
+    assert len(fresh.lines) > 0
+    for image_data in (built, loaded):
+        for name in IncidenceArrays:
+            assert np.array_equal(getattr(image_data, name), getattr(fresh, name))
+        assert np.array_equal(get_pairs(image_data), get_pairs(fresh))
+        assert get_lines(image_data) == get_lines(fresh)
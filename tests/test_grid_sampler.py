@@ -0,0 +1,68 @@
+import math
+import numpy as np
+from PIL import Image
+from ezdigitalart.artcore.grid_sampler import get_average_rgb_grid, get_image_pixels
+
+
+def get_average_rgb_square(pxa, image_width, image_height, x_start, y_start, width):
+    # the per pixel loop the converters sampled cells with before the grid sampler
+    num = 0
+    r = 0
+    g = 0
+    b = 0
+    transparent_count = 0
+    for x_offset in range(width):
+        for y_offset in range(width):
+            x = x_start + x_offset
+            y = y_start + y_offset
+            if x >= 0 and x < image_width and y >= 0 and y < image_height:
+                ci = pxa[x, y]
+                a = ci[3]
+                if a == 0:
+                    transparent_count += 1
+                if transparent_count >= width:
+                    return (0, 0, 0, 0)
+                if a > 0:
+                    num += 1
+                    r += ci[0] * ci[0]
+                    g += ci[1] * ci[1]
+                    b += ci[2] * ci[2]
+    if num:
+        return (math.sqrt(r / num), math.sqrt(g / num), math.sqrt(b / num), 255)
+    return None
+
+
+def create_image():
+    rng = np.random.default_rng(1)
+    pixels = rng.integers(0, 256, (45, 53, 4), dtype=np.uint8)
+    pixels[..., 3] = 255
+    pixels[:10, :20, 3] = 0
+    pixels[30:, 40:, 3] = rng.integers(0, 2, (15, 13)) * 255
+    return Image.fromarray(pixels, "RGBA")
+
+
+def test_grid_matches_the_per_pixel_loop():
+    im = create_image()
+    size_per_pixel = 8
+    regions_x = math.ceil(im.width / size_per_pixel)
+    regions_y = math.ceil(im.height / size_per_pixel)
+    grid = get_average_rgb_grid(
+        get_image_pixels(im), size_per_pixel, regions_x, regions_y, alpha_aware=True
+    )
+
+    pxa = im.load()
+    for x in range(regions_x):
+        for y in range(regions_y):
+            expected = get_average_rgb_square(
+                pxa,
+                im.width,
+                im.height,
+                x * size_per_pixel,
+                y * size_per_pixel,
+                size_per_pixel,
+            )
+            color = grid.get_color(x, y)
+            if expected is None or color is None:
+                assert color == expected
+            else:
+                assert np.allclose(color, expected, rtol=0, atol=1e-9)
@@ -0,0 +1,24 @@
+import importlib.util
+import pathlib
+
+BenchPath = (
+    pathlib.Path(__file__).resolve().parents[1] / "benchmarks" / "bench_artcore.py"
+)
+
+# loose, only catches an import that starts doing real work again
+ImportBudget = 10.0
+
+
+def load_bench():
+    spec = importlib.util.spec_from_file_location("bench_artcore", BenchPath)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_imports_stay_light():
+    bench = load_bench()
+    imports = bench.measure_imports(1)
+    assert [entry["statement"] for entry in imports] == list(bench.ImportChecks)
+    assert all(not entry["heavy_modules"] for entry in imports)
+    assert bench.check_imports(imports, ImportBudget) == []
@@ -0,0 +1,50 @@
+import contextlib
+import io
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+from ezdigitalart.artcore import LineArtGenerator
+from ezdigitalart.artcore.line_export import get_line_array, load_lines, save_lines
+
+
+def create_image(fill):
+    im = Image.new("RGB", (240, 208), "white")
+    if fill is not None:
+        draw = ImageDraw.Draw(im)
+        draw.ellipse((20, 20, 220, 190), fill=fill)
+        draw.rectangle((90, 10, 140, 200), fill=(20, 120, 40))
+    return im
+
+
+@pytest.mark.parametrize("fill", [(150, 30, 50), None])
+def test_export_renders_the_same_svg_and_png(tmp_path, fill):
+    generator = LineArtGenerator()
+    generator.export_lines_path = tmp_path / "lines"
+    generator.export_png_path = tmp_path / "original.png"
+    with contextlib.redirect_stdout(io.StringIO()):
+        generator.convert(create_image(fill), tmp_path / "original.svg")
+
+    LineArtGenerator().render_export(
+        tmp_path / "lines", tmp_path / "again.svg", tmp_path / "again.png"
+    )
+    for name in ("svg", "png"):
+        original = (tmp_path / f"original.{name}").read_bytes()
+        assert (tmp_path / f"again.{name}").read_bytes() == original
+
+
+def test_export_keeps_the_lines(tmp_path):
+    generator = LineArtGenerator()
+    image_data = generator.create_image_data()
+    with contextlib.redirect_stdout(io.StringIO()):
+        generator.prepare(image_data, create_image((150, 30, 50)))
+        generator.converge(image_data)
+    save_lines(image_data, tmp_path / "lines")
+    drawing = load_lines(tmp_path / "lines")
+    assert len(drawing) == len(image_data.lines) > 0
+    assert np.array_equal(drawing.line_array, get_line_array(image_data))
+    for line, loaded in zip(image_data.lines, drawing.lines):
+        assert (loaded.key, loaded.p1, loaded.p2) == (line.key, line.p1, line.p2)
+        assert (loaded.line_index, loaded.cell_index) == (
+            line.line_index,
+            line.cell_index,
+        )
@@ -0,0 +1,44 @@
+import numpy as np
+from PIL import Image, ImageDraw
+from ezdigitalart.artcore import LineArtGenerator
+from ezdigitalart.artcore.image_data import WhiteThreshold
+from ezdigitalart.artcore.palette import apply_palette
+
+
+def create_image():
+    im = Image.new("RGB", (256, 256), "white")
+    draw = ImageDraw.Draw(im)
+    for i in range(16):
+        # grays on both sides of WhiteThreshold
+        draw.rectangle((i * 16, 0, i * 16 + 15, 255), fill=(200 + i * 3,) * 3)
+    draw.ellipse((40, 40, 200, 200), fill=(60, 20, 90))
+    return im
+
+
+def test_passes_follow_the_palette_color():
+    generator = LineArtGenerator()
+    image_data = generator.create_image_data()
+    generator.sample(image_data, create_image())
+    apply_palette(image_data, 3)
+
+    cells = image_data.cells
+    count = cells.count
+    white = cells.lab[:count, 0] > WhiteThreshold
+    assert (cells.desired_passes[:count][white] == 0).all()
+    expected = np.round((1.0 - cells.luminance[:count]) * image_data.passes_scaler)
+    assert np.array_equal(cells.desired_passes[:count][~white], expected[~white])
+    assert np.array_equal(
+        cells.maximum_passes[:count], cells.desired_passes[:count] * 2 + 4
+    )
+
+
+def test_palette_export_renders_the_same_svg(tmp_path):
+    generator = LineArtGenerator()
+    generator.palette_size = 4
+    generator.export_lines_path = tmp_path / "lines"
+    generator.convert(create_image(), tmp_path / "original.svg")
+
+    LineArtGenerator().render_export(tmp_path / "lines", tmp_path / "again.svg")
+    original = (tmp_path / "original.svg").read_bytes()
+    assert b"<g " in original
+    assert (tmp_path / "again.svg").read_bytes() == original
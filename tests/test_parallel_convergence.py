@@ -0,0 +1,55 @@
+import numpy as np
+from PIL import Image, ImageDraw
+from ezdigitalart.artcore import LineArtGenerator
+from ezdigitalart.artcore.parallel_convergence import get_passes_before
+
+
+def create_image():
+    im = Image.new("RGB", (384, 384), "white")
+    draw = ImageDraw.Draw(im)
+    draw.ellipse((48, 48, 336, 336), fill=(40, 40, 40))
+    draw.rectangle((150, 70, 240, 300), fill=(180, 30, 30))
+    return im
+
+
+def converge(workers):
+    generator = LineArtGenerator()
+    generator.cols = generator.rows = 24
+    generator.workers = workers
+    image_data = generator.create_image_data()
+    generator.prepare(image_data, create_image())
+    generator.run_scheduler(image_data)
+    return image_data
+
+
+def count_passes(image_data):
+    passes = np.zeros(image_data.cells.count, dtype=np.int64)
+    for line in image_data.lines:
+        cells = image_data.get_line_cells(line.line_index)
+        np.add.at(passes, cells[image_data.get_good_fits(cells, line.cell_index)], 1)
+    return passes
+
+
+def test_passes_before_counts_earlier_proposals():
+    cells = np.array([3, 1, 3, 3, 1])
+    proposal_of = np.array([0, 0, 1, 2, 2])
+    adds = np.array([1, 1, 0, 1, 1])
+    assert get_passes_before(cells, proposal_of, adds).tolist() == [0, 0, 1, 1, 1]
+
+
+def test_same_worker_count_gives_same_lines():
+    first = converge(2)
+    second = converge(2)
+    assert [line.line_index for line in first.lines] == [
+        line.line_index for line in second.lines
+    ]
+    assert len(first.lines) > 0
+
+
+def test_replayed_lines_keep_passes_consistent():
+    image_data = converge(2)
+    cells = image_data.cells
+    count = cells.count
+    assert np.array_equal(count_passes(image_data), cells.passes[:count])
+    used = np.nonzero(image_data.line_used)[0]
+    assert sorted(used.tolist()) == sorted(line.line_index for line in image_data.lines)
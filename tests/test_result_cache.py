@@ -0,0 +1,54 @@
+import contextlib
+import io
+from PIL import Image, ImageDraw
+from ezdigitalart.artcore import LineArtGenerator, PixelizeConverter
+
+
+def create_image():
+    im = Image.new("RGB", (224, 192), "white")
+    ImageDraw.Draw(im).ellipse((20, 20, 200, 170), fill=(70, 30, 110))
+    return im
+
+
+def convert(converter, directory, name, **settings):
+    for setting, value in settings.items():
+        setattr(converter, setting, value)
+    converter.export_png_path = directory / f"{name}.png"
+    output_path = directory / f"{name}.svg"
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = converter.convert(create_image(), output_path)
+    return result, output_path.read_bytes(), converter.export_png_path.read_bytes()
+
+
+def test_cached_outputs_match_uncached_outputs(tmp_path):
+    for converter_type in (LineArtGenerator, PixelizeConverter):
+        _, svg, png = convert(converter_type(), tmp_path, "uncached")
+        cache_dir = tmp_path / "cache"
+        for name in ("miss", "hit"):
+            result, cached_svg, cached_png = convert(
+                converter_type(), tmp_path, name, result_cache_dir=cache_dir
+            )
+            assert result is None
+            assert cached_svg == svg
+            assert cached_png == png
+
+
+def test_hit_returns_stats_only_when_collected(tmp_path):
+    cache_dir = tmp_path / "cache"
+    generator = LineArtGenerator()
+    generator.result_cache_dir = cache_dir
+    _, svg, _ = convert(generator, tmp_path, "plain")
+
+    # the entry holds no stats yet, a caller wanting them converts again
+    stats, stats_svg, _ = convert(generator, tmp_path, "miss", collect_stats=True)
+    assert stats.counters.get("result_cache_hits", 0) == 0
+    assert stats_svg == svg
+
+    hit, hit_svg, _ = convert(generator, tmp_path, "hit")
+    assert hit.counters["result_cache_hits"] == 1
+    assert hit.counters["lines_accepted"] == stats.counters["lines_accepted"]
+    assert hit_svg == svg
+
+    generator.collect_stats = False
+    assert convert(generator, tmp_path, "plain_hit")[0] is None
+    assert len(list(cache_dir.iterdir())) == 1
@@ -0,0 +1,31 @@
+import asyncio
+import io
+import time
+import pytest
+from PIL import Image, ImageDraw
+from ezdigitalart.service import ConversionService
+
+
+def create_source():
+    im = Image.new("RGB", (2048, 2048), "white")
+    ImageDraw.Draw(im).ellipse((200, 200, 1800, 1800), fill=(30, 30, 30))
+    data = io.BytesIO()
+    im.save(data, format="PNG")
+    return data.getvalue()
+
+
+def test_timeout_returns_at_the_deadline():
+    async def run():
+        async with ConversionService(workers=1, max_pending=1, executor="thread") as s:
+            start = time.perf_counter()
+            with pytest.raises(asyncio.TimeoutError):
+                await s.convert_async(source, cols=96, rows=96, timeout=0.2)
+            waited = time.perf_counter() - start
+            # the place comes back once the worker has stopped
+            result = await s.convert_async(source, converter="pixelize", cols=8)
+        return waited, result
+
+    source = create_source()
+    waited, result = asyncio.run(run())
+    assert waited < 0.5
+    assert result.svg.startswith(b"<")
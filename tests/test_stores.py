@@ -0,0 +1,101 @@
+import itertools
+import pytest
+from ezdigitalart.artcore.image_cell import CellList, CellStore, ImageCell
+from ezdigitalart.artcore.image_point import EndpointList, EndpointStore, ImagePoint
+
+
+def test_cell_from_values_keeps_the_values():
+    cell = ImageCell.from_values(
+        "3_5",
+        (3, 5),
+        (96, 160),
+        (32, 32),
+        (10.5, 20.25, 30.0),
+        0.25,
+        7,
+        (40.0, 5.5, -3.25),
+        False,
+    )
+    assert cell.key == "3_5"
+    assert cell.cell_indices == (3, 5)
+    assert cell.source_location == (96, 160)
+    assert cell.source_size == (32, 32)
+    assert cell.ci == (10.5, 20.25, 30.0)
+    assert cell.luminance == 0.25
+    assert cell.lab == (40.0, 5.5, -3.25)
+    assert cell.desired_passes == 7
+    assert cell.maximum_passes == 7 * 2 + 4
+    assert cell.passes == 0
+    assert cell.last_index == -1
+    assert not cell.is_transparent
+
+    transparent = ImageCell.from_values(
+        "0_0", (0, 0), (0, 0), (32, 32), (0, 0, 0, 0), 0.0, 0, (0, 0, 0), True
+    )
+    assert transparent.ci == (0, 0, 0, 0)
+    assert transparent.maximum_passes == 100
+
+
+def test_cell_views_share_the_store():
+    store = CellStore(2)
+    for column, row in itertools.product(range(3), range(2)):
+        store.append(
+            column,
+            row,
+            (column * 32, row * 32),
+            (32, 32),
+            (column, row, 0),
+            0.5,
+            column + row,
+            (50.0, 0.0, 0.0),
+            False,
+        )
+    cells = CellList(store)
+    assert len(cells) == 6
+    assert store.find(2, 1) == 5
+    assert store.find(3, 0) == -1
+
+    cell = cells[store.find(1, 1)]
+    assert cell.cell_indices == (1, 1)
+    assert cell.ci == (1, 1, 0)
+    cell.passes = 4
+    cell.last_index = 12
+    assert store.passes[cell.index] == 4
+    assert cells[cell.index].last_index == 12
+    assert cells[-1] == cells[5]
+    assert cells[1:3] == [cells[1], cells[2]]
+    assert [c.key for c in cells] == [
+        f"{column}_{row}" for column, row in itertools.product(range(3), range(2))
+    ]
+    with pytest.raises(IndexError):
+        cells[6]
+
+
+def test_points_match_the_value_objects():
+    store = EndpointStore(1)
+    edges = list(itertools.product([False, True], repeat=4))
+    for index, flags in enumerate(edges):
+        store.append(index, index + 1, (index * 10, index * 20), *flags)
+    points = EndpointList(store)
+    assert len(points) == len(edges)
+
+    for point, flags in zip(points, edges):
+        copy = ImagePoint.from_values(
+            point.x_index, point.y_index, point.location, *flags
+        )
+        assert (
+            point.left_edge,
+            point.right_edge,
+            point.top_edge,
+            point.bottom_edge,
+        ) == flags
+        assert copy.location == point.location
+        assert copy.unique_id() == point.unique_id()
+
+    for point, other in itertools.product(points, repeat=2):
+        shared = any(a and b for a, b in zip(edges[point.index], edges[other.index]))
+        assert point.allow_line(other) == (not shared)
+        assert point.line_id(other) == (
+            f"{point.x_index}_{point.y_index}_{other.x_index}_{other.y_index}"
+        )
+    assert not points[0].allow_line(None)
@@ -0,0 +1,46 @@
+import contextlib
+import gzip
+import io
+import pytest
+from PIL import Image, ImageDraw
+from ezdigitalart.artcore import LineArtGenerator, PixelizeConverter
+
+
+def create_image():
+    im = Image.new("RGB", (256, 192), "white")
+    draw = ImageDraw.Draw(im)
+    draw.ellipse((20, 20, 236, 172), fill=(30, 60, 120))
+    draw.rectangle((100, 40, 150, 150), fill=(200, 160, 20))
+    return im
+
+
+def write(converter, backend, path):
+    converter.svg_backend = backend
+    with contextlib.redirect_stdout(io.StringIO()):
+        converter.convert(create_image(), str(path))
+    return path.read_bytes()
+
+
+@pytest.mark.parametrize("palette_size", [None, 4])
+def test_stream_writer_matches_svgwrite(tmp_path, palette_size):
+    generator = LineArtGenerator()
+    generator.palette_size = palette_size
+    streamed = write(generator, "stream", tmp_path / "stream.svg")
+    built = write(generator, "svgwrite", tmp_path / "svgwrite.svg")
+    assert b"<line" in streamed
+    assert streamed == built
+
+
+def test_stream_writer_matches_svgwrite_for_pixelize(tmp_path):
+    converter = PixelizeConverter()
+    streamed = write(converter, "stream", tmp_path / "stream.svg")
+    built = write(converter, "svgwrite", tmp_path / "svgwrite.svg")
+    assert streamed == built
+
+
+def test_compressed_output_holds_the_same_svg(tmp_path):
+    generator = LineArtGenerator()
+    plain = write(generator, "stream", tmp_path / "plain.svg")
+    for backend in ("stream", "svgwrite"):
+        path = tmp_path / f"{backend}.svgz"
+        assert gzip.decompress(write(generator, backend, path)) == plain
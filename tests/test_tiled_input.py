@@ -0,0 +1,67 @@
+import contextlib
+import io
+import numpy as np
+import pytest
+from PIL import Image
+from ezdigitalart.artcore import LineArtGenerator
+from ezdigitalart.artcore.grid_sampler import get_average_rgb_grid, get_image_pixels
+from ezdigitalart.artcore.tiled_input import TiledImage, get_raw_strips
+
+# (file name, mode, save options) of uncompressed sources tiled input maps
+RawSources = [
+    ("rgb.bmp", "RGB", {}),
+    # Pillow stores RGBA as 32 bit BMP without alpha
+    ("rgbx.bmp", "RGBA", {}),
+    ("rgb.ppm", "RGB", {}),
+    ("gray.pgm", "L", {}),
+    ("rgb.tif", "RGB", {"compression": "raw"}),
+    ("strips.tif", "RGB", {"compression": "raw", "tiffinfo": {278: 13}}),
+    ("rgba.tif", "RGBA", {"compression": "raw"}),
+]
+
+
+def create_source(directory, name, mode, options):
+    rng = np.random.default_rng(len(name))
+    # sizes that are not a multiple of the cell size or the strip height
+    pixels = rng.integers(0, 256, (157, 203, len(mode)), dtype=np.uint8)
+    path = directory / name
+    Image.fromarray(pixels.squeeze(), mode).save(path, **options)
+    return path
+
+
+@pytest.mark.parametrize("name,mode,options", RawSources)
+def test_tiled_grid_matches_the_full_grid(tmp_path, name, mode, options):
+    path = create_source(tmp_path, name, mode, options)
+    alpha_aware = mode == "RGBA"
+    size_per_pixel = 12
+    regions_x = -(-203 // size_per_pixel)
+    regions_y = -(-157 // size_per_pixel)
+
+    tiled = TiledImage(path, strip_height=40)
+    strips = get_raw_strips(tiled.im)
+    assert strips is not None
+    if name == "strips.tif":
+        assert len(strips) == 13
+    grid = tiled.get_average_rgb_grid(size_per_pixel, regions_x, regions_y, alpha_aware)
+    with Image.open(path) as im:
+        expected = get_average_rgb_grid(
+            get_image_pixels(im), size_per_pixel, regions_x, regions_y, alpha_aware
+        )
+
+    assert np.array_equal(grid.valid, expected.valid)
+    assert np.array_equal(grid.transparent, expected.transparent)
+    assert np.array_equal(grid.colors, expected.colors)
+
+
+def test_tiled_conversion_matches_full_conversion(tmp_path):
+    path = create_source(tmp_path, "rgb.bmp", "RGB", {})
+    outputs = []
+    for input_mode in ("full", "tiled"):
+        generator = LineArtGenerator()
+        generator.input_mode = input_mode
+        generator.strip_height = 40
+        output_path = tmp_path / f"{input_mode}.svg"
+        with contextlib.redirect_stdout(io.StringIO()):
+            generator.convert(str(path), str(output_path))
+        outputs.append(output_path.read_bytes())
+    assert outputs[0] == outputs[1]